@@ -0,0 +1,101 @@
+import os
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "langdeath.settings")
+    import django
+    django.setup()
+
+import random
+import time
+from argparse import ArgumentParser
+from collections import defaultdict
+
+from django.db import transaction
+
+from ld.lang_db import LanguageDB
+from ld.memory_lang_db import MemoryLanguageDB
+
+
+def sample_records(count, seed):
+    """Records of two parsers about @count made up languages: the first one
+    adds them (sil, name, codes, alternative names), the second one finds
+    them by code, name and alternative name, or not at all"""
+    random.seed(seed)
+    added, found = [], []
+    for i in xrange(count):
+        name = u'Benchmark language {0}'.format(i)
+        added.append({'sil': u'bench{0}'.format(i), 'name': name,
+                      'other_codes': {'benchmark': i},
+                      'alt_names': [name + u' dialect', u'Bench {0}'.format(i)],
+                      'eth_population': i})
+        found.append(random.choice([
+            {'other_codes': {'benchmark': i}, 'eth_population': i + 1},
+            {'name': name, 'alt_names': [u'Other {0}'.format(i)]},
+            {'name': u'{0}, bench'.format(i)},
+            {'name': u'Unknown {0}'.format(i)}]))
+    return added, found
+
+
+def merge(lang_db, added, found):
+    """Merges the records as ParserAggregator.add_lang does; returns the
+    match statistics"""
+    stats = defaultdict(int)
+    lang_db.set_contributor('Benchmark')
+    for lang in lang_db.resolve_batches(added):
+        lang_db.add_new_language(lang)
+        stats['new'] += 1
+    for lang in lang_db.resolve_batches(found):
+        if '_match' in lang and not lang_db.is_stale(lang):
+            candidates = lang_db.get_languages(lang['_match'][0])
+            clue = lang['_match'][1]
+        else:
+            candidates, clue = lang_db.get_closest(lang)
+        if len(candidates) == 0:
+            stats['not_added'] += 1
+            continue
+        stats[clue] += 1
+        for l in lang_db.choose_candidates(lang, candidates) \
+                if len(candidates) > 1 else candidates:
+            lang_db.update_lang_data(l, lang)
+    lang_db.set_contributor(None)
+    return dict(stats)
+
+
+def benchmark(lang_db, records):
+    start = time.time()
+    stats = merge(lang_db, *[[dict(lang) for lang in r] for r in records])
+    return stats, time.time() - start
+
+
+def get_args():
+    parser = ArgumentParser(description='Compares the merge rate of a dry ' +\
+                            'run (MemoryLanguageDB) to the one of the ' +\
+                            'database (LanguageDB, rolled back afterwards), ' +\
+                            'and checks that both match the records the ' +\
+                            'same way')
+    parser.add_argument('-n', '--languages', type=int, default=2000,
+                        help='number of made up languages merged')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    records = sample_records(args.languages, args.seed)
+    memory_stats, memory_time = benchmark(MemoryLanguageDB(), records)
+    with transaction.atomic():
+        db_stats, db_time = benchmark(LanguageDB(), records)
+        transaction.set_rollback(True)
+    for name, seconds in [('database', db_time), ('dry run', memory_time)]:
+        print '{0}: {1} records in {2:.2f}s, {3:.0f} records/s'.format(
+            name, 2 * args.languages, seconds,
+            2 * args.languages / max(seconds, 1e-6))
+    print 'speedup: {0:.1f}x'.format(db_time / max(memory_time, 1e-6))
+    if memory_stats != db_stats:
+        print 'different match statistics: {0} (database) {1} ' \
+            '(dry run)'.format(db_stats, memory_stats)
+    else:
+        print 'same match statistics: {0}'.format(db_stats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import os
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "langdeath.settings")
+
+import cPickle
+import random
+import time
+from argparse import ArgumentParser
+
+from dld.models import Language
+
+from ld.lang_db import LanguageDB
+
+
+def sample_records(count, seed):
+    """Lookups of the kinds parsers make, for @count random languages of
+    the database: by sil, by each code, by name, by alternative name, and
+    by a name that is not in the database"""
+    random.seed(seed)
+    ids = list(Language.objects.values_list('id', flat=True))
+    records = []
+    for lang in Language.objects.filter(
+            id__in=random.sample(ids, min(count, len(ids)))):
+        records.append({'sil': lang.sil})
+        for code in lang.code.all():
+            records.append({'other_codes': {code.code_name: code.code}})
+        records.append({'name': lang.name})
+        for alt_name in lang.alt_name.all():
+            records.append({'name': alt_name.name.title()})
+        records.append({'name': lang.name + ' no such language'})
+    return records
+
+
+def load_records(fn):
+    """Records of a parser pickle, without their sils, so that they are
+    looked up by codes and names"""
+    records = []
+    with open(fn, 'rb') as f:
+        for lang in cPickle.load(f):
+            records.append(dict((k, v) for k, v in lang.iteritems()
+                                if k in ['other_codes', 'name']))
+    return records
+
+
+def benchmark(lookup, records):
+    start = time.time()
+    results = []
+    for lang in records:
+        languages, clue = lookup(lang)
+        results.append((sorted(l.pk for l in languages), clue))
+    return results, time.time() - start
+
+
+def get_args():
+    parser = ArgumentParser(description='Compares the lookup rate of ' +\
+                            'LanguageDB.get_closest (in-memory index) to ' +\
+                            'the database queries it replaced, and checks ' +\
+                            'that they find the same languages')
+    parser.add_argument('-n', '--languages', type=int, default=1000,
+                        help='number of random languages looked up (by ' +\
+                        'sil, codes and names)')
+    parser.add_argument('-p', '--pickle',
+                        help='look up the records of this parser pickle ' +\
+                        'instead of random languages')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    if args.pickle is not None:
+        records = load_records(args.pickle)
+    else:
+        records = sample_records(args.languages, args.seed)
+    lang_db = LanguageDB()
+    start = time.time()
+    lang_db.get_index()
+    print 'index loaded in {0:.2f}s'.format(time.time() - start)
+    queried, query_time = benchmark(lang_db.query_closest, records)
+    indexed, index_time = benchmark(lang_db.get_closest, records)
+    for name, seconds in [('queries', query_time), ('index', index_time)]:
+        print '{0}: {1} lookups in {2:.2f}s, {3:.0f} lookups/s'.format(
+            name, len(records), seconds, len(records) / max(seconds, 1e-6))
+    print 'speedup: {0:.1f}x'.format(query_time / max(index_time, 1e-6))
+    differences = [(lang, q, i) for lang, q, i in
+                   zip(records, queried, indexed) if q != i]
+    for lang, q, i in differences[:10]:
+        print 'different result for {0}: {1} (queries) {2} (index)'.format(
+            lang, q, i)
+    print '{0} different results'.format(len(differences))
+
+
+if __name__ == "__main__":
+    main()
@@ -48,13 +48,8 @@ class Preproc:
         conn = sqlite3.connect(self.sqlite_fn)
         self.df = read_sql("SELECT * FROM dld_language", conn)
         self.speakers = read_sql("SELECT * FROM dld_speaker", conn)
-        self.language_speakers =\
-                read_sql("SELECT * FROM dld_language_speakers", conn)
         self.endangered_levels = read_sql(
             "SELECT * FROM dld_endangeredlevel", conn)
-        self.language_endangered_levels =\
-                read_sql(
-                    "SELECT * FROM dld_language_endangered_levels", conn)
         self.codes =\
                 read_sql("SELECT * FROM dld_code", conn)
         self.language_codes =\
@@ -69,9 +64,12 @@ class Preproc:
         return lambda x: None if t not in x[0] else x[1][x[0].index(t)]
 
     def join_codes(self):
-        code_data = self.language_codes.join(
-            self.codes, lsuffix='_l', rsuffix='_r')[
-                ['language_id', 'code_name', 'code']]
+        code_data = self.language_codes.merge(
+            self.codes, left_on='code_id', right_on='id')
+        # codes are shared by languages, a link stands for as many codes
+        # as its count
+        code_data = code_data.loc[code_data.index.repeat(
+            code_data['count'])][['language_id', 'code_name', 'code']]
         code_types = list(code_data.code_name.value_counts().index)
         # unification of the codes (of one type): the most frequent one gets added to the tabular
         code_data_unique = code_data.groupby(
@@ -91,8 +89,8 @@ class Preproc:
 
     def join_speaker_counts(self):
         
-        aggreg = self.language_speakers.merge(
-            self.speakers, left_on='speaker_id', right_on='id')
+        # speakers refer to their language (language_id)
+        aggreg = self.speakers
 
         l2_ag = aggreg[aggreg['l_type'] == 'L2'].\
                 groupby(['language_id']).max()
@@ -110,9 +108,7 @@ class Preproc:
     
     def join_endangered_levels(self):
         
-        aggreg = self.language_endangered_levels.merge(
-        self.endangered_levels, left_on="endangeredlevel_id", right_on="id",
-            suffixes=("", "_e"))
+        aggreg = self.endangered_levels.copy()
         self.join_ethnologue_levels(aggreg)
         self.join_end_endangered_levels(aggreg)
 
@@ -0,0 +1,46 @@
+import os
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "langdeath.settings")
+
+import logging
+from argparse import ArgumentParser
+
+import django
+from django.apps import apps
+from django.db import connection
+
+
+def create_missing_tables():
+    """Creates the tables of the models of dld missing from the database,
+    with the link tables of their many to many fields; existing tables are
+    not changed. Returns the names of the tables created."""
+    existing = set(connection.introspection.table_names())
+    created = []
+    with connection.schema_editor() as editor:
+        for model in apps.get_app_config('dld').get_models():
+            if model._meta.db_table in existing:
+                continue
+            logging.info("Creating table {0}".format(model._meta.db_table))
+            editor.create_model(model)
+            created.append(model._meta.db_table)
+    return created
+
+
+def get_args():
+    parser = ArgumentParser(description='Creates the tables added to ' +\
+                            'dld/models.py since the database was created ' +\
+                            '(contributions of the parsers, checkpoint of ' +\
+                            'the aggregator); run it once after updating')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    get_args()
+    django.setup()
+    if len(create_missing_tables()) == 0:
+        logging.info("No table is missing")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+import os
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "langdeath.settings")
+    import django
+    django.setup()
+
+import logging
+from argparse import ArgumentParser
+
+from django.db import connection, transaction
+
+# one-off migration of databases created before codes were shared by the
+# languages: every (code_name, code) is kept once, under its smallest id,
+# the links of a language to copies of the same code become one link
+# counting them, and the contributions of parsers refer to the kept codes
+# (if the database has them already)
+MIGRATION_SQL = [
+    """CREATE TEMP TABLE code_map AS
+    SELECT c.id AS old_id, k.new_id FROM dld_code c
+    JOIN (SELECT code_name, code, MIN(id) AS new_id FROM dld_code
+          GROUP BY code_name, code) k
+    ON k.code_name = c.code_name AND k.code = c.code""",
+    "CREATE INDEX code_map_old_id ON code_map (old_id)",
+    """CREATE TEMP TABLE links AS
+    SELECT MIN(lc.id) AS id, lc.language_id, m.new_id AS code_id,
+           SUM(lc.count) AS count
+    FROM dld_language_code lc JOIN code_map m ON m.old_id = lc.code_id
+    GROUP BY lc.language_id, m.new_id""",
+    "DELETE FROM dld_language_code",
+    """INSERT INTO dld_language_code (id, language_id, code_id, count)
+    SELECT id, language_id, code_id, count FROM links""",
+]
+CONTRIBUTION_SQL = """UPDATE dld_contribution SET object_id = (
+    SELECT new_id FROM code_map
+    WHERE old_id = CAST(dld_contribution.object_id AS INTEGER))
+WHERE kind = 'code'"""
+CLEANUP_SQL = [
+    "DELETE FROM dld_code WHERE id NOT IN (SELECT new_id FROM code_map)",
+    """CREATE UNIQUE INDEX IF NOT EXISTS dld_code_code_name_code_uniq
+    ON dld_code (code_name, code)""",
+    "DROP TABLE code_map",
+    "DROP TABLE links",
+]
+
+
+def count_rows(cursor):
+    counts = []
+    for table in ['dld_code', 'dld_language_code']:
+        cursor.execute("SELECT COUNT(*) FROM {0}".format(table))
+        counts.append(cursor.fetchone()[0])
+    return counts
+
+
+def has_count_column(cursor):
+    cursor.execute("PRAGMA table_info(dld_language_code)")
+    return 'count' in [row[1] for row in cursor.fetchall()]
+
+
+def dedup_codes(vacuum):
+    with transaction.atomic():
+        cursor = connection.cursor()
+        before = count_rows(cursor)
+        if not has_count_column(cursor):
+            cursor.execute("ALTER TABLE dld_language_code ADD COLUMN "
+                           "count integer NOT NULL DEFAULT 1")
+        for query in MIGRATION_SQL:
+            cursor.execute(query)
+        if 'dld_contribution' in connection.introspection.table_names(cursor):
+            cursor.execute(CONTRIBUTION_SQL)
+        for query in CLEANUP_SQL:
+            cursor.execute(query)
+        after = count_rows(cursor)
+    logging.info("codes: {0} -> {1}, language codes: {2} -> {3}".format(
+        before[0], after[0], before[1], after[1]))
+    if vacuum:
+        logging.info("Vacuuming the database")
+        connection.cursor().execute("VACUUM")
+
+
+def get_args():
+    parser = ArgumentParser(description='Deduplicates the codes of a ' +\
+                            'database created by an earlier version of ' +\
+                            'parser_aggregator.py (run it once)')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='shrink the database file afterwards')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = get_args()
+    dedup_codes(args.vacuum)
+
+
+if __name__ == "__main__":
+    main()
@@ -99,14 +99,14 @@ class Language(models.Model):
                                   related_name='sublang2')
 
     ## many to many fields
-    code = models.ManyToManyField('Code', related_name='codes')
+    code = models.ManyToManyField('Code', related_name='codes',
+                                  through='LanguageCode')
     alt_name = models.ManyToManyField('AlternativeName',
                                       related_name='lang')
     country = models.ManyToManyField('Country', related_name='lang')
-    speakers = models.ManyToManyField('Speaker', related_name='lang')
-    endangered_levels = models.ManyToManyField('EndangeredLevel',
-                                               related_name='Language')
-    locations = models.ManyToManyField('Coordinates', related_name='Language')
+
+    ## one to many fields: speakers, endangered_levels and locations (see
+    ## Speaker, EndangeredLevel and Coordinates)
 
     ## debugging fields
 
@@ -118,9 +118,25 @@ class Language(models.Model):
 
 
 class Code(models.Model):
+    """A code is stored once and shared by the languages having it"""
     code_name = models.CharField(max_length=100)
     code = models.CharField(max_length=100)
 
+    class Meta:
+        unique_together = ('code_name', 'code')
+
+
+class LanguageCode(models.Model):
+    """A code of a language; @count is the number of times parsers added
+    it to the language"""
+    language = models.ForeignKey('Language')
+    code = models.ForeignKey('Code')
+    count = models.IntegerField(default=1)
+
+    class Meta:
+        db_table = 'dld_language_code'
+        unique_together = ('language', 'code')
+
 
 class AlternativeName(models.Model):
     name = models.CharField(max_length=100, primary_key=True)
@@ -134,6 +150,7 @@ class AlternativeName(models.Model):
 
 
 class Speaker(models.Model):
+    language = models.ForeignKey('Language', related_name='speakers')
     l_type = models.CharField(max_length=2,
                               choices=[("L1", "L1"), ("L2", "L2")])
     src = models.CharField(max_length=1000)
@@ -141,12 +158,15 @@ class Speaker(models.Model):
 
 
 class EndangeredLevel(models.Model):
+    language = models.ForeignKey('Language',
+                                 related_name='endangered_levels')
     src = models.CharField(max_length=1000)
     level = models.CharField(max_length=100)
     confidence = models.FloatField(blank=True, null=True)
 
 
 class Coordinates(models.Model):
+    language = models.ForeignKey('Language', related_name='locations')
     src = models.CharField(max_length=1000)
     longitude = models.FloatField(blank=True, null=True)
     latitude = models.FloatField(blank=True, null=True)
@@ -179,3 +199,33 @@ class Parser(models.Model):
     # This parser's python classname, the value returned by passing its
     # Class object to `lambda x: str(type(x))'
     classname = models.CharField(max_length=100, primary_key=True)
+
+
+class Contribution(models.Model):
+    """A change a parser made to a Language, recorded so that the data of
+    a parser can be retracted (see LanguageDB.retract_parser)
+
+    kind is one of
+        'new_language': the language was created by the parser
+        'field': scalar field @field changed from @old_value to @new_value
+                 (json encoded)
+        'code': the language got the code with id @object_id (the count of
+                 its link is increased, or the link is created)
+        'speaker', 'endangered_level', 'location': a row with id
+                 @object_id was created for the language
+        'alt_name', 'country', 'parser': the language got linked to the
+                 existing object with primary key @object_id
+    """
+    parser = models.ForeignKey('Parser', related_name='contributions')
+    language = models.ForeignKey('Language', related_name='contributions')
+    kind = models.CharField(max_length=20)
+    field = models.CharField(max_length=100, blank=True)
+    object_id = models.CharField(max_length=100, blank=True)
+    old_value = models.TextField(blank=True)
+    new_value = models.TextField(blank=True)
+
+
+class Checkpoint(models.Model):
+    """State of the last ParserAggregator run, saved together with the
+    merged data (see ld.run_checkpoint)"""
+    state = models.TextField()
@@ -1,3 +1,1493 @@
-from django.test import TestCase
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import logging
+import math
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from itertools import permutations
+from multiprocessing import Process
 
-# Create your tests here.
+from django.db import connection, transaction, IntegrityError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from create_missing_tables import create_missing_tables
+from dld.models import AlternativeName, Code, Contribution, Country, \
+    CountryName, Language, LanguageCode, Parser, Speaker, normalize_alt_name
+from dedup_codes import dedup_codes
+from migrate_child_tables import migrate_table
+from ld import bulk_writer
+from ld.bulk_writer import BulkWriter, IdAllocator
+from ld.candidate_scorer import CandidateScorer, Features, distance_km, \
+    record_features
+from ld.country_resolver import CountryResolver
+from ld.fuzzy_index import FuzzyIndex, ngrams
+from ld.identity_graph import IdentityGraph
+from ld.lang_db import LanguageDB
+from ld.langdeath_exceptions import DependencyException, \
+    LangdeathException, ParserException, ParserWorkerException
+from ld.parser_aggregator_utils import MergeLog, get_lang_values, \
+    NEW_LANGS_HEADER
+from ld.progress import Progress, ProgressMonitor
+from ld.parser_registry import ParserRegistry, PARSERS, DUMMY_FN
+from ld.parser_scheduler import ParserScheduler
+from ld.run_checkpoint import RunCheckpoint
+from ld.run_manifest import RunManifest
+from ld.run_report import RunReport
+from parser_aggregator import ParserAggregator
+from ld.parsers.base_parsers import BaseParser, OfflineParser, OnlineParser
+from ld.parsers.utils import call_concurrently, get_htmls
+from ld.work_queue import WorkQueue, STALE_CLAIM
+
+
+class LanguageDBTest(TestCase):
+
+    def setUp(self):
+        self.db = LanguageDB()
+        self.lang = Language.objects.create(sil='hun', name=u'Magyar nyelv',
+                                            native_name=u'Magyarnyelvű')
+
+    def test_get_closest_non_ascii_name(self):
+        langs, clue = self.db.get_closest({'name': 'Magyarnyelvű'})
+        self.assertEqual(langs, [self.lang])
+        self.assertEqual(clue, 'native_name')
+
+    def test_is_stale_non_ascii_name(self):
+        self.db.track_changes()
+        self.assertFalse(self.db.is_stale({'name': 'Magyarnyelvű'}))
+        self.db.touch(('native_name', u'Magyarnyelvű'))
+        self.assertTrue(self.db.is_stale({'name': 'Magyarnyelvű'}))
+
+    def test_alt_names_created_once(self):
+        ron = Language.objects.create(sil='ron', name=u'Romanian')
+        self.db.update_lang_data(self.lang, {'alt_names': [
+            'Old Magyar', 'magyar, old', '(OLD) Magyar', u'Old Magyar',
+            'Csángó', u'Csángó']})
+        self.db.update_lang_data(ron, {'alt_names': 'Magyar (Old)'})
+        lookups = [{'name': 'MAGYAR OLD'}, {'name': u'Csángó'}]
+        expected = [([self.lang, ron], 'altname'), ([self.lang], 'altname')]
+        # found while the names and their links are buffered
+        self.assertFalse(AlternativeName.objects.exists())
+        self.assertEqual([self.db.get_closest(l) for l in lookups], expected)
+        self.db.flush()
+        self.assertEqual(sorted(AlternativeName.objects.values_list(
+            'name', flat=True)), [u'csángó', u'magyar old'])
+        self.assertEqual(Language.alt_name.through.objects.count(), 3)
+        self.assertEqual(self.db.alt_names, set([u'csángó', u'magyar old']))
+        self.assertEqual([self.db.get_closest(l) for l in lookups], expected)
+        self.assertEqual([LanguageDB().get_closest(l) for l in lookups],
+                         expected)
+
+    def test_unchanged_record_not_saved(self):
+        self.lang.eth_population = 10
+        self.lang.save()
+        with self.assertNumQueries(0):
+            self.db.update_lang_data(self.lang, {
+                'sil': 'hun', 'native_name': 'Magyarnyelvű',
+                'eth_population': 10, 'iso_active': False})
+
+    def test_changed_fields_saved(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.db.update_lang_data(self.lang, {
+                'sil': u'hun', 'native_name': 'Magyarnyelvű',
+                'eth_population': 20, 'iso_active': True})
+        self.assertEqual(len(queries), 1)
+        update = queries[0]['sql']
+        self.assertTrue(update.startswith('UPDATE'))
+        for column in ['eth_population', 'iso_active']:
+            self.assertIn('"{0}"'.format(column), update)
+        for column in ['sil', 'native_name', 'name']:
+            self.assertNotIn('"{0}"'.format(column), update)
+        lang = Language.objects.get(pk=self.lang.pk)
+        self.assertEqual((lang.eth_population, lang.iso_active), (20, True))
+
+    def test_update_raises_flush_error(self):
+        self.db.get_code('glotto', 'hung1274')
+        # created behind the back of the code cache: writing it again fails
+        Code.objects.create(code_name='glotto', code='hung1274')
+        self.db.codes = {}
+        flush_rows = bulk_writer.FLUSH_ROWS
+        bulk_writer.FLUSH_ROWS = 1
+        try:
+            with self.assertRaises(IntegrityError):
+                with transaction.atomic():
+                    self.db.update_lang_data(
+                        self.lang, {'other_codes': {'glotto': 'hung1274'}})
+        finally:
+            bulk_writer.FLUSH_ROWS = flush_rows
+
+
+class ResolveFixture(object):
+    """Languages and records looked up by every clue of get_closest, with
+    utf-8 and unicode names and int codes"""
+
+    records = [
+        {'sil': 'hun'}, {'sil': u'csa'}, {'sil': 'zzz'},
+        {'other_codes': {'wals': 1274}},
+        {'other_codes': {'glotto': 'hung1274'}, 'name': 'Romanian'},
+        {'other_codes': {'glotto': 'none1234'}, 'name': 'Romanian'},
+        {'name': 'Csángó'}, {'name': u'Csángó'}, {'name': 'Română'},
+        {'name': 'Magyar'}, {'name': 'ősmagyar, nyelv'},
+        {'name': u'Nyelv (Ősmagyar)'}, {'name': 'Unknown'},
+        {'eth_population': 10}]
+
+    def setUp(self):
+        self.db = LanguageDB()
+        hun = Language.objects.create(sil='hun', name=u'Hungarian',
+                                      native_name=u'Magyar nyelv')
+        ron = Language.objects.create(sil='ron', name=u'Romanian',
+                                      native_name=u'Română')
+        Language.objects.create(sil='csa', name=u'Csángó')
+        Language.objects.create(sil='csx', name=u'Csángó')
+        for lang, code_name, code in [(hun, 'glotto', 'hung1274'),
+                                      (hun, 'wals', '1274'),
+                                      (ron, 'wals', '1274')]:
+            LanguageCode.objects.create(language=lang, code=
+                Code.objects.get_or_create(code_name=code_name, code=code)[0])
+        for name in [u'Magyar', u'Ősmagyar nyelv']:
+            hun.alt_name.add(AlternativeName.objects.create(
+                name=normalize_alt_name(name)))
+
+    def query(self, lang):
+        languages, clue = self.db.query_closest(lang)
+        return sorted(l.pk for l in languages), clue
+
+
+class ResolveTest(ResolveFixture, TestCase):
+    """The languages found by the batch resolver and the index are the
+    ones found with queries"""
+
+    def test_resolve_batches(self):
+        records = [dict(lang) for lang in self.records]
+        # one query by key table
+        with self.assertNumQueries(5):
+            resolved = list(self.db.resolve_batches(records))
+        self.assertEqual(len(resolved), len(self.records))
+        for lang in resolved:
+            ids, clue = lang.pop('_match')
+            self.assertEqual((ids, clue), self.query(lang), lang)
+
+    def closest(self, lang):
+        languages, clue = self.db.get_closest(lang)
+        return [l.pk for l in languages], clue
+
+    def test_get_closest(self):
+        for lang in self.records:
+            self.assertEqual(self.closest(lang), self.query(lang), lang)
+
+    def test_get_closest_after_update(self):
+        self.assertEqual(self.closest({'name': 'Magyar nyelv'}),
+                         self.query({'name': 'Magyar nyelv'}))
+        ron = Language.objects.get(sil='ron')
+        self.db.update_lang_data(ron, {
+            'native_name': 'Limba română', 'alt_names': ['Moldovan'],
+            'other_codes': {'glotto': 'roma1327', 'wals': 55}})
+        records = self.records + [{'name': 'Moldovan'},
+                                  {'other_codes': {'wals': '55'}}]
+        # the index is up to date before the new rows are written
+        indexed = [self.closest(lang) for lang in records]
+        self.db.flush()
+        self.assertEqual(indexed, [self.query(lang) for lang in records])
+
+    def test_resolved_match_stale_after_change(self):
+        lang = next(self.db.resolve_batches([{'name': 'Csángó'}]))
+        self.assertFalse(self.db.is_stale(lang))
+        self.db.touch(('name', u'Csángó'))
+        self.assertTrue(self.db.is_stale(lang))
+
+
+class CountryResolverTest(TestCase):
+
+    def setUp(self):
+        self.hungary = Country.objects.create(name=u'Hungary')
+        self.romania = Country.objects.create(name=u'Romania')
+        self.georgia = Country.objects.create(name=u'Georgia')
+        for country, name in [(self.hungary, u'Magyarország'),
+                              (self.romania, u'Transylvania'),
+                              (self.hungary, u'Transylvania'),
+                              (self.romania, u'Georgia')]:
+            CountryName.objects.create(country=country, name=name)
+        self.resolver = CountryResolver()
+
+    def test_find(self):
+        self.assertEqual(self.resolver.find('Hungary'),
+                         [(self.hungary.pk, u'Hungary')])
+        # loaded once
+        with self.assertNumQueries(0):
+            self.assertEqual(self.resolver.find('Magyarország'),
+                             [(self.hungary.pk, u'Hungary')])
+            # every country of an alias, in the order they were added
+            self.assertEqual(self.resolver.find(u'Transylvania'), [
+                (self.romania.pk, u'Romania'), (self.hungary.pk, u'Hungary')])
+            # a country before the countries having its name as an alias
+            self.assertEqual(self.resolver.find('Georgia'),
+                             [(self.georgia.pk, u'Georgia')])
+            self.assertIsNone(self.resolver.find('Atlantis'))
+
+    def test_unknown(self):
+        for i in xrange(3):
+            self.assertIsNone(self.resolver.resolve('Atlantisz'))
+            self.assertEqual(self.resolver.is_reported('Atlantisz'), i > 0)
+        self.resolver.log_unknown()
+        self.assertEqual(dict(self.resolver.unknown), {u'Atlantisz': 1})
+        self.assertIsNone(self.resolver.resolve(u'Atlantisz'))
+        self.assertTrue(self.resolver.is_reported('Atlantisz'))
+
+    def test_unknown_reported_once(self):
+        db = LanguageDB()
+        lang = Language.objects.create(sil='hun')
+        with self.assertRaises(LangdeathException):
+            db.add_country('Atlantis', lang)
+        db.add_country('Atlantis', lang)
+        db.add_country('Transylvania', lang)
+        db.add_country('Hungary', lang)
+        db.flush()
+        self.assertEqual(sorted(lang.country.values_list('name', flat=True)),
+                         [u'Hungary', u'Romania'])
+
+
+class BulkWriterTest(TestCase):
+
+    def test_flush(self):
+        writer = BulkWriter()
+        lang = Language.objects.create(sil='hun')
+        code = writer.create(Code, code_name='glotto', code='hung1274')
+        writer.link(lang, 'code', code)
+        self.assertEqual(Code.objects.count(), 0)
+        writer.flush()
+        self.assertEqual(writer.pending, 0)
+        self.assertEqual(list(lang.code.all()), [code])
+
+    def test_flush_failure_keeps_buffers(self):
+        Code.objects.create(code_name='glotto', code='hung1274')
+        writer = BulkWriter()
+        writer.create(Code, code_name='glotto', code='hung1274')
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                writer.flush()
+        self.assertEqual(writer.pending, 1)
+        self.assertEqual(len(writer.rows[Code]), 1)
+
+    def test_full(self):
+        writer = BulkWriter()
+        for i in xrange(bulk_writer.FLUSH_ROWS):
+            self.assertFalse(writer.full())
+            writer.create(Code, code_name='glotto', code=str(i))
+        # the owner of the writer flushes it
+        self.assertTrue(writer.full())
+        self.assertEqual(Code.objects.count(), 0)
+
+    def test_bad_value_fails_its_row(self):
+        writer = BulkWriter()
+        with self.assertRaises(IntegrityError):
+            writer.create(Code, code_name='glotto', code=None)
+        self.assertEqual(writer.pending, 0)
+
+
+class IdAllocatorTest(TestCase):
+
+    def test_allocate_after_last_id(self):
+        last = Code.objects.create(code_name='glotto', code='a').pk
+        allocator = IdAllocator(Code)
+        self.assertEqual(allocator.allocate(), last + 1)
+        self.assertEqual(allocator.allocate(), last + 2)
+
+    def test_deleted_ids_not_reused(self):
+        Code.objects.create(code_name='glotto', code='a')
+        last = Code.objects.create(code_name='glotto', code='b').pk
+        Code.objects.filter(pk=last).delete()
+        self.assertEqual(IdAllocator(Code).allocate(), last + 1)
+
+    def test_empty_table(self):
+        self.assertEqual(IdAllocator(Code).allocate(), 1)
+
+
+class UnitParser(BaseParser):
+    """Parser of numbered work units, slow enough to be shared"""
+
+    def get_work_units(self, units=0):
+        return range(units)
+
+    def parse_unit(self, unit):
+        time.sleep(0.01)
+        yield {'name': 'lang{0}'.format(unit), 'pid': os.getpid()}
+
+
+def work(shard_dir):
+    WorkQueue(shard_dir).work(wait=True)
+
+
+class WorkQueueTest(SimpleTestCase):
+
+    def setUp(self):
+        self.shard_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.shard_dir)
+
+    def test_parse_with_workers(self):
+        workers = [Process(target=work, args=(self.shard_dir,))
+                   for i in xrange(2)]
+        for p in workers:
+            p.start()
+        try:
+            records = list(WorkQueue(self.shard_dir).parse(UnitParser(),
+                                                           units=50))
+        finally:
+            for p in workers:
+                p.terminate()
+                p.join()
+        self.assertEqual([r['name'] for r in records],
+                         ['lang{0}'.format(i) for i in xrange(50)])
+        self.assertEqual(os.listdir(self.shard_dir), [])
+
+    def test_claim_of_old_unit_not_requeued(self):
+        queue = WorkQueue(self.shard_dir)
+        job_dir = queue.submit(UnitParser(), [0])
+        old = time.time() - 2 * STALE_CLAIM
+        os.utime('{0}/todo/{1}'.format(job_dir, queue.unit_name(0)),
+                 (old, old))
+        unit_name, claim_fn = queue.claim(job_dir)
+        queue.requeue_stale(job_dir)
+        self.assertTrue(os.path.exists(claim_fn))
+        self.assertEqual(os.listdir('{0}/todo'.format(job_dir)), [])
+
+    def test_stale_claim_requeued(self):
+        queue = WorkQueue(self.shard_dir)
+        job_dir = queue.submit(UnitParser(), [0])
+        unit_name, claim_fn = queue.claim(job_dir)
+        old = time.time() - 2 * STALE_CLAIM
+        os.utime(claim_fn, (old, old))
+        queue.requeue_stale(job_dir)
+        self.assertEqual(os.listdir('{0}/todo'.format(job_dir)),
+                         [unit_name])
+
+
+class ListParser(BaseParser):
+    depends_on = ()
+
+    def __init__(self, names):
+        self.names = names
+
+    def parse_all(self):
+        for name in self.names:
+            yield {'name': name}
+
+    def parse(self):
+        return self.parse_all()
+
+
+class A(ListParser):
+    pass
+
+
+class B(ListParser):
+    depends_on = ('A',)
+
+
+class C(ListParser):
+    runs_after = ('B', 'D')
+
+
+class Failing(ListParser):
+
+    def parse_all(self):
+        yield {'name': 'first'}
+        raise ParserException('no more')
+
+
+class Dying(ListParser):
+
+    def parse_all(self):
+        yield {'name': 'first'}
+        os._exit(3)
+
+
+class FileParser(ListParser):
+    input_attrs = ('fn',)
+
+    def __init__(self, fn):
+        self.fn = fn
+
+
+class ParserSchedulerTest(SimpleTestCase):
+
+    def scheduler(self, parsers, jobs=2):
+        return ParserScheduler(parsers, lambda p: p.parse_all, jobs)
+
+    def merge(self, scheduler):
+        """Records of the parsers of @scheduler, merged in order"""
+        scheduler.start_all()
+        merged = {}
+        for parser in scheduler.order:
+            merged[type(parser).__name__] = [
+                r['name'] for r in scheduler.records(parser)]
+            scheduler.merged(parser)
+        return merged
+
+    def test_order(self):
+        parsers = [C([]), B([]), A([])]
+        self.assertEqual([type(p).__name__
+                          for p in self.scheduler(parsers).order],
+                         ['A', 'B', 'C'])
+
+    def test_missing_dependency(self):
+        with self.assertRaises(DependencyException):
+            self.scheduler([B([])])
+
+    def test_cycle(self):
+        class D(ListParser):
+            depends_on = ('C',)
+        with self.assertRaises(DependencyException):
+            self.scheduler([C([]), D([])])
+
+    def test_records(self):
+        names = ['lang{0}'.format(i) for i in xrange(1000)]
+        merged = self.merge(self.scheduler([A(names), B(['b']), C([])],
+                                           jobs=1))
+        self.assertEqual(merged, {'A': names, 'B': ['b'], 'C': []})
+
+    def test_skipped(self):
+        scheduler = ParserScheduler(
+            [A(['a']), B(['b'])],
+            lambda p: None if isinstance(p, A) else p.parse_all)
+        self.assertEqual(self.merge(scheduler), {'A': [], 'B': ['b']})
+
+    def test_parser_error(self):
+        scheduler = self.scheduler([Failing([])])
+        scheduler.start_all()
+        records = scheduler.records(scheduler.order[0])
+        self.assertEqual(next(records), {'name': 'first'})
+        with self.assertRaises(ParserException):
+            next(records)
+
+    def test_dead_worker(self):
+        scheduler = self.scheduler([Dying([])])
+        scheduler.start_all()
+        with self.assertRaises(ParserWorkerException):
+            list(scheduler.records(scheduler.order[0]))
+
+
+class TimedParser(object):
+    """Parser taking a while, yielding the time it parsed in"""
+    depends_on = ()
+
+    def parse_all(self):
+        start = time.time()
+        time.sleep(0.3)
+        yield {'start': start, 'end': time.time()}
+
+
+class OfflineA(TimedParser, OfflineParser):
+    pass
+
+
+class OnlineA(TimedParser, OnlineParser):
+    pass
+
+
+class OnlineB(TimedParser, OnlineParser):
+    pass
+
+
+class OnlineSlotsTest(SimpleTestCase):
+
+    def intervals(self, jobs, online_jobs):
+        scheduler = ParserScheduler([OfflineA(), OnlineA(), OnlineB()],
+                                    lambda p: p.parse_all, jobs,
+                                    online_jobs=online_jobs)
+        scheduler.start_all()
+        intervals = {}
+        for parser in scheduler.order:
+            for lang in scheduler.records(parser):
+                intervals[type(parser).__name__] = (lang['start'],
+                                                    lang['end'])
+            scheduler.merged(parser)
+        return intervals
+
+    def overlap(self, intervals, a, b):
+        return intervals[a][0] < intervals[b][1] and \
+            intervals[b][0] < intervals[a][1]
+
+    def test_online_slots(self):
+        intervals = self.intervals(1, 1)
+        self.assertTrue(self.overlap(intervals, 'OfflineA', 'OnlineA'))
+        # one online slot
+        self.assertFalse(self.overlap(intervals, 'OnlineA', 'OnlineB'))
+
+    def test_shared_slots(self):
+        intervals = self.intervals(1, 0)
+        for a, b in [('OfflineA', 'OnlineA'), ('OfflineA', 'OnlineB'),
+                     ('OnlineA', 'OnlineB')]:
+            self.assertFalse(self.overlap(intervals, a, b))
+
+
+class CallConcurrentlyTest(SimpleTestCase):
+
+    def test_order_and_errors(self):
+        def call(i):
+            # the later ones finish first
+            time.sleep(0.05 * (5 - i))
+            if i == 2:
+                raise ValueError(i)
+            return i * 10
+        start = time.time()
+        results = list(call_concurrently(call, range(5), threads=5))
+        self.assertLess(time.time() - start, 0.5)
+        self.assertEqual([r for r, e in results], [0, 10, None, 30, 40])
+        self.assertEqual([type(e) for r, e in results],
+                         [type(None)] * 2 + [ValueError] + [type(None)] * 2)
+
+    def test_more_args_than_threads(self):
+        results = list(call_concurrently(lambda i: i, xrange(100),
+                                         threads=3))
+        self.assertEqual(results, [(i, None) for i in xrange(100)])
+
+    def test_get_htmls(self):
+        html_dir = tempfile.mkdtemp()
+        try:
+            urls = []
+            for i, text in enumerate([u'első', u'second']):
+                fn = os.path.join(html_dir, str(i))
+                with open(fn, 'w') as f:
+                    f.write(text.encode('utf-8'))
+                urls.append('file://' + fn)
+            self.assertEqual(list(get_htmls(urls)), [u'első', u'second'])
+            htmls = get_htmls(urls[:1] + ['file://' + html_dir + '/missing'] +
+                              urls[1:])
+            self.assertEqual(next(htmls), u'első')
+            with self.assertRaises(ParserException):
+                next(htmls)
+        finally:
+            shutil.rmtree(html_dir)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+class ProgressTest(SimpleTestCase):
+
+    def progress(self, name, done, total, elapsed, idle, now):
+        progress = Progress(name)
+        progress.set_total(total, 'bytes')
+        progress.advance(done)
+        progress.values[2] = now - elapsed
+        progress.values[3] = now - idle
+        return progress
+
+    def test_fraction(self):
+        progress = Progress('P')
+        self.assertIsNone(progress.fraction)
+        progress.set_total(4)
+        progress.advance()
+        self.assertEqual(progress.fraction, 0.25)
+        progress.advance(10)
+        self.assertEqual(progress.fraction, 1.0)
+        progress = Progress('Q')
+        progress.merged = True
+        self.assertEqual(progress.fraction, 1.0)
+
+    def test_describe(self):
+        now = time.time()
+        progress = self.progress('P', 25, 100, 10, 0, now)
+        self.assertEqual(progress.describe(now),
+                         'P: 25/100 bytes (25.0%), 2.5 bytes/s, ETA 0m30s')
+
+    def test_stalled(self):
+        now = time.time()
+        progress = self.progress('P', 25, 100, 100, 20, now)
+        self.assertNotIn('no progress', progress.describe(now))
+        self.assertTrue(progress.describe(now, 10).endswith(
+            ', no progress for 0m20s'))
+
+    def test_report(self):
+        now = time.time()
+        monitor = ProgressMonitor([
+            self.progress('P', 50, 100, 100, 20, now), Progress('Q'),
+            Progress('R')], interval=10)
+        monitor.merged('R')
+        monitor.started = now - 100
+        handler = ListHandler()
+        logger = logging.getLogger()
+        level = logger.level
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        try:
+            monitor.report()
+        finally:
+            logger.removeHandler(handler)
+            logger.setLevel(level)
+        self.assertEqual(len(handler.messages), 2)
+        # stalled for longer than the interval of the monitor
+        self.assertTrue(handler.messages[0].startswith('Progress of P: 50/'))
+        self.assertTrue(handler.messages[0].endswith(
+            ', no progress for 0m20s'))
+        # 1.5 of 3 parsers done in 100s
+        self.assertEqual(handler.messages[1], 'Progress of the run: 1/3 '
+                         'parsers merged, 1m40s elapsed, ETA 1m40s')
+
+
+class IdentityGraphTest(SimpleTestCase):
+
+    def cluster(self, records):
+        """Clusters of @records as sets of their '_id's"""
+        graph = IdentityGraph()
+        for lang in records:
+            graph.add(lang)
+        return set(frozenset(records[i]['_id'] for i in cluster)
+                   for cluster in graph.clusters())
+
+    def test_shared_identifiers(self):
+        records = [{'_id': 1, 'sil': 'hun', 'name': 'Hungarian'},
+                   {'_id': 2, 'name': 'hungarian',
+                    'other_codes': {'glotto': 'hung1274'}},
+                   {'_id': 3, 'other_codes': {'glotto': ['hung1274']}},
+                   {'_id': 4, 'name': 'Finnish'}]
+        self.assertEqual(self.cluster(records),
+                         set([frozenset([1, 2, 3]), frozenset([4])]))
+
+    def test_order_independent(self):
+        records = [{'_id': 'A', 'sil': 'aaa', 'name': 'X'},
+                   {'_id': 'B', 'name': 'X',
+                    'other_codes': {'glotto': 'g'}},
+                   {'_id': 'C', 'sil': 'bbb',
+                    'other_codes': {'glotto': 'g'}}]
+        clusters = set(frozenset(self.cluster(list(p)))
+                       for p in permutations(records))
+        self.assertEqual(clusters,
+                         set([frozenset([frozenset(['A']),
+                                         frozenset(['B', 'C'])])]))
+
+    def test_no_shared_code_keeps_sils_apart(self):
+        records = [{'_id': 1, 'sil': 'aaa', 'name': 'X'},
+                   {'_id': 2, 'name': 'X'},
+                   {'_id': 3, 'sil': 'bbb', 'name': 'Y'},
+                   {'_id': 4, 'name': 'Y',
+                    'other_codes': {'wiki': 'x'}},
+                   {'_id': 5, 'other_codes': {'wiki': 'x'}, 'name': 'X'}]
+        for p in permutations(records):
+            clusters = self.cluster(list(p))
+            self.assertEqual(len([c for c in clusters if 1 in c and 3 in c]),
+                             0)
+
+    def test_homonyms(self):
+        records = [{'_id': 1, 'name': 'Miao',
+                    'other_codes': {'glotto': 'miao1234'}},
+                   {'_id': 2, 'name': 'Miao',
+                    'other_codes': {'glotto': 'hmon1337'}},
+                   {'_id': 3, 'name': 'Miao'}]
+        self.assertEqual(self.cluster(records),
+                         set([frozenset([1]), frozenset([2]),
+                              frozenset([3])]))
+
+    def test_clusters_in_order_of_first_records(self):
+        graph = IdentityGraph()
+        for lang in [{'name': 'a'}, {'name': 'b'}, {'name': 'a'},
+                     {'sil': 'ccc'}]:
+            graph.add(lang)
+        self.assertEqual(graph.clusters(), [[0, 2], [1], [3]])
+        self.assertEqual(graph.sils, set(['ccc']))
+
+
+class RunReportTest(SimpleTestCase):
+    allow_database_queries = True
+
+    def setUp(self):
+        fd, self.fn = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.fn)
+
+    def test_peak_rss_of_parser(self):
+        report = RunReport(self.fn)
+        start = report.start()
+        data = ' ' * (64 << 20)
+        report.add_parser('Large', start, {'records': 1})
+        del data
+        start = report.start()
+        report.add_parser('Small', start, {'records': 1})
+        large, small = report.parsers
+        if 'peak_rss_kb' not in small:
+            # the peak can not be reset here, it is labelled as the
+            # peak of the run
+            self.assertIn('run_peak_rss_kb', small)
+            return
+        self.assertGreater(large['peak_rss_kb'],
+                           small['peak_rss_kb'] + (32 << 10))
+        report.write()
+        with open(self.fn) as f:
+            total = json.load(f)['total']
+        self.assertGreaterEqual(total['run_peak_rss_kb'],
+                                large['peak_rss_kb'])
+        self.assertNotIn('peak_rss_kb', total)
+
+    def test_queries_counted_once(self):
+        reports = [RunReport(self.fn) for _ in range(3)]
+        self.assertIs(reports[0].queries, reports[-1].queries)
+        reports[0].queries.install()
+        start = reports[-1].start()
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        self.assertEqual(reports[-1].queries.count - start[1], 1)
+
+
+class RetractTest(TestCase):
+
+    def setUp(self):
+        Country.objects.create(name='Hungary')
+        Country.objects.create(name='Romania')
+        self.hun = Language.objects.create(sil='hun', name='Hungarian')
+        self.db = LanguageDB()
+
+    def merge(self, parser_name, updates, new_langs=()):
+        self.db.set_contributor(parser_name)
+        for lang, update in updates:
+            update['parser'] = parser_name
+            self.db.update_lang_data(lang, update)
+        for update in new_langs:
+            self.db.add_new_language(update)
+        self.db.set_contributor(None)
+
+    def snapshot(self):
+        langs = []
+        for l in Language.objects.order_by('pk'):
+            langs.append((
+                l.pk, l.sil, l.name, l.eth_population, l.champion_id,
+                sorted(LanguageCode.objects.filter(language=l).values_list(
+                    'code__code_name', 'code__code', 'count')),
+                sorted(l.alt_name.values_list('name', flat=True)),
+                sorted(l.country.values_list('name', flat=True)),
+                sorted(l.parsers.values_list('classname', flat=True)),
+                sorted(l.speakers.values_list('src', 'num', 'l_type')),
+                sorted(l.endangered_levels.values_list('src', 'level')),
+                sorted(l.locations.values_list('src', 'longitude',
+                                               'latitude'))))
+        return langs, AlternativeName.objects.count(), Code.objects.count()
+
+    def test_retract_round_trip(self):
+        self.merge('First', [(self.hun, {
+            'eth_population': 100,
+            'other_codes': {'glotto': 'hung1274'},
+            'alt_names': ['Magyar'],
+            'country': 'Hungary',
+            'speakers': [('first', 'L1', 100)]})])
+        before = self.snapshot()
+        self.merge('Second', [(self.hun, {
+            'eth_population': 200,
+            'other_codes': {'glotto': 'hung1274', 'wiki': 'hu'},
+            'alt_names': ['Magyar', 'Ungarisch'],
+            'country': 'Romania',
+            'speakers': [('second', 'L1', 200)],
+            'endangered_level': [('second', 'safe', 1.0)],
+            'location': [('second', 19.0, 47.0)]})],
+            [{'sil': 'xyz', 'name': 'New', 'other_codes': {'wiki': 'xy'},
+              'alt_names': ['Newer']}])
+        self.assertNotEqual(self.snapshot(), before)
+        self.db.retract_parser('Second')
+        self.assertEqual(self.snapshot(), before)
+        self.assertFalse(Contribution.objects.filter(
+            parser_id='Second').exists())
+
+    def test_links_added_once(self):
+        update = {'country': 'Hungary'}
+        self.merge('First', [(self.hun, dict(update))])
+        self.merge('First', [(self.hun, dict(update))])
+        self.assertEqual(self.hun.country.count(), 1)
+        self.assertEqual(self.hun.parsers.count(), 1)
+        self.assertEqual(Contribution.objects.filter(
+            kind__in=['country', 'parser']).count(), 2)
+
+
+class CreateMissingTablesTest(TransactionTestCase):
+
+    def test_create_missing_tables(self):
+        with connection.schema_editor() as editor:
+            editor.delete_model(Contribution)
+        self.assertEqual(create_missing_tables(), ['dld_contribution'])
+        self.assertEqual(create_missing_tables(), [])
+        Contribution.objects.create(parser=Parser.objects.create(
+            classname='First'), language=Language.objects.create(sil='hun'),
+            kind='new_language')
+
+
+class MigrateChildTablesTest(TransactionTestCase):
+
+    def setUp(self):
+        self.langs = [Language.objects.create(sil=sil)
+                      for sil in ['aaa', 'bbb', 'ccc']]
+        for name in ['First', 'Second']:
+            Parser.objects.create(classname=name)
+        self.cursor = connection.cursor()
+        # the tables as they were before the migration
+        with connection.schema_editor() as editor:
+            editor.delete_model(Speaker)
+        for query in [
+                """CREATE TABLE dld_speaker (
+                id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+                l_type varchar(2) NOT NULL, src varchar(1000) NOT NULL,
+                num integer NULL)""",
+                """CREATE TABLE dld_language_speakers (
+                id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+                language_id integer NOT NULL, speaker_id integer NOT NULL)"""]:
+            self.cursor.execute(query)
+        a, b, c = [l.pk for l in self.langs]
+        for i in xrange(1, 5):
+            self.cursor.execute("INSERT INTO dld_speaker (l_type, src, num) "
+                                "VALUES ('L1', %s, %s)", ['src', i])
+        # rows of deleted speakers are not reused
+        self.cursor.execute("DELETE FROM dld_speaker WHERE id = 4")
+        self.cursor.executemany(
+            "INSERT INTO dld_language_speakers (language_id, speaker_id) "
+            "VALUES (%s, %s)", [(a, 1), (b, 1), (c, 2)])
+        for parser, lang, speaker in [('First', a, 1), ('Second', c, 2)]:
+            Contribution.objects.create(parser_id=parser, language_id=lang,
+                                        kind='speaker', object_id=speaker)
+
+    def test_migrate_speakers(self):
+        migrate_table(self.cursor, Speaker, 'dld_language_speakers',
+                      'speaker_id', 'speaker')
+        a, b, c = self.langs
+        self.assertEqual(list(a.speakers.values_list('id', 'num')),
+                         [(1, 1)])
+        self.assertEqual(list(b.speakers.values_list('id', 'num')),
+                         [(5, 1)])
+        self.assertEqual(list(c.speakers.values_list('id', 'num')),
+                         [(2, 2)])
+        self.assertEqual(Speaker.objects.count(), 3)
+        self.assertNotIn('dld_language_speakers',
+                         connection.introspection.table_names())
+        self.cursor.execute("PRAGMA table_info(dld_speaker)")
+        not_null = dict((row[1], row[3]) for row in self.cursor.fetchall())
+        self.assertEqual(not_null['language_id'], 1)
+        self.assertEqual(IdAllocator(Speaker).allocate(), 6)
+        self.assertTrue(Contribution.objects.filter(
+            parser_id='First', language=b, kind='speaker',
+            object_id='5').exists())
+        # migrated already
+        migrate_table(self.cursor, Speaker, 'dld_language_speakers',
+                      'speaker_id', 'speaker')
+        LanguageDB().retract_parser('First')
+        self.assertEqual(list(Speaker.objects.values_list('id', flat=True)),
+                         [2])
+
+
+class IntegrateCodesTest(TestCase):
+
+    def link(self, lang, code, count=1):
+        LanguageCode.objects.create(
+            language=lang, count=count,
+            code=Code.objects.get_or_create(code_name='glotto',
+                                            code=code)[0])
+
+    def test_most_frequent_code(self):
+        db = LanguageDB()
+        tie = Language.objects.create(sil='Parser_1')
+        for code in ['zzzz1234', 'aaaa1234', 'mmmm1234']:
+            self.link(tie, code)
+        frequent = Language.objects.create(sil='Parser_2')
+        self.link(frequent, 'zzzz1234')
+        self.link(frequent, 'aaaa1234', 2)
+        other_codes = db.get_other_codes()
+        self.assertEqual(db.get_other_code(*other_codes[tie.pk]['glotto']),
+                         'zzzz1234')
+        self.assertEqual(
+            db.get_other_code(*other_codes[frequent.pk]['glotto']),
+            'aaaa1234')
+
+
+class RunCheckpointTest(TestCase):
+
+    def test_resume(self):
+        checkpoint = RunCheckpoint()
+        checkpoint.finished('First')
+        checkpoint.update('Second', 1000, {'new_lang_count': 3})
+        resumed = RunCheckpoint()
+        resumed.load()
+        self.assertEqual(resumed.completed, ['First'])
+        self.assertEqual(resumed.resumed_state('Second'),
+                         (1000, {'new_lang_count': 3}))
+        self.assertEqual(resumed.resumed_state('Third'), (0, {}))
+
+    def test_no_checkpoint(self):
+        checkpoint = RunCheckpoint()
+        checkpoint.load()
+        self.assertEqual(checkpoint.completed, [])
+
+
+class Online(ListParser):
+    pass
+
+
+class ParserAggregatorTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_unchanged_output_finishes_parser(self):
+        parser = Online([])
+        records = [{'sil': 'hun', 'eth_population': 10}]
+        aggregator = ParserAggregator(
+            self.dir, self.dir, self.dir, 'res', False,
+            manifest_fn=os.path.join(self.dir, 'manifest.json'),
+            skip=ParserRegistry(self.dir, self.dir, 'res', False).names)
+        self.assertEqual(aggregator.parsers, [])
+        aggregator.scheduler = ParserScheduler([parser],
+                                               aggregator.make_parse_call)
+        # merged by an earlier run
+        aggregator.manifest.update('Online', aggregator.manifest.
+                                   output_fingerprint(parser, records))
+        aggregator.run_parser(parser, list(records))
+        self.assertEqual(aggregator.checkpoint.completed, ['Online'])
+
+
+class ParseISO639_3(ListParser):
+
+    def __init__(self, records):
+        self.records = records
+
+    def parse_all(self):
+        for lang in self.records:
+            yield dict(lang)
+
+
+class Untrusted(ParseISO639_3):
+    pass
+
+
+class DryRunTest(TestCase):
+    """A dry run matches the records as a merge into the database"""
+
+    parsers = [ParseISO639_3([
+        {'sil': 'hun', 'name': 'Hungarian', 'other_codes': {'wals': 1274},
+         'alt_names': ['Magyar', 'Ősmagyar', 'East Magyar']},
+        {'sil': 'csa', 'name': 'Csángó'}, {'sil': 'csx', 'name': u'Csángó'},
+        {'sil': 'ron', 'name': 'Romanian', 'other_codes': {'wals': '1274'},
+         'champion': u'hun'}]),
+        Untrusted([
+            {'name': u'Csángó'}, {'name': 'Csángó'}, {'name': 'ősmagyar'},
+            {'name': 'Magyar, Eastern'}, {'other_codes': {'wals': 1274}},
+            {'other_codes': {'wals': u'1274'}}, {'name': 'Hungarian'},
+            {'sil': u'hun', 'name': 'Hungarian'}, {'name': 'Unknown'}])]
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def merge(self, snapshot_fn=None):
+        """Match statistics of merging the records of the parsers, as
+        call_parser merges them"""
+        aggregator = ParserAggregator(
+            self.dir, self.dir, self.dir, 'res', False,
+            skip=ParserRegistry(self.dir, self.dir, 'res', False).names,
+            snapshot_fn=snapshot_fn)
+        for parser in self.parsers:
+            aggregator.parser = parser
+            aggregator.parser_name = type(parser).__name__
+            aggregator.stats = aggregator.match_stats.setdefault(
+                aggregator.parser_name, defaultdict(int))
+            aggregator.new_lang_count = 0
+            aggregator.lang_db.set_contributor(str(type(parser)))
+            for lang in aggregator.lang_db.resolve_batches(
+                    parser.parse_all()):
+                lang['parser'] = str(type(parser))
+                aggregator.add_lang(lang)
+            aggregator.lang_db.set_contributor(None)
+        return dict((name, dict(stats)) for name, stats
+                    in aggregator.match_stats.iteritems())
+
+    def test_same_match_stats(self):
+        stats = self.merge()
+        self.assertEqual(stats['Untrusted'], {
+            'langs': 9, 'name': 3, 'altname': 1, 'other_codes': 2, 'sil': 1,
+            'ambiguous': 4, 'not_added': 2})
+        self.assertEqual(self.merge(os.path.join(self.dir, 'snapshot.json')),
+                         stats)
+
+
+class StagingTest(ResolveFixture, TransactionTestCase):
+    """The records resolved in the staging database match the languages
+    get_closest finds"""
+
+    def setUp(self):
+        super(StagingTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_staged_records(self):
+        aggregator = ParserAggregator(
+            self.dir, self.dir, self.dir, 'res', False,
+            skip=ParserRegistry(self.dir, self.dir, 'res', False).names,
+            staging_dir=self.dir)
+        parser = ParseISO639_3(self.records)
+        records = list(aggregator.staged_records(parser))
+        self.assertEqual(len(records), len(self.records))
+        resolved = 0
+        for lang in records:
+            match = lang.pop('_match', None)
+            languages, clue = self.db.get_closest(lang)
+            ids = [l.pk for l in languages]
+            if match is None:
+                self.assertEqual(ids, [], lang)
+            else:
+                self.assertEqual(match, (ids, clue), lang)
+                resolved += 1
+        self.assertEqual(resolved, 11)
+
+
+class RecordingRegistry(ParserRegistry):
+    """Constructs (classname, arguments) pairs instead of parsers"""
+
+    def __init__(self, *args):
+        super(RecordingRegistry, self).__init__(*args)
+        self.imported = []
+
+    def get_class(self, name):
+        self.imported.append(name)
+        return lambda *args: (name, args)
+
+
+class ParserRegistryTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dump_dir = tempfile.mkdtemp()
+        self.pickle_dir = tempfile.mkdtemp()
+        self.registry = RecordingRegistry(self.dump_dir, self.pickle_dir,
+                                          'res', False)
+
+    def tearDown(self):
+        shutil.rmtree(self.dump_dir)
+        shutil.rmtree(self.pickle_dir)
+
+    def test_select(self):
+        self.assertEqual(len(self.registry.select()), len(PARSERS))
+        self.assertEqual(self.registry.select(
+            only=['GlottologParser', 'ParseISO639_3']),
+            ['ParseISO639_3', 'GlottologParser'])
+        self.assertNotIn('GlottologParser', self.registry.select(
+            skip=['GlottologParser']))
+        self.assertEqual(self.registry.select(
+            only=['GlottologParser', 'CrubadanParser'],
+            skip=['CrubadanParser']), ['GlottologParser'])
+        # fallbacks stand for the parser they replace
+        self.assertEqual(self.registry.select(
+            only=['LanguageArchivesOnlineParser']),
+            ['LanguageArchivesOfflineParser'])
+        with self.assertRaises(ParserException):
+            self.registry.select(skip=['NoSuchParser'])
+
+    def test_only_selected_imported(self):
+        modules = set(sys.modules)
+        aggregator = ParserAggregator(
+            self.dump_dir, self.dump_dir, self.pickle_dir, 'res', False,
+            only=['LeibzigCorporaParser'])
+        self.assertEqual([type(p).__name__ for p in aggregator.parsers],
+                         ['LeibzigCorporaParser'])
+        aggregator.parsers[0].fh.close()
+        for name, module, args in PARSERS:
+            module = 'ld.parsers.' + module
+            if module not in modules and module != 'ld.parsers.list_parser':
+                self.assertNotIn(module, sys.modules)
+
+    def test_only_selected_constructed(self):
+        self.assertEqual(self.registry.create('GlottologParser'),
+                         ('GlottologParser', ()))
+        self.assertEqual(self.registry.create('LeibzigCorporaParser'),
+                         ('LeibzigCorporaParser', ('res/leipzig_corpora',)))
+        self.assertEqual(self.registry.imported,
+                         ['GlottologParser', 'LeibzigCorporaParser'])
+
+    def test_dump_parser_without_dump(self):
+        self.assertIsNone(self.registry.create('UrielParser'))
+        self.assertEqual(self.registry.imported, [])
+
+    def test_fallback(self):
+        name = 'LanguageArchivesOfflineParser'
+        self.assertEqual(self.registry.create(name),
+                         ('LanguageArchivesOnlineParser', ()))
+        fn = os.path.join(self.dump_dir, self.registry.dump_fns[name])
+        open(fn, 'w').close()
+        registry = RecordingRegistry(self.dump_dir, self.pickle_dir, 'res',
+                                     False)
+        self.assertEqual(registry.create(name), (name, (fn,)))
+
+    def test_pickled(self):
+        open(os.path.join(self.pickle_dir, 'UrielParser.pickle'),
+             'w').close()
+        self.assertEqual(self.registry.create('UrielParser'),
+                         ('UrielParser', (DUMMY_FN,)))
+
+
+class MergeLogTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'Parser.new_langs')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def read(self, fn):
+        with (gzip.open if fn.endswith('.gz') else open)(fn, 'rb') as f:
+            return [l.decode('utf-8') for l in f.read().splitlines()]
+
+    def lines(self, *rows):
+        return [u'name\tsil\tother_codes', u''] + list(rows)
+
+    def test_other_codes_column(self):
+        self.assertEqual(get_lang_values(
+            {'name': 'Csángó', 'other_codes': {'wals': 1274,
+                                                'glotto': 'hung1274'}}),
+            [u'Csángó', u'', u'glotto:hung1274,wals:1274'])
+        self.assertEqual(get_lang_values(
+            {'sil': u'hun', 'other_codes': {'multiple_sils': ['a', 'b']}}),
+            [u'', u'hun', u'multiple_sils:a;b'])
+        self.assertEqual(get_lang_values({'name': u'Magyar'}),
+                         [u'Magyar', u'', u''])
+
+    def test_write(self):
+        log = MergeLog(self.fn, NEW_LANGS_HEADER)
+        log.close()
+        self.assertFalse(os.path.exists(self.fn))
+        log.write(get_lang_values({'name': 'Csángó',
+                                   'other_codes': {'wals': 1274}}))
+        log.write(get_lang_values({'sil': u'hun'}))
+        log.close()
+        self.assertEqual(log.count, 2)
+        self.assertEqual(self.read(self.fn), self.lines(
+            u'Csángó\t\twals:1274', u'\thun\t'))
+
+    def test_restore(self):
+        for compress in [False, True]:
+            log = MergeLog(self.fn, NEW_LANGS_HEADER, compress)
+            log.write(['first', '', ''])
+            size, count = log.tell(), log.count
+            log.write(['lost', '', ''])
+            log.close()
+            # resumed from the checkpoint taken after the first line
+            log = MergeLog(self.fn, NEW_LANGS_HEADER, compress)
+            log.restore(size, count)
+            log.write([u'Csángó', '', ''])
+            log.close()
+            self.assertEqual(log.count, 2)
+            self.assertEqual(self.read(log.fn), self.lines(
+                u'first\t\t', u'Csángó\t\t'))
+
+    def test_switch_parser(self):
+        aggregator = ParserAggregator(
+            self.dir, self.dir, self.dir, 'res', False, compress_logs=True,
+            skip=ParserRegistry(self.dir, self.dir, 'res', False).names,
+            snapshot_fn=os.path.join(self.dir, 'snapshot.json'))
+        parsers = [ParseISO639_3([]), Untrusted([])]
+        states = {}
+        for parser in parsers:
+            aggregator.parser = parser
+            aggregator.parser_name = type(parser).__name__
+            aggregator.match_stats[aggregator.parser_name] = \
+                defaultdict(int)
+            aggregator.new_lang_count = 0
+            aggregator.temp_code_index = 0
+            aggregator.open_logs()
+            states[aggregator.parser_name] = aggregator.get_merge_state()
+        aggregator.parser = None
+        for parser, name in [(parsers[0], 'hun'), (parsers[1], 'ron'),
+                             (parsers[0], u'Csángó')]:
+            aggregator.switch_parser(parser, states)
+            aggregator.new_lang_count += 1
+            aggregator.write_log('new', [name, '', ''])
+        aggregator.switch_parser(None, states)
+        self.assertEqual(states['ParseISO639_3']['new_lang_count'], 2)
+        self.assertEqual(states['Untrusted']['new_lang_count'], 1)
+        for state in states.itervalues():
+            for log in state['logs'].itervalues():
+                log.close()
+        self.assertEqual(self.read(os.path.join(
+            self.dir, 'ParseISO639_3.new_langs.gz')),
+            self.lines(u'hun\t\t', u'Csángó\t\t'))
+        self.assertEqual(self.read(os.path.join(
+            self.dir, 'Untrusted.notfound_langs.gz')),
+            self.lines(u'ron\t\t'))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.dir, 'Untrusted.found_langs.gz')))
+
+
+class RunManifestTest(SimpleTestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, 'manifest.json')
+        self.input_fn = os.path.join(self.dir, 'input.txt')
+        self.write_input('hun\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def write_input(self, data, mtime=None):
+        with open(self.input_fn, 'w') as f:
+            f.write(data)
+        if mtime is not None:
+            os.utime(self.input_fn, (mtime, mtime))
+
+    def test_input_fingerprint(self):
+        parser = FileParser(self.input_fn)
+        manifest = RunManifest(self.fn)
+        fingerprint = manifest.input_fingerprint(parser)
+        manifest.update('FileParser', fingerprint)
+        manifest = RunManifest(self.fn)
+        self.assertTrue(manifest.is_current(
+            'FileParser', manifest.input_fingerprint(parser)))
+        self.write_input('fin\n', time.time() + 10)
+        self.assertFalse(manifest.is_current(
+            'FileParser', manifest.input_fingerprint(parser)))
+
+    def test_config_in_fingerprint(self):
+        parser = FileParser(self.input_fn)
+        self.assertNotEqual(
+            RunManifest(self.fn, {'extended': False}).input_fingerprint(
+                parser),
+            RunManifest(self.fn, {'extended': True}).input_fingerprint(
+                parser))
+
+    def test_no_input(self):
+        manifest = RunManifest(self.fn)
+        self.assertIsNone(manifest.input_fingerprint(A([])))
+        self.assertFalse(manifest.is_current('A', None))
+
+    def test_output_fingerprint(self):
+        manifest = RunManifest(self.fn)
+        parser = A([])
+        a = manifest.output_fingerprint(parser, [
+            {'sil': 'hun', 'alt_names': set(['Magyar', 'Ungarisch']),
+             'other_codes': {'glotto': 'hung1274', 'wiki': 'hu'}}])
+        b = manifest.output_fingerprint(parser, [
+            {'other_codes': {'wiki': 'hu', 'glotto': 'hung1274'},
+             'alt_names': set(['Ungarisch', 'Magyar']), 'sil': 'hun',
+             '_match': ([1], 'sil')}])
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, manifest.output_fingerprint(
+            parser, [{'sil': 'fin'}]))
+
+
+class DedupCodesTest(TransactionTestCase):
+
+    def setUp(self):
+        self.langs = [Language.objects.create(sil=sil)
+                      for sil in ['aaa', 'bbb']]
+        Parser.objects.create(classname='First')
+        self.cursor = connection.cursor()
+        # the tables as they were before codes were shared
+        with connection.schema_editor() as editor:
+            editor.delete_model(LanguageCode)
+            editor.delete_model(Code)
+        for query in [
+                """CREATE TABLE dld_code (
+                id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+                code_name varchar(100) NOT NULL,
+                code varchar(100) NOT NULL)""",
+                """CREATE TABLE dld_language_code (
+                id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+                language_id integer NOT NULL, code_id integer NOT NULL,
+                UNIQUE (language_id, code_id))"""]:
+            self.cursor.execute(query)
+        a, b = [l.pk for l in self.langs]
+        self.cursor.executemany(
+            "INSERT INTO dld_code (code_name, code) VALUES (%s, %s)",
+            [('glotto', 'hung1274'), ('glotto', 'hung1274'), ('wiki', 'hu')])
+        self.cursor.executemany(
+            "INSERT INTO dld_language_code (language_id, code_id) "
+            "VALUES (%s, %s)", [(a, 1), (a, 2), (b, 2), (a, 3)])
+        Contribution.objects.create(parser_id='First', language_id=b,
+                                    kind='code', object_id=2)
+
+    def tearDown(self):
+        with connection.schema_editor() as editor:
+            editor.delete_model(LanguageCode)
+            editor.delete_model(Code)
+            editor.create_model(Code)
+            editor.create_model(LanguageCode)
+
+    def links(self):
+        return sorted(LanguageCode.objects.values_list(
+            'language__sil', 'code__code_name', 'code__code', 'count'))
+
+    def test_dedup_codes(self):
+        dedup_codes(False)
+        expected = [('aaa', 'glotto', 'hung1274', 2),
+                    ('aaa', 'wiki', 'hu', 1),
+                    ('bbb', 'glotto', 'hung1274', 1)]
+        self.assertEqual(self.links(), expected)
+        self.assertEqual(sorted(Code.objects.values_list('id', flat=True)),
+                         [1, 3])
+        self.assertEqual(Contribution.objects.get(kind='code').object_id,
+                         '1')
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Code.objects.create(code_name='wiki', code='hu')
+        # migrated already
+        dedup_codes(False)
+        self.assertEqual(self.links(), expected)
+
+    def test_without_contributions(self):
+        # databases older than the contributions of the parsers
+        with connection.schema_editor() as editor:
+            editor.delete_model(Contribution)
+        try:
+            dedup_codes(False)
+        finally:
+            with connection.schema_editor() as editor:
+                editor.create_model(Contribution)
+        self.assertEqual(self.links(), [('aaa', 'glotto', 'hung1274', 2),
+                                        ('aaa', 'wiki', 'hu', 1),
+                                        ('bbb', 'glotto', 'hung1274', 1)])
+
+
+class FuzzyIndexTest(SimpleTestCase):
+
+    names = [u'Hungarian', u'Hungarian Sign Language', u'Magyar',
+             u'Bulgarian', u'Hunsrik', u'Old Hungarian', u'Hungarain',
+             u'Mari, Hill', u'Hill Mari', u'Northern Sami']
+
+    def setUp(self):
+        self.index = FuzzyIndex()
+        for i, name in enumerate(self.names):
+            self.index.add(i, name)
+
+    def similarity(self, a, b):
+        a, b = ngrams(a), ngrams(b)
+        return float(len(a & b)) / len(a | b)
+
+    def test_ngrams_normalized(self):
+        self.assertEqual(ngrams(u'Mari, Hill'), ngrams(u'hill mari'))
+
+    def test_search_finds_all_similar(self):
+        for query in [u'Hungarian', u'hungarian language', u'Mari',
+                      u'Sami, Northern', u'Bulgaria']:
+            for threshold in [0.3, 0.5, 0.7]:
+                expected = sorted(
+                    (self.similarity(query, name), i)
+                    for i, name in enumerate(self.names)
+                    if self.similarity(query, name) >= threshold)
+                self.assertEqual(
+                    sorted(self.index.search(query, threshold)), expected)
+
+    def test_best(self):
+        similarity, keys = self.index.best(u'Mari Hill')
+        self.assertEqual((similarity, sorted(keys)), (1.0, [7, 8]))
+        self.assertEqual(self.index.best(u'Quechua'), (None, []))
+
+    def test_remove(self):
+        self.index.remove(0)
+        self.assertNotIn(0, [k for s, k in self.index.search(u'Hungarian')])
+        self.assertEqual(self.index.search(u''), [])
+
+
+class LanguageDBFuzzyTest(TestCase):
+
+    def test_get_fuzzy(self):
+        hun = Language.objects.create(sil='hun', name='Hungarian')
+        Language.objects.create(sil='bul', name='Bulgarian')
+        db = LanguageDB()
+        self.assertEqual(db.get_closest({'name': 'Hungariann'}),
+                         ([], 'altname'))
+        self.assertEqual(db.get_fuzzy({'name': 'Hungariann'}),
+                         ([hun], 'fuzzy'))
+        self.assertEqual(db.get_fuzzy({'name': 'Quechua'}), ([], None))
+
+
+class CandidateScorerTest(SimpleTestCase):
+
+    def features(self, codes=(), countries=(), locations=(), names=()):
+        features = Features()
+        features.codes.update(codes)
+        features.countries.update(countries)
+        features.locations.update(locations)
+        features.names.update(names)
+        return features
+
+    def setUp(self):
+        self.record = self.features(
+            codes=[(u'wals', u'hun')], countries=[u'Hungary'],
+            locations=[(19.0, 47.5)], names=[u'hungarian', u'magyar'])
+        self.scorer = CandidateScorer()
+
+    def test_distance(self):
+        self.assertEqual(distance_km((19.0, 47.5), (19.0, 47.5)), 0.0)
+        # Budapest - Vienna
+        self.assertAlmostEqual(
+            distance_km((19.04, 47.50), (16.37, 48.21)), 214, delta=5)
+        self.assertAlmostEqual(
+            distance_km((0.0, 0.0), (180.0, 0.0)), math.pi * 6371.0)
+
+    def test_score(self):
+        self.assertEqual(self.scorer.score(self.record, self.features()), 0)
+        self.assertEqual(self.scorer.score(self.record, self.record), 7)
+        near = self.features(locations=[(20.0, 47.0), (100.0, 0.0)])
+        far = self.features(locations=[(100.0, 0.0)])
+        self.assertEqual(self.scorer.score(self.record, near), 1)
+        self.assertEqual(self.scorer.score(self.record, far), 0)
+        self.assertEqual(self.scorer.score(
+            self.record, self.features(codes=[(u'wals', u'hun')])), 3)
+
+    def test_choose_best(self):
+        best = self.features(codes=[(u'wals', u'hun')])
+        other = self.features(names=[u'magyar'])
+        self.assertEqual(self.scorer.choose(
+            self.record, ['a', 'b'], [other, best]), ['b'])
+
+    def test_choose_ties(self):
+        best = self.features(codes=[(u'wals', u'hun')])
+        other = self.features(names=[u'magyar'])
+        self.assertEqual(self.scorer.choose(
+            self.record, ['a', 'b', 'c'], [best, other, best]),
+            ['a', 'b', 'c'])
+        self.assertEqual(CandidateScorer(ambiguous='none').choose(
+            self.record, ['a', 'b', 'c'], [best, other, best]), [])
+
+    def test_choose_ambiguous(self):
+        low = self.features(names=[u'hungarian'])
+        high = self.features(codes=[(u'wals', u'hun')])
+        self.assertEqual(CandidateScorer(best=4).choose(
+            self.record, ['a', 'b'], [low, high]), ['a', 'b'])
+        self.assertEqual(CandidateScorer(margin=3).choose(
+            self.record, ['a', 'b'], [low, high]), ['a', 'b'])
+        self.assertEqual(CandidateScorer(best=4, ambiguous='none').choose(
+            self.record, ['a', 'b'], [low, high]), [])
+
+    def test_record_features(self):
+        def find_country(name):
+            return {'Hungary': [(1, u'Hungary')]}.get(name)
+        features = record_features({
+            'name': 'Hungarian', 'native_name': u'magyar nyelv',
+            'alt_names': 'Magyar', 'country': 'Hungary',
+            'other_codes': {'wals': 'hun', 'glotto': ['hung1274', 1274]},
+            'location': [('src', 19.0, '47.5'), ('src', None, 47.5)]},
+            find_country)
+        self.assertEqual(features.codes, set([
+            (u'wals', u'hun'), (u'glotto', u'hung1274'),
+            (u'glotto', u'1274')]))
+        self.assertEqual(features.countries, set([u'Hungary']))
+        self.assertEqual(features.locations, set([(19.0, 47.5)]))
+        self.assertEqual(features.names, set([
+            normalize_alt_name(u'Hungarian'), normalize_alt_name(u'Magyar'),
+            normalize_alt_name(u'magyar nyelv')]))
+        self.assertEqual(record_features(
+            {'country': 'Atlantis'}, find_country).countries, set())
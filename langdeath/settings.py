@@ -67,6 +67,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'langdeath.db.sqlite3'),
+        # a file, not in memory: staging databases attach it (see
+        # ld/staging.py)
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_langdeath.db.sqlite3')},
     }
 }
 
@@ -0,0 +1,113 @@
+import logging
+from collections import OrderedDict
+
+from django.db import connection, IntegrityError
+from django.db.models import Max
+
+# rows inserted by one statement
+BULK_BATCH = 300
+
+# buffered rows and links written out at once
+FLUSH_ROWS = 10000
+
+
+class IdAllocator(object):
+    """Primary keys for the rows of @model created in bulk, as sqlite
+    would assign them (bulk_create does not return them on sqlite). The
+    tables are AUTOINCREMENT ones, so the ids of deleted rows are not
+    reused. Rows of @model must only be created through the allocator."""
+
+    def __init__(self, model):
+        self.model = model
+        self.next_id = None
+
+    def allocate(self):
+        if self.next_id is None:
+            self.next_id = self.last_id() + 1
+        pk = self.next_id
+        self.next_id += 1
+        return pk
+
+    def last_id(self):
+        last = self.model.objects.aggregate(Max('pk'))['pk__max'] or 0
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s",
+                           [self.model._meta.db_table])
+            row = cursor.fetchone()
+        if row is not None:
+            last = max(last, row[0])
+        return last
+
+
+class BulkWriter(object):
+    """Unit of work of LanguageDB: new rows and the links of many to many
+    fields are buffered, and written with a few bulk_create statements
+    when flushed, rows first, in the order they were created. Values are
+    checked when a row is created, so a bad value fails its own row (as
+    with save()), not the whole flush. The writer does not flush itself
+    when full, as the errors of a record are caught per attribute."""
+
+    def __init__(self):
+        self.allocators = {}
+        self.rows = OrderedDict()
+        self.links = OrderedDict()
+        self.pending = 0
+
+    def create(self, model, **kwargs):
+        """New @model instance with its primary key set, written when
+        flushed"""
+        obj = model(**kwargs)
+        self.check(obj)
+        if model not in self.allocators:
+            self.allocators[model] = IdAllocator(model)
+        obj.pk = self.allocators[model].allocate()
+        self.insert(obj)
+        return obj
+
+    def insert(self, obj):
+        """Writes @obj, which has its primary key, when flushed"""
+        self.rows.setdefault(type(obj), []).append(obj)
+        self.add_pending()
+
+    def link(self, lang, field_name, obj):
+        """Links @obj to @lang in the many to many field @field_name, which
+        must not be linked yet"""
+        field = lang._meta.get_field(field_name)
+        through = field.remote_field.through
+        self.links.setdefault(through, []).append(through(**{
+            field.m2m_field_name(): lang,
+            field.m2m_reverse_field_name(): obj}))
+        self.add_pending()
+
+    def check(self, obj):
+        for field in obj._meta.concrete_fields:
+            if field.primary_key:
+                continue
+            value = getattr(obj, field.attname)
+            if value is None and not field.null:
+                raise IntegrityError("NOT NULL constraint failed: "
+                                     "{0}.{1}".format(obj._meta.db_table,
+                                                      field.column))
+            field.get_db_prep_save(value, connection)
+
+    def add_pending(self):
+        self.pending += 1
+
+    def full(self):
+        """True if FLUSH_ROWS rows and links are buffered; the owner of the
+        writer flushes it then, between updates"""
+        return self.pending >= FLUSH_ROWS
+
+    def flush(self):
+        """Writes out the buffered rows and links. If that fails, they are
+        kept, and part of them may be written: the transaction has to be
+        rolled back."""
+        if self.pending == 0:
+            return
+        logging.debug("Writing {0} rows and links".format(self.pending))
+        for buffers in [self.rows, self.links]:
+            for model, objs in buffers.iteritems():
+                model.objects.bulk_create(objs, batch_size=BULK_BATCH)
+        self.rows.clear()
+        self.links.clear()
+        self.pending = 0
@@ -0,0 +1,168 @@
+import math
+from collections import defaultdict
+
+from dld.models import normalize_alt_name, Coordinates, Language
+
+from ld.language_index import db_text
+
+# score of a feature the record shares with a candidate
+SCORE_WEIGHTS = {'codes': 3.0, 'countries': 1.0, 'locations': 1.0,
+                 'names': 1.0}
+
+# locations closer than this many kilometres are taken as the same place
+LOCATION_KM = 300.0
+
+# least score of the best candidate for updating only that one
+CHOOSE_BEST = 2.0
+
+# least lead of the best candidate over the second one
+CHOOSE_MARGIN = 1.0
+
+# candidates updated when none of them is chosen: 'all' or 'none'
+AMBIGUOUS = 'all'
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def distance_km(a, b):
+    """Great-circle distance of the (longitude, latitude) points @a, @b"""
+    lon1, lat1, lon2, lat2 = [math.radians(x) for x in a + b]
+    h = math.sin((lat2 - lat1) / 2) ** 2 + \
+        math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def code_feature(src, code):
+    if not isinstance(code, basestring):
+        code = unicode(code)
+    return db_text(src), db_text(code)
+
+
+def name_feature(name):
+    return normalize_alt_name(db_text(name))
+
+
+def location_feature(lon, lat):
+    if lon is None or lat is None:
+        return None
+    return float(lon), float(lat)
+
+
+class Features(object):
+    """What a record or a language is compared by: its codes as
+    (code_name, code) pairs, the names of its countries, its locations as
+    (longitude, latitude) pairs, and its names, native names and
+    alternative names, normalized as alternative names"""
+
+    __slots__ = ['codes', 'countries', 'locations', 'names']
+
+    def __init__(self):
+        self.codes = set()
+        self.countries = set()
+        self.locations = set()
+        self.names = set()
+
+    def add(self, kind, value):
+        if value is not None:
+            getattr(self, kind).add(value)
+
+
+def record_features(lang, find_country):
+    """Features of the record @lang of a parser; @find_country returns the
+    (pk, name) pairs of the countries a name stands for, or None"""
+    features = Features()
+    for src, code in lang.get('other_codes', {}).iteritems():
+        for c in code if type(code) == list else [code]:
+            features.add('codes', code_feature(src, c))
+    for key in ['name', 'native_name']:
+        if lang.get(key):
+            features.add('names', name_feature(lang[key]))
+    alt_names = lang.get('alt_names', [])
+    if isinstance(alt_names, basestring):
+        alt_names = [alt_names]
+    for name in alt_names:
+        if name:
+            features.add('names', name_feature(name))
+    if lang.get('country') is not None:
+        for pk, name in find_country(lang['country']) or []:
+            features.add('countries', name)
+    for src, lon, lat in lang.get('location', []):
+        features.add('locations', location_feature(lon, lat))
+    return features
+
+
+class LanguageFeatures(object):
+    """Features of the languages of the database by their ids, read with
+    a few queries on first use, then kept up to date by LanguageDB"""
+
+    def __init__(self):
+        self.features = None
+
+    def load(self):
+        self.features = defaultdict(Features)
+        for pk, name, native_name, lon, lat in Language.objects.values_list(
+                'id', 'name', 'native_name', 'longitude', 'latitude'):
+            for n in [name, native_name]:
+                if n:
+                    self.features[pk].add('names', name_feature(n))
+            self.features[pk].add('locations', location_feature(lon, lat))
+        through = Language.code.through.objects
+        for pk, src, code in through.values_list(
+                'language_id', 'code__code_name', 'code__code'):
+            self.features[pk].add('codes', code_feature(src, code))
+        alt_name_id = Language.alt_name.through._meta.get_field(
+            'alternativename').attname
+        for pk, name in Language.alt_name.through.objects.values_list(
+                'language_id', alt_name_id):
+            self.features[pk].add('names', name)
+        for pk, name in Language.country.through.objects.values_list(
+                'language_id', 'country__name'):
+            self.features[pk].add('countries', name)
+        for pk, lon, lat in Coordinates.objects.values_list(
+                'language_id', 'longitude', 'latitude'):
+            self.features[pk].add('locations', location_feature(lon, lat))
+
+    def get(self, pk):
+        if self.features is None:
+            self.load()
+        return self.features[pk]
+
+    def add(self, pk, kind, value):
+        """Adds a feature of a language, if the features are loaded"""
+        if self.features is not None:
+            self.features[pk].add(kind, value)
+
+
+class CandidateScorer(object):
+    """Chooses the candidates of an ambiguous record to update by the
+    features they share with it: the best candidate alone, if its score is
+    at least @best and leads the others by at least @margin, otherwise
+    all of them or none (@ambiguous)"""
+
+    def __init__(self, best=CHOOSE_BEST, margin=CHOOSE_MARGIN,
+                 ambiguous=AMBIGUOUS, weights=SCORE_WEIGHTS):
+        self.best = best
+        self.margin = margin
+        self.ambiguous = ambiguous
+        self.weights = weights
+
+    def score(self, record, features):
+        score = 0.0
+        for kind in ['codes', 'countries', 'names']:
+            shared = getattr(record, kind) & getattr(features, kind)
+            score += self.weights[kind] * len(shared)
+        if any(distance_km(a, b) < LOCATION_KM
+               for a in record.locations for b in features.locations):
+            score += self.weights['locations']
+        return score
+
+    def choose(self, record, candidates, features):
+        """The ones of @candidates to update; @features are theirs, in
+        the same order"""
+        scores = [self.score(record, f) for f in features]
+        ranked = sorted(scores, reverse=True)
+        if ranked[0] >= self.best and ranked[0] - ranked[1] >= self.margin:
+            return [c for c, s in zip(candidates, scores) if s == ranked[0]]
+        if self.ambiguous == 'all':
+            return list(candidates)
+        return []
@@ -0,0 +1,60 @@
+import logging
+from collections import defaultdict
+
+from dld.models import Country, CountryName
+
+from ld.language_index import db_text
+
+
+class CountryResolver(object):
+    """Countries by their names and alternative names (CountryName), read
+    from the database once, on first use. The tables do not change during
+    a run (see load_country_data.py)."""
+
+    def __init__(self):
+        self.by_name = None
+        self.by_alias = None
+        # unknown names, with the number of times they were looked up
+        self.unknown = defaultdict(int)
+
+    def load(self):
+        # the first country of a name, as a query for the name returns it
+        self.by_name = {}
+        for pk, name in Country.objects.order_by('pk').values_list(
+                'pk', 'name'):
+            self.by_name.setdefault(name, (pk, name))
+        self.by_alias = defaultdict(list)
+        for name, pk, country in CountryName.objects.order_by(
+                'pk').values_list('name', 'country_id', 'country__name'):
+            self.by_alias[name].append((pk, country))
+
+    def find(self, name):
+        """(pk, name) pairs of the countries @name stands for: the country
+        of that name, or else the countries it is an alternative name of;
+        None if it is unknown"""
+        if self.by_name is None:
+            self.load()
+        name = db_text(name)
+        if name in self.by_name:
+            return [self.by_name[name]]
+        return self.by_alias.get(name)
+
+    def resolve(self, name):
+        """find, counting the lookups of unknown names"""
+        countries = self.find(name)
+        if countries is None:
+            self.unknown[db_text(name)] += 1
+        return countries
+
+    def is_reported(self, name):
+        """True if the unknown @name was looked up before"""
+        return self.unknown.get(db_text(name), 0) > 1
+
+    def log_unknown(self):
+        """Logs the unknown names looked up again since the last call"""
+        repeated = dict((k, v) for k, v in self.unknown.iteritems() if v > 1)
+        if len(repeated) > 0:
+            logging.warning("Unknown countries found again, with the number "
+                            "of times they were found: {0}".format(repeated))
+        for name in repeated:
+            self.unknown[name] = 1
@@ -0,0 +1,79 @@
+import math
+from collections import defaultdict
+
+from dld.models import normalize_alt_name
+
+# least similarity of the names matched by default
+FUZZY_THRESHOLD = 0.7
+
+# length of the character n-grams names are compared by
+NGRAM = 3
+
+
+def ngrams(text):
+    """Character trigrams of @text normalized as an alternative name
+    (lowercase, without punctuation, words sorted), padded with spaces so
+    that the ends of the name count too"""
+    padded = u'  {0} '.format(normalize_alt_name(text))
+    return frozenset(padded[i:i + NGRAM]
+                     for i in xrange(len(padded) - NGRAM + 1))
+
+
+class FuzzyIndex(object):
+    """Names by their character trigrams, for finding the names similar
+    to a name that is not in the database. The similarity of two names is
+    the Jaccard index of their trigram sets (shared / all trigrams), as
+    in postgresql's pg_trgm. Names (unicode) are added with a key, the
+    index returns the keys of the names it finds."""
+
+    def __init__(self):
+        self.grams = {}
+        self.postings = defaultdict(set)
+
+    def add(self, key, text):
+        if not text or key in self.grams:
+            return
+        grams = ngrams(text)
+        self.grams[key] = grams
+        for gram in grams:
+            self.postings[gram].add(key)
+
+    def remove(self, key):
+        for gram in self.grams.pop(key, ()):
+            self.postings[gram].discard(key)
+            if len(self.postings[gram]) == 0:
+                del self.postings[gram]
+
+    def search(self, text, threshold=FUZZY_THRESHOLD):
+        """(similarity, key) pairs of the names at least @threshold
+        similar to @text, most similar first"""
+        if not text:
+            return []
+        query = ngrams(text)
+        # a name sharing less than this many trigrams is not similar
+        # enough, so it has one of the rarest len(query) - needed + 1
+        # trigrams of @text (prefix filtering): only their postings are
+        # read, not the postings of the common trigrams
+        needed = max(1, int(math.ceil(threshold * len(query))))
+        rarest = sorted(query, key=lambda g: len(self.postings.get(g, ())))
+        candidates = set()
+        for gram in rarest[:len(query) - needed + 1]:
+            candidates.update(self.postings.get(gram, ()))
+        results = []
+        for key in candidates:
+            grams = self.grams[key]
+            shared = len(query & grams)
+            similarity = float(shared) / (len(query) + len(grams) - shared)
+            if similarity >= threshold:
+                results.append((similarity, key))
+        results.sort(key=lambda r: (-r[0], r[1]))
+        return results
+
+    def best(self, text, threshold=FUZZY_THRESHOLD):
+        """(similarity, keys) of the names most similar to @text, if they
+        are at least @threshold similar; (None, []) otherwise"""
+        results = self.search(text, threshold)
+        if len(results) == 0:
+            return None, []
+        return results[0][0], [key for similarity, key in results
+                               if similarity == results[0][0]]
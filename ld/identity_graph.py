@@ -0,0 +1,147 @@
+import logging
+from collections import defaultdict
+
+from dld.models import normalize_alt_name
+
+from ld.language_index import db_text
+
+# code types identifying a language across parsers
+IDENTITY_CODES = set(['glotto', 'linglist', 'bcp_47', 'wiki', 'wiki_inc'])
+
+
+def identity_keys(lang):
+    """Identifiers of the record @lang: its sil, its codes of the
+    IDENTITY_CODES types and its normalized name"""
+    keys = []
+    if 'sil' in lang:
+        keys.append(('sil', db_text(lang['sil'])))
+    for src, code in lang.get('other_codes', {}).iteritems():
+        if src not in IDENTITY_CODES:
+            continue
+        for c in code if type(code) == list else [code]:
+            keys.append(('code', src, db_text(c if isinstance(c, basestring)
+                                              else unicode(c))))
+    if lang.get('name'):
+        keys.append(('name', normalize_alt_name(db_text(lang['name']))))
+    return keys
+
+
+class IdentityGraph(object):
+    """Records of all parsers clustered into language identities: records
+    sharing an identifier (see identity_keys) are in the same cluster.
+    A cluster that would hold two different sils is split by the stronger
+    identifiers only: sils and codes, then sils alone. A name is not an
+    identifier if the records having it have different sils or codes of a
+    type (homonyms). The clusters depend on the records only, not on the
+    order they are added in. Records are numbered in that order;
+    union-find with path compression and union by size makes clustering
+    linear in the number of identifiers."""
+
+    def __init__(self):
+        # identifiers of every record
+        self.keys = []
+        self.parent = []
+        self.size = []
+        self.sils = set()
+        self.conflicts = 0
+
+    def add(self, lang):
+        """Adds the record @lang; returns its number"""
+        i = len(self.keys)
+        self.keys.append(identity_keys(lang))
+        self.parent.append(i)
+        self.size.append(1)
+        if 'sil' in lang:
+            self.sils.add(lang['sil'])
+        return i
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i, j):
+        i, j = self.find(i), self.find(j)
+        if i == j:
+            return
+        if self.size[i] < self.size[j]:
+            i, j = j, i
+        self.parent[j] = i
+        self.size[i] += self.size[j]
+
+    def homonyms(self):
+        """Name identifiers of records having different identifiers of a
+        kind: no sil or code of that type is common to all of them"""
+        common = {}
+        for keys in self.keys:
+            ids = defaultdict(set)
+            for key in keys:
+                if key[0] == 'sil':
+                    ids['sil'].add(key[1])
+                elif key[0] == 'code':
+                    ids[key[1]].add(key[2])
+            for key in keys:
+                if key[0] != 'name':
+                    continue
+                shared = common.setdefault(key, {})
+                for kind, values in ids.iteritems():
+                    shared[kind] = shared.get(kind, values) & values
+        return set(key for key, shared in common.iteritems()
+                   if any(len(v) == 0 for v in shared.itervalues()))
+
+    def link(self, records, kinds, ignored):
+        """Clusters of @records linked by their identifiers of @kinds,
+        except the @ignored ones; lists of record numbers in ascending
+        order"""
+        for i in records:
+            self.parent[i] = i
+            self.size[i] = 1
+        first = {}
+        for i in records:
+            for key in self.keys[i]:
+                if key[0] not in kinds or key in ignored:
+                    continue
+                if key in first:
+                    self.union(first[key], i)
+                else:
+                    first[key] = i
+        clusters = defaultdict(list)
+        order = []
+        for i in records:
+            root = self.find(i)
+            if root not in clusters:
+                order.append(root)
+            clusters[root].append(i)
+        return [clusters[root] for root in order]
+
+    def split(self, records, levels, ignored):
+        """Clusters of @records by the identifiers of levels[0], those
+        holding different sils split by the following levels"""
+        result = []
+        for cluster in self.link(records, levels[0], ignored):
+            sils = set(self.keys[i][0] for i in cluster
+                       if self.keys[i] and self.keys[i][0][0] == 'sil')
+            if len(sils) > 1 and len(levels) > 1:
+                self.conflicts += 1
+                result.extend(self.split(cluster, levels[1:], ignored))
+            else:
+                result.append(cluster)
+        return result
+
+    def clusters(self):
+        """Lists of the numbers of the records of every cluster, in the
+        order of their first records"""
+        ignored = self.homonyms()
+        self.conflicts = 0
+        clusters = self.split(range(len(self.keys)),
+                              [('sil', 'code', 'name'), ('sil', 'code'),
+                               ('sil',)], ignored)
+        clusters.sort()
+        logging.info("{0} records in {1} clusters, {2} clusters split for "
+                     "having different sils, {3} names of homonyms "
+                     "ignored".format(len(self.keys), len(clusters),
+                                      self.conflicts, len(ignored)))
+        return clusters
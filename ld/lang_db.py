@@ -1,25 +1,121 @@
+import json
 import logging
 import re
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F, Min, Sum
 
 from dld.models import normalize_alt_name, \
                        AlternativeName, \
                        Code, \
+                       Contribution, \
                        Coordinates, \
                        Country, \
-                       CountryName, \
                        EndangeredLevel, \
                        Language, \
+                       LanguageCode, \
                        Parser, \
                        Speaker
 
 from ld.langdeath_exceptions import LangdeathException
+from ld.language_index import LanguageIndex, db_text
+from ld.fuzzy_index import FUZZY_THRESHOLD
+from ld.candidate_scorer import CandidateScorer, LanguageFeatures, \
+    code_feature, location_feature, name_feature, record_features
+from ld.bulk_writer import BulkWriter
+from ld.country_resolver import CountryResolver
 
 card_dir_p = re.compile("((east)|(west)|(north)|(south))")
 
+# number of contributions buffered before writing them out
+CONTRIBUTION_BATCH = 1000
+
+# records resolved at once by resolve_batches
+RESOLVE_BATCH = 1000
+
+# largest number of values in an sql IN (...), below the sqlite limit of
+# query parameters
+MAX_IN_VALUES = 900
+
+# code types integrate_codes takes the code of languages without a sil
+# from, in order of preference, with their notations
+OTHER_CODE_TYPES = [('multiple_sils', 'M'),
+                    ('linglist', 'L'),
+                    ('glotto', 'G'),
+                    ('bcp_47', 'B')]
+
+# fields of Language get_closest looks at
+KEY_FIELDS = set(['sil', 'name', 'native_name'])
+
+# rows created by parsers, by contribution kind
+CREATED_ROWS = {'speaker': Speaker,
+                'endangered_level': EndangeredLevel,
+                'location': Coordinates}
+
+# many to many fields of Language linking existing objects, by
+# contribution kind
+LINKS = {'alt_name': 'alt_name',
+         'country': 'country',
+         'parser': 'parsers'}
+
+
+def code_key(code):
+    """The value of a code as compared in the database"""
+    if isinstance(code, basestring):
+        return code
+    return unicode(code)
+
+
+def changed(old, new):
+    """True if the field value @old is to be updated to @new; text is
+    compared as the database stores it"""
+    if isinstance(old, basestring) and isinstance(new, basestring):
+        return db_text(old) != db_text(new)
+    return old != new
+
+
+def in_chunks(values):
+    values = list(values)
+    for i in xrange(0, len(values), MAX_IN_VALUES):
+        yield values[i:i + MAX_IN_VALUES]
+
 
 class LanguageDB(object):
+    language_class = Language
+
     def __init__(self):
-        self.languages = []
+        self.field_names = set(f.attname for f in
+                               Language._meta.concrete_fields)
+        self.contributor = None
+        self.contributions = []
+        # Parsers by class name
+        self.contributors = {}
+        # fields of Language changed by the update being made, by language
+        # id; update_lang_data saves only these
+        self.dirty = defaultdict(set)
+        # new rows and links, written when flushed
+        self.writer = BulkWriter()
+        # keys of get_closest changed since the last batch resolution or
+        # track_changes, None if not tracked
+        self.touched = None
+        # in-memory index of get_closest, loaded on first use
+        self.index = None
+        # names of the AlternativeNames, loaded on first use
+        self.alt_names = None
+        # ids of the Codes by (code_name, code), loaded on first use
+        self.codes = None
+        # increments of the counts of existing LanguageCode links by
+        # (language_id, code_id), written when flushed
+        self.code_counts = defaultdict(int)
+        # normalized variant of alternative names with cardinal directions
+        # spelled as adjectives (east -> eastern), None if there is none
+        self.cardinal_variants = {}
+        self.country_resolver = CountryResolver()
+        # features the candidates of ambiguous records are scored by,
+        # loaded on first use
+        self.features = LanguageFeatures()
+        self.scorer = CandidateScorer()
         self.spec_fields = set(["other_codes",
                                 "country",
                                 "name",
@@ -37,7 +133,23 @@ class LanguageDB(object):
             self.add_spec_attr(name, data, lang)
         else:
             if data is not None:
-                lang.__dict__[name] = data
+                self.set_field(name, data, lang)
+
+    def set_field(self, name, data, lang):
+        old = lang.__dict__.get(name)
+        if name in KEY_FIELDS:
+            self.touch((name, old))
+            self.touch((name, data))
+            if self.index is not None:
+                self.index.remove((name, old), lang.pk)
+                self.index.add((name, data), lang.pk)
+        if name in self.field_names and changed(old, data):
+            self.record(lang, 'field', field=name, old_value=old,
+                        new_value=data)
+            self.dirty[lang.pk].add(name)
+        if name in ['name', 'native_name'] and data:
+            self.features.add(lang.pk, 'names', name_feature(data))
+        lang.__dict__[name] = data
 
     def add_spec_attr(self, name, data, lang):
         if name == "other_codes":
@@ -65,7 +177,7 @@ class LanguageDB(object):
 
     def add_name(self, data, lang):
         if lang.name == "":
-            lang.name = data
+            self.set_field("name", data, lang)
 
         if data == lang.name:
             return
@@ -74,7 +186,7 @@ class LanguageDB(object):
 
     def add_native_name(self, data, lang):
         if lang.native_name == "":
-            lang.name = data
+            self.set_field("name", data, lang)
 
         if data == lang.native_name:
             return
@@ -90,18 +202,9 @@ class LanguageDB(object):
                 raise LangdeathException("Empty alt_name: original " + \
                   "`{0}', normalized `{1}'".format(data, name))
 
-            try:
-                alt = AlternativeName.objects.get(name=name)
-            except AlternativeName.DoesNotExist:
-                alt = AlternativeName.objects.create(name=name)
-
-            # adding an object that already is associated is a no-op
-            lang.alt_name.add(alt)
-
-            if len(set(name.split()) &
-                   set(["east", "west", "north", "south"])) > 0:
-                name = card_dir_p.sub("\g<1>ern", name)
-                self.add_alt_name(name, lang)
+            while name is not None:
+                self.link_alt_name(name, lang)
+                name = self.get_cardinal_variant(name)
 
         elif type(data) == list or type(data) == set:
             for d in data:
@@ -109,6 +212,35 @@ class LanguageDB(object):
         else:
             raise LangdeathException("LangDB.add_alt_name got unknown type")
 
+    def link_alt_name(self, name, lang):
+        """Links the normalized alternative name @name to @lang, unless it
+        is linked already; the name and the link are written when flushed"""
+        if self.alt_names is None:
+            self.alt_names = set(AlternativeName.objects.values_list(
+                'name', flat=True))
+        index = self.get_index()
+        if index.has(('altname', name), lang.pk):
+            return
+        alt = AlternativeName(name=db_text(name))
+        if alt.name not in self.alt_names:
+            self.writer.insert(alt)
+            self.alt_names.add(alt.name)
+        self.writer.link(lang, 'alt_name', alt)
+        self.record(lang, 'alt_name', object_id=alt.pk)
+        self.features.add(lang.pk, 'names', alt.name)
+        self.touch(('altname', name))
+        index.add(('altname', name), lang.pk)
+
+    def get_cardinal_variant(self, name):
+        if name not in self.cardinal_variants:
+            variant = None
+            if len(set(name.split()) &
+                   set(["east", "west", "north", "south"])) > 0:
+                variant = normalize_alt_name(
+                    card_dir_p.sub("\g<1>ern", name))
+            self.cardinal_variants[name] = variant
+        return self.cardinal_variants[name]
+
     def add_codes(self, data, lang):
         for src, code in data.iteritems():
             if type(code) == list:
@@ -117,33 +249,54 @@ class LanguageDB(object):
             else:
                 self.add_code(src, code, lang)
     
-    def add_code(self, src, code, lang):             
-        c = Code()
-        c.code_name = src
-        c.code = code
-        c.save()
-        lang.save()
-        lang.code.add(c)
-        lang.save()
+    def add_code(self, src, code, lang):
+        c = self.get_code(src, code)
+        index = self.get_index()
+        if index.has(('code', src, code), lang.pk):
+            self.code_counts[(lang.pk, c.pk)] += 1
+        else:
+            self.writer.link(lang, 'code', c)
+            index.add(('code', src, code), lang.pk)
+        self.record(lang, 'code', object_id=c.pk)
+        self.features.add(lang.pk, 'codes', code_feature(src, code))
+        self.touch(('code', src, code_key(code)))
+
+    def get_code(self, src, code):
+        """The Code (code_name, code) is created only if it does not exist"""
+        if self.codes is None:
+            self.codes = dict(((code_name, value), pk) for
+                              code_name, value, pk in
+                              Code.objects.values_list('code_name', 'code',
+                                                       'pk'))
+        key = (db_text(src), db_text(code))
+        if key not in self.codes:
+            self.codes[key] = self.writer.create(Code, code_name=src,
+                                                 code=code).pk
+        return Code(pk=self.codes[key], code_name=key[0], code=key[1])
 
     def add_country(self, data, lang):
+        index = self.get_index()
+        for pk, name in self.resolve_country(data, lang):
+            if not index.has(('country', pk), lang.pk):
+                self.writer.link(lang, 'country', Country(pk=pk, name=name))
+                index.add(('country', pk), lang.pk)
+                self.record(lang, 'country', object_id=pk)
+                self.features.add(lang.pk, 'countries', name)
+
+    def resolve_country(self, data, lang):
+        """(pk, name) pairs of the countries @data stands for; an unknown
+        country is only reported the first time it is found"""
         if data is None:
-            return
+            return []
 
-        cs = Country.objects.filter(name=data)
-        if len(cs) == 0:
-            altnames = CountryName.objects.filter(name=data)
-            if len(altnames) > 0:
-                for altname in altnames:
-                    cname = altname.country.name
-                    self.add_country(cname, lang)
-            else:
-                raise LangdeathException(
-                    "unknown country for sil {0}: {1}".format(
-                        lang.sil, repr(data)))
-        else:
-            c = cs[0]
-            lang.country.add(c)
+        countries = self.country_resolver.resolve(data)
+        if countries is None:
+            if self.country_resolver.is_reported(data):
+                return []
+            raise LangdeathException(
+                "unknown country for sil {0}: {1}".format(
+                    lang.sil, repr(data)))
+        return countries
 
     def add_champion(self, data, lang):
         chs = Language.objects.filter(sil=data)
@@ -158,39 +311,50 @@ class LanguageDB(object):
             msg += " for lang {0} with sil {1}".format(lang.sil, data)
             raise LangdeathException(msg)
         ch = chs[0]
+        if lang.champion_id != ch.pk:
+            self.record(lang, 'field', field='champion_id',
+                        old_value=lang.champion_id, new_value=ch.pk)
+            self.dirty[lang.pk].add('champion_id')
         lang.champion = ch
 
     def add_macrolang(self, data, lang):
         d = list(data)[0] 
         mls = Language.objects.filter(sil=d)
         ml = mls[0] 
+        if lang.macrolang_id != ml.pk:
+            self.record(lang, 'field', field='macrolang_id',
+                        old_value=lang.macrolang_id, new_value=ml.pk)
+            self.dirty[lang.pk].add('macrolang_id')
         lang.macrolang = ml
 
     def add_endangered_levels(self, data, lang):
         for src, level, conf in data:
-            el = EndangeredLevel(src=src[:90], level=level, confidence=conf)
-            el.save()
-            lang.endangered_levels.add(el)
+            el = self.writer.create(EndangeredLevel, language_id=lang.pk,
+                                    src=src[:90], level=level,
+                                    confidence=conf)
+            self.record(lang, 'endangered_level', object_id=el.pk)
 
     def add_location(self, data, lang):
         for src, lon, lat in data:
-            c = Coordinates(src=src[:90], longitude=lon, latitude=lat)
-            c.save()
-            lang.locations.add(c)
+            c = self.writer.create(Coordinates, language_id=lang.pk,
+                                   src=src[:90], longitude=lon, latitude=lat)
+            self.record(lang, 'location', object_id=c.pk)
+            self.features.add(lang.pk, 'locations',
+                              location_feature(lon, lat))
 
     def add_speakers(self, data, lang):
         for src, type_, num in data:
-            s = Speaker(src=src[:90], num=num, l_type=type_)
-            s.save()
-            lang.speakers.add(s)
+            s = self.writer.create(Speaker, language_id=lang.pk,
+                                   src=src[:90], num=num, l_type=type_)
+            self.record(lang, 'speaker', object_id=s.pk)
 
     def add_parser(self, parser_name, lang):
-        try:
-          p = Parser.objects.get(classname=parser_name)
-        except Parser.DoesNotExist:
-          p = Parser.objects.create(classname=parser_name)
-
-        lang.parsers.add(p)
+        p = self.get_parser(parser_name)
+        index = self.get_index()
+        if not index.has(('parser', p.pk), lang.pk):
+            self.writer.link(lang, 'parsers', p)
+            index.add(('parser', p.pk), lang.pk)
+            self.record(lang, 'parser', object_id=p.pk)
 
     def add_new_language(self, lang):
         """Inserts new language to db"""
@@ -199,8 +363,12 @@ class LanguageDB(object):
                             "got non-dict instance")
 
         l = Language.objects.create()
+        if self.index is not None:
+            for name in KEY_FIELDS:
+                self.index.add((name, getattr(l, name)), l.pk)
+        self.record(l, 'new_language')
         self.update_lang_data(l, lang)
-        self.languages.append(l)
+        return l
 
     def update_lang_data(self, l, update):
         """Updates data for @tgt language"""
@@ -208,7 +376,7 @@ class LanguageDB(object):
             raise TypeError("LanguageDB.update_lang_data " +
                             "got non-dict instance as @update")
 
-        if not isinstance(l, Language):
+        if not isinstance(l, self.language_class):
             raise TypeError("LanguageDB.update_lang_data " +
                             "got non-Language instance as @tgt")
 
@@ -224,10 +392,313 @@ class LanguageDB(object):
             except Exception as e:
                 logging.exception(e)
 
-        l.save()
+        # records mostly confirm stored data; only changed fields are
+        # written, if any
+        update_fields = self.dirty.pop(l.pk, None)
+        if update_fields:
+            try:
+                l.save(update_fields=update_fields)
+            except:
+                # the index and the features may hold values that were not
+                # saved
+                self.index = None
+                self.features = LanguageFeatures()
+                raise
+        # written out here, not while adding attributes, where their errors
+        # would be caught and the buffered data lost
+        if self.writer.full() or \
+           len(self.contributions) >= CONTRIBUTION_BATCH:
+            self.flush()
+
+    def set_contributor(self, parser_name):
+        """Changes made from now on are recorded as the contribution of
+        the parser @parser_name (None turns recording off)"""
+        self.flush()
+        self.country_resolver.log_unknown()
+        if parser_name is None:
+            self.contributor = None
+            return
+        self.contributor = self.get_parser(parser_name)
+
+    def switch_contributor(self, parser_name):
+        """set_contributor without writing out buffered data, for merging
+        the records of many parsers interleaved; contributions keep the
+        parser they were recorded for"""
+        self.contributor = self.get_parser(parser_name)
+
+    def get_parser(self, parser_name):
+        if parser_name not in self.contributors:
+            self.contributors[parser_name], created = \
+                Parser.objects.get_or_create(classname=parser_name)
+        return self.contributors[parser_name]
+
+    def record(self, lang, kind, field='', object_id='', old_value=None,
+               new_value=None):
+        if self.contributor is None:
+            return
+        self.contributions.append(Contribution(
+            parser=self.contributor, language_id=lang.pk, kind=kind,
+            field=field, object_id=unicode(object_id),
+            old_value=json.dumps(old_value),
+            new_value=json.dumps(new_value)))
+
+    def flush(self):
+        """Writes out buffered data; to be called before committing"""
+        try:
+            self.writer.flush()
+            self.flush_code_counts()
+        except:
+            # they may hold names, codes and links that were not written
+            self.reset_caches()
+            raise
+        if len(self.contributions) > 0:
+            Contribution.objects.bulk_create(self.contributions)
+            self.contributions = []
+
+    def flush_code_counts(self):
+        if len(self.code_counts) == 0:
+            return
+        counts = [(n, lang_id, code_id) for (lang_id, code_id), n
+                  in self.code_counts.iteritems()]
+        self.code_counts.clear()
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE {0} SET count = count + %s "
+                "WHERE language_id = %s AND code_id = %s".format(
+                    LanguageCode._meta.db_table), counts)
+
+    def reset_caches(self):
+        """The caches of database content are loaded again when needed"""
+        self.index = None
+        self.alt_names = None
+        self.codes = None
+        self.code_counts.clear()
+        self.features = LanguageFeatures()
+
+    def retract_parser(self, parser_name):
+        """Removes everything the parser @parser_name contributed to the
+        database: created languages and rows, links, and restores the
+        fields it changed unless a later parser changed them again"""
+        self.flush()
+        self.reset_caches()
+        contributions = list(Contribution.objects.filter(
+            parser_id=parser_name).order_by('-id'))
+        logging.info("Retracting {0} contributions of {1}".format(
+            len(contributions), parser_name))
+        langs = Language.objects.in_bulk(
+            set(c.language_id for c in contributions))
+        created_rows = dict((kind, []) for kind in CREATED_ROWS)
+        code_counts = defaultdict(int)
+        new_langs = []
+        for c in contributions:
+            lang = langs[c.language_id]
+            if c.kind == 'field':
+                self.restore_field(c, lang)
+            elif c.kind == 'code':
+                code_counts[(lang.pk, int(c.object_id))] += 1
+            elif c.kind in CREATED_ROWS:
+                created_rows[c.kind].append(int(c.object_id))
+            elif c.kind in LINKS:
+                getattr(lang, LINKS[c.kind]).remove(c.object_id)
+            elif c.kind == 'new_language':
+                new_langs.append(lang.pk)
+        for lang in langs.itervalues():
+            if lang.pk not in new_langs:
+                lang.save()
+        for kind, ids in created_rows.iteritems():
+            CREATED_ROWS[kind].objects.filter(id__in=ids).delete()
+        for (lang_id, code_id), n in code_counts.iteritems():
+            LanguageCode.objects.filter(
+                language_id=lang_id, code_id=code_id).update(
+                    count=F('count') - n)
+        LanguageCode.objects.filter(count__lte=0).delete()
+        Contribution.objects.filter(parser_id=parser_name).delete()
+        # languages referring to removed ones would be deleted too
+        Language.objects.filter(champion_id__in=new_langs).update(
+            champion=None)
+        Language.objects.filter(macrolang_id__in=new_langs).update(
+            macrolang=None)
+        Language.objects.filter(id__in=new_langs).delete()
+        AlternativeName.objects.filter(lang=None).delete()
+        Code.objects.filter(codes=None).delete()
+
+    def restore_field(self, c, lang):
+        if json.dumps(getattr(lang, c.field)) == c.new_value:
+            setattr(lang, c.field, json.loads(c.old_value))
+        else:
+            # a later parser overwrote the value: once it is retracted,
+            # it has to restore the value preceding this contribution
+            Contribution.objects.filter(
+                language_id=c.language_id, kind='field', field=c.field,
+                id__gt=c.id, old_value=c.new_value).update(
+                    old_value=c.old_value)
+
+    def get_languages(self, ids):
+        if len(ids) == 0:
+            return []
+        return list(Language.objects.filter(pk__in=ids).order_by('pk'))
+
+    def touch(self, key):
+        if self.touched is not None:
+            self.touched.add(tuple(db_text(k) for k in key))
+
+    def track_changes(self):
+        """Matches found before this call are checked against the changes
+        made after it (see is_stale)"""
+        self.touched = set()
+
+    def is_stale(self, lang):
+        """True if the languages @lang would be matched to may have
+        changed since it was resolved in advance"""
+        if not self.touched:
+            return False
+        return len(self.get_keys(lang) & self.touched) > 0
+
+    def get_keys(self, lang):
+        """Keys of the languages @lang may be matched to, as touch stores
+        them"""
+        if 'sil' in lang:
+            return set([('sil', db_text(lang['sil']))])
+        keys = set()
+        for src, code in lang.get('other_codes', {}).iteritems():
+            keys.add((u'code', db_text(src), db_text(code_key(code))))
+        if 'name' in lang:
+            name = db_text(lang['name'])
+            keys.add((u'name', name))
+            keys.add((u'native_name', name))
+            keys.add((u'altname', normalize_alt_name(name)))
+        return keys
+
+    def resolve_batches(self, records):
+        """Yields @records, resolved RESOLVE_BATCH at a time with a few
+        queries: '_match' of a lang is the ids of the languages and the clue
+        get_closest would return for it, unless it can not be resolved
+        in advance"""
+        batch = []
+        for lang in records:
+            batch.append(lang)
+            if len(batch) >= RESOLVE_BATCH:
+                for l in self.resolve_batch(batch):
+                    yield l
+                batch = []
+        for l in self.resolve_batch(batch):
+            yield l
+
+    def resolve_batch(self, batch):
+        # the rows of the langs merged so far are looked up too
+        self.flush()
+        self.track_changes()
+        resolvable = [lang for lang in batch if self.is_resolvable(lang)]
+        sils, codes, names, alt_names = set(), set(), set(), set()
+        for lang in resolvable:
+            if 'sil' in lang:
+                sils.add(db_text(lang['sil']))
+                continue
+            for src, code in lang.get('other_codes', {}).iteritems():
+                codes.add(db_text(code_key(code)))
+            if 'name' in lang:
+                names.add(db_text(lang['name']))
+                alt_names.add(db_text(normalize_alt_name(lang['name'])))
+        # the rows found are keyed as in the index, so that the records
+        # are matched to them by get_closest's rules
+        keys = LanguageIndex()
+        languages = Language.objects
+        codes_through = Language.code.through.objects
+        alt_names_through = Language.alt_name.through.objects
+        alt_name_id = Language.alt_name.through._meta.get_field(
+            'alternativename').attname
+        self.load_keys(keys, 'sil', languages, 'id', ['sil'], sils)
+        self.load_keys(keys, 'code', codes_through, 'language_id',
+                       ['code__code_name', 'code__code'], codes)
+        self.load_keys(keys, 'name', languages, 'id', ['name'], names)
+        self.load_keys(keys, 'native_name', languages, 'id', ['native_name'],
+                       names)
+        self.load_keys(keys, 'altname', alt_names_through, 'language_id',
+                       [alt_name_id], alt_names)
+        for lang in resolvable:
+            lang['_match'] = self.find(keys, lang)
+        return batch
+
+    def load_keys(self, keys, kind, queryset, pk, fields, values):
+        """Adds the rows of @queryset having one of @values in the last of
+        @fields to @keys, as (@kind, *fields) keys of the language @pk"""
+        for chunk in in_chunks(values):
+            for row in queryset.filter(
+                    **{fields[-1] + '__in': chunk}).values_list(pk, *fields):
+                keys.add((kind,) + row[1:], row[0])
+
+    def is_resolvable(self, lang):
+        """Langs that get_closest would reject or fail on are left to it"""
+        if not isinstance(lang, dict):
+            return False
+        if 'sil' in lang:
+            return isinstance(lang['sil'], basestring)
+        for code in lang.get('other_codes', {}).itervalues():
+            if type(code) in [list, set, dict]:
+                return False
+        return 'name' not in lang or isinstance(lang['name'], basestring)
+
+    def get_sils(self):
+        return Language.objects.values_list("sil", flat=True)
+
+    def get_index(self):
+        if self.index is None:
+            self.index = LanguageIndex()
+            self.index.load()
+        return self.index
 
     def get_closest(self, lang):
-        """Looks for language that is most similar to lang"""
+        """Looks for language that is most similar to lang; the languages
+        are looked up in the index, the same ones query_closest finds"""
+        if not isinstance(lang, dict):
+            raise TypeError("LanguageDB.get_closest " +
+                            "got non-dict instance as @lang: {0}".format(
+                                repr(lang)))
+
+        ids, clue = self.find(self.get_index(), lang)
+        return self.get_languages(ids), clue
+
+    def find(self, index, lang):
+        """Ids of the languages @lang is matched to in the LanguageIndex
+        @index, and the clue they are found by"""
+        if "sil" in lang:
+            return index.get(('sil', lang['sil'])), 'sil'
+
+        if "other_codes" in lang:
+            for src, code in lang["other_codes"].iteritems():
+                ids = index.get(('code', src, code))
+                if len(ids) > 0:
+                    return ids, 'other_codes'
+
+        if "name" in lang:
+            for key, clue in [('name', 'name'),
+                              ('native_name', 'native_name')]:
+                ids = index.get((key, lang['name']))
+                if len(ids) > 0:
+                    return ids, clue
+
+            ids = index.get(('altname', normalize_alt_name(lang['name'])))
+            return ids, 'altname'
+
+        return [], None
+
+    def get_fuzzy(self, lang, threshold=FUZZY_THRESHOLD):
+        """Looks for the languages having the name or alternative name
+        most similar to the name of @lang (see ld/fuzzy_index.py), for
+        records get_closest finds nothing for"""
+        if "name" not in lang:
+            return [], None
+        similarity, ids = self.get_index().get_similar(lang['name'],
+                                                       threshold)
+        if len(ids) == 0:
+            return [], None
+        logging.debug("{0} is {1:.2f} similar to the names of {2}".format(
+            repr(lang['name']), similarity, ids))
+        return self.get_languages(ids), 'fuzzy'
+
+    def query_closest(self, lang):
+        """get_closest with database queries instead of the index, for
+        checking the index (see benchmark_get_closest.py)"""
         if not isinstance(lang, dict):
             raise TypeError("LanguageDB.get_closest " +
                             "got non-dict instance as @lang: {0}".format(
@@ -265,8 +736,11 @@ class LanguageDB(object):
         return [], None
 
     def choose_candidates(self, lang, l):
-        """TODO later proper candidate selection"""
-        return l
+        """The candidates @l of @lang to update, chosen by the features
+        they share with it (see ld/candidate_scorer.py)"""
+        record = record_features(lang, self.country_resolver.find)
+        return self.scorer.choose(record, l,
+                                  [self.features.get(c.pk) for c in l])
 
     def compile_name_pattern(self):
         self.pname_pattern = re.compile('(Online|Offline){0,1}Parser')
@@ -285,55 +759,77 @@ class LanguageDB(object):
         else:
             return '{}{}'.format(code.ljust(16, '_'), notation)
 
-    def get_other_code(self, codes, code_type):
-        filtered_codes = codes.filter(code_name=code_type).all()
-        if len(filtered_codes) == 0:
-            return
-        co = [pair.code for pair in filtered_codes]
-        return max(set(co), key=co.count)
+    def get_other_code(self, codes, counts):
+        '''
+        most frequent of @codes (distinct, in the order they were first
+        linked), a link counting as many times as the code was added; of
+        equally frequent codes the one linked first
+        '''
+        return max(codes, key=counts.get)
+
+    def get_other_codes(self):
+        '''
+        {language id: {code type: (codes, counts)}} of the code types
+        integrate_codes looks at, summed up by the database
+        '''
+        other_codes = defaultdict(dict)
+        links = LanguageCode.objects\
+                .filter(code__code_name__in=[t for t, _ in OTHER_CODE_TYPES])\
+                .exclude(code__code=None).exclude(code__code='none')\
+                .values('language_id', 'code__code_name', 'code__code')\
+                .annotate(first=Min('pk'), total=Sum('count'))\
+                .order_by('language_id', 'first')
+        for link in links:
+            codes, counts = other_codes[link['language_id']].setdefault(
+                link['code__code_name'], ([], {}))
+            codes.append(link['code__code'])
+            counts[link['code__code']] = link['total']
+        return other_codes
 
     def get_indi_code_mapping(self):
         '''
         sil codes in sil clusters (returned by EndangeredParser)
         get code specified here
         '''
-        ms = [c.code for c in Code.objects.all()
-              .filter(code_name='multiple_sils')]
-        self.indi_codes = dict(
-            sum([[(sil, '{}{}{}'.format(cluster.split(',')[0], sil, i))
-                  for i, sil in enumerate(cluster.split(','))]
-                 for cluster in ms], []))
+        ms = Code.objects.all().filter(code_name='multiple_sils')\
+                .values_list('code', flat=True)
+        self.indi_codes = {}
+        for cluster in ms:
+            sils = cluster.split(',')
+            for i, sil in enumerate(sils):
+                self.indi_codes[sil] = '{}{}{}'.format(sils[0], sil, i)
 
     def integrate_codes(self):
+        self.flush()
         self.compile_name_pattern()
         self.get_indi_code_mapping()
-        for lang in Language.objects.all():
-            sil = lang.sil
+        other_codes = self.get_other_codes()
+        updates = []
+        for pk, sil, iso_active, old in Language.objects.values_list(
+                'id', 'sil', 'iso_active', 'integrated_code'):
             found = False
             if len(sil) == 3:
                 # sil code; active or retired
                 found = True
                 if sil not in self.indi_codes:
                     code = sil
-                    if lang.iso_active:
+                    if iso_active:
                         notation = 'A'
                     else:
                         notation = 'R'
                 else:
                     code = self.indi_codes[sil]
-                    if lang.iso_active:
+                    if iso_active:
                         notation = 'a'
                     else:
                         notation = 'r'
             else:
                 # look for other code
-                other_codes = lang.code.all()\
-                        .exclude(code=None).exclude(code='none')
-                for code_type, notation in [('multiple_sils', 'M'),
-                                            ('linglist', 'L'),
-                                            ('glotto', 'G'),
-                                            ('bcp_47', 'B')]:
-                    code = self.get_other_code(other_codes, code_type)
+                by_type = other_codes.get(pk, {})
+                for code_type, notation in OTHER_CODE_TYPES:
+                    if code_type not in by_type:
+                        continue
+                    code = self.get_other_code(*by_type[code_type])
                     if code:
                         found = True
                         break
@@ -342,5 +838,11 @@ class LanguageDB(object):
                 code = sil
                 notation = 'O'
             formatted = self.format_integrated_code(code, notation)
-            lang.integrated_code = formatted
-            lang.save()
+            if formatted != old:
+                updates.append((formatted, pk))
+        logging.info("Updating {0} integrated codes".format(len(updates)))
+        # one transaction, not one by row
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                "UPDATE {0} SET integrated_code = %s WHERE id = %s".format(
+                    Language._meta.db_table), updates)
@@ -6,3 +6,12 @@ class ParserException(LangdeathException):
 
 class UnknownLanguageException(LangdeathException):
     pass
+
+class ParserWorkerException(LangdeathException):
+    pass
+
+class DependencyException(LangdeathException):
+    pass
+
+class WorkQueueException(LangdeathException):
+    pass
@@ -0,0 +1,96 @@
+from collections import defaultdict
+
+from dld.models import Language
+
+from ld.fuzzy_index import FuzzyIndex
+
+# kinds of keys holding names, looked up by the fuzzy index
+NAME_KEYS = set(['name', 'native_name', 'altname'])
+
+
+def db_text(value):
+    """@value as the ORM compares it to a text column (None matches NULL)"""
+    if value is None or isinstance(value, unicode):
+        return value
+    if isinstance(value, str):
+        return value.decode('utf-8')
+    return unicode(value)
+
+
+class LanguageIndex(object):
+    """Ids of the languages by the keys LanguageDB.get_closest looks them
+    up by: ('sil', sil), ('name', name), ('native_name', native_name),
+    ('code', code_name, code) and ('altname', normalized alternative name),
+    and by the countries and parsers they are linked to, ('country', pk)
+    and ('parser', classname). Loaded from the database once, then kept up
+    to date by LanguageDB as it changes the languages."""
+
+    def __init__(self):
+        self.ids = defaultdict(set)
+        # index of the names of the keys, built on first use
+        self.fuzzy = None
+
+    def load(self):
+        for pk, sil, name, native_name in Language.objects.values_list(
+                'id', 'sil', 'name', 'native_name'):
+            self.add(('sil', sil), pk)
+            self.add(('name', name), pk)
+            self.add(('native_name', native_name), pk)
+        for pk, code_name, code in Language.code.through.objects.values_list(
+                'language_id', 'code__code_name', 'code__code'):
+            self.add(('code', code_name, code), pk)
+        alt_name_id = Language.alt_name.through._meta.get_field(
+            'alternativename').attname
+        for pk, alt_name in Language.alt_name.through.objects.values_list(
+                'language_id', alt_name_id):
+            self.add(('altname', alt_name), pk)
+        for pk, country_id in Language.country.through.objects.values_list(
+                'language_id', 'country_id'):
+            self.add(('country', country_id), pk)
+        for pk, parser_id in Language.parsers.through.objects.values_list(
+                'language_id', 'parser_id'):
+            self.add(('parser', parser_id), pk)
+
+    def key(self, key):
+        return key[:1] + tuple(db_text(v) for v in key[1:])
+
+    def add(self, key, pk):
+        key = self.key(key)
+        if self.fuzzy is not None and key[0] in NAME_KEYS:
+            self.fuzzy.add(key, key[1])
+        self.ids[key].add(pk)
+
+    def remove(self, key, pk):
+        key = self.key(key)
+        ids = self.ids.get(key)
+        if ids is not None:
+            ids.discard(pk)
+            if len(ids) == 0:
+                del self.ids[key]
+                if self.fuzzy is not None:
+                    self.fuzzy.remove(key)
+
+    def has(self, key, pk):
+        return pk in self.ids.get(self.key(key), ())
+
+    def get(self, key):
+        """Ids of the languages having @key, in ascending order"""
+        return sorted(self.ids.get(self.key(key), ()))
+
+    def get_fuzzy(self):
+        if self.fuzzy is None:
+            self.fuzzy = FuzzyIndex()
+            for key in self.ids:
+                if key[0] in NAME_KEYS:
+                    self.fuzzy.add(key, key[1])
+        return self.fuzzy
+
+    def get_similar(self, name, threshold):
+        """(similarity, ids) of the languages having the names most similar
+        to @name, if they are at least @threshold similar; the ids are in
+        ascending order"""
+        similarity, keys = self.get_fuzzy().best(db_text(name), threshold)
+        ids = set()
+        for key in keys:
+            ids.update(self.ids[key])
+        return similarity, sorted(ids)
@@ -0,0 +1,277 @@
+import json
+import logging
+from collections import defaultdict
+
+from dld.models import normalize_alt_name, \
+                       Language
+
+from ld.lang_db import LanguageDB, code_key
+from ld.fuzzy_index import FuzzyIndex, FUZZY_THRESHOLD
+from ld.language_index import db_text
+from ld.candidate_scorer import Features, code_feature, location_feature, \
+    name_feature, record_features
+from ld.langdeath_exceptions import LangdeathException
+
+# fields of Language not written to snapshots
+SNAPSHOT_SKIPPED_FIELDS = set(['id', 'last_updated', 'champion_id',
+                               'macrolang_id'])
+
+
+class MemoryLanguage(object):
+    """In-memory counterpart of dld.models.Language; many to many fields
+    are plain lists"""
+
+    def __init__(self, pk, defaults):
+        self.__dict__.update(defaults)
+        self.pk = self.id = pk
+        self.codes = []
+        self.alt_names = []
+        self.countries = []
+        self.speakers = []
+        self.endangered_levels = []
+        self.locations = []
+        self.parsers = []
+
+    def save(self, **kwargs):
+        pass
+
+
+class MemoryLanguageDB(LanguageDB):
+    """LanguageDB resolving and merging languages in memory, for dry runs
+    of the ParserAggregator: nothing is written to the database, the result
+    is a snapshot file (see write_snapshot). Countries are read from the
+    database once."""
+
+    language_class = MemoryLanguage
+
+    def __init__(self):
+        super(MemoryLanguageDB, self).__init__()
+        self.languages = []
+        self.defaults = dict((f.attname, f.get_default()) for f in
+                             Language._meta.concrete_fields)
+        self.by_pk = {}
+        # keyed by the values as the database compares them (see db_text)
+        self.by_sil = defaultdict(list)
+        self.by_code = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self.by_native_name = defaultdict(list)
+        self.by_alt_name = defaultdict(list)
+        self.indexes = {'sil': self.by_sil, 'name': self.by_name,
+                        'native_name': self.by_native_name}
+        # index of the names, alternative names keyed as 'altname', built
+        # on first use
+        self.fuzzy = None
+
+    def set_contributor(self, parser_name):
+        self.country_resolver.log_unknown()
+
+    def switch_contributor(self, parser_name):
+        pass
+
+    def resolve_batches(self, records):
+        # lookups are cheap in memory
+        return records
+
+    def get_languages(self, ids):
+        return [self.by_pk[pk] for pk in ids]
+
+    def get_sils(self):
+        return [l.sil for l in self.languages]
+
+    def set_field(self, name, data, lang):
+        index = self.indexes.get(name)
+        if index is not None:
+            old, new = db_text(getattr(lang, name)), db_text(data)
+            index[old].remove(lang)
+            index[new].append(lang)
+            if self.fuzzy is not None and name != 'sil':
+                if len(index[old]) == 0:
+                    self.fuzzy.remove((name, old))
+                self.fuzzy.add((name, new), new)
+        lang.__dict__[name] = data
+
+    def add_alt_name(self, data, lang):
+        if type(data) == str or type(data) == unicode:
+            name = normalize_alt_name(data)
+
+            if not name or not data:
+                raise LangdeathException("Empty alt_name: original " + \
+                  "`{0}', normalized `{1}'".format(data, name))
+
+            while name is not None:
+                key = db_text(name)
+                if key not in lang.alt_names:
+                    lang.alt_names.append(key)
+                    self.by_alt_name[key].append(lang)
+                    if self.fuzzy is not None:
+                        self.fuzzy.add(('altname', key), key)
+                name = self.get_cardinal_variant(name)
+
+        elif type(data) == list or type(data) == set:
+            for d in data:
+                self.add_alt_name(d, lang)
+        else:
+            raise LangdeathException("LangDB.add_alt_name got unknown type")
+
+    def add_code(self, src, code, lang):
+        lang.codes.append((src, code))
+        self.by_code[self.code_key(src, code)].append(lang)
+
+    def code_key(self, src, code):
+        return db_text(src), db_text(code_key(code))
+
+    def add_country(self, data, lang):
+        for pk, name in self.resolve_country(data, lang):
+            if name not in lang.countries:
+                lang.countries.append(name)
+
+    def add_champion(self, data, lang):
+        chs = self.by_sil[db_text(data)]
+
+        if len(chs) == 0:
+            msg = "champion code {}".format(lang.sil)
+            msg += " is not in database, so this champion doesn't get added"
+            raise LangdeathException(msg)
+
+        if len(chs) > 1:
+            msg = "champion field {0} is not deterministic".format(chs)
+            msg += " for lang {0} with sil {1}".format(lang.sil, data)
+            raise LangdeathException(msg)
+        lang.champion_id = chs[0].pk
+
+    def add_macrolang(self, data, lang):
+        d = list(data)[0]
+        lang.macrolang_id = self.by_sil[db_text(d)][0].pk
+
+    def add_endangered_levels(self, data, lang):
+        for src, level, conf in data:
+            lang.endangered_levels.append((src[:90], level, conf))
+
+    def add_location(self, data, lang):
+        for src, lon, lat in data:
+            lang.locations.append((src[:90], lon, lat))
+
+    def add_speakers(self, data, lang):
+        for src, type_, num in data:
+            lang.speakers.append((src[:90], type_, num))
+
+    def add_parser(self, parser_name, lang):
+        if parser_name not in lang.parsers:
+            lang.parsers.append(parser_name)
+
+    def add_new_language(self, lang):
+        """Inserts new language to memory"""
+        if not isinstance(lang, dict):
+            raise TypeError("LanguageDB.add_new_language " +
+                            "got non-dict instance")
+
+        l = MemoryLanguage(len(self.languages) + 1, self.defaults)
+        self.by_pk[l.pk] = l
+        for name, index in self.indexes.iteritems():
+            index[db_text(getattr(l, name))].append(l)
+        self.update_lang_data(l, lang)
+        self.languages.append(l)
+        return l
+
+    def get_closest(self, lang):
+        """Looks for language that is most similar to lang"""
+        if not isinstance(lang, dict):
+            raise TypeError("LanguageDB.get_closest " +
+                            "got non-dict instance as @lang: {0}".format(
+                                repr(lang)))
+
+        if "sil" in lang:
+            return list(self.by_sil.get(db_text(lang['sil']), [])), 'sil'
+
+        if "other_codes" in lang:
+            for src, code in lang["other_codes"].iteritems():
+                if type(code) == list:
+                    continue
+                languages = self.distinct(
+                    self.by_code.get(self.code_key(src, code), []))
+                if len(languages) > 0:
+                    return languages, 'other_codes'
+
+        if "name" in lang:
+            name = db_text(lang['name'])
+            languages = self.by_name.get(name, [])
+            if len(languages) > 0:
+                return list(languages), 'name'
+
+            languages = self.by_native_name.get(name, [])
+            if len(languages) > 0:
+                return list(languages), 'native_name'
+
+            languages = self.by_alt_name.get(
+                db_text(normalize_alt_name(lang['name'])), [])
+            return list(languages), 'altname'
+
+        return [], None
+
+    def get_fuzzy(self, lang, threshold=FUZZY_THRESHOLD):
+        if "name" not in lang:
+            return [], None
+        names = {'name': self.by_name, 'native_name': self.by_native_name,
+                 'altname': self.by_alt_name}
+        if self.fuzzy is None:
+            self.fuzzy = FuzzyIndex()
+            for kind, index in names.iteritems():
+                for text, languages in index.iteritems():
+                    if len(languages) > 0:
+                        self.fuzzy.add((kind, text), text)
+        similarity, keys = self.fuzzy.best(db_text(lang['name']), threshold)
+        languages = []
+        for kind, text in keys:
+            languages.extend(names[kind][text])
+        if len(languages) == 0:
+            return [], None
+        return self.distinct(languages), 'fuzzy'
+
+    def choose_candidates(self, lang, l):
+        record = record_features(lang, self.country_resolver.find)
+        return self.scorer.choose(record, l,
+                                  [self.language_features(c) for c in l])
+
+    def language_features(self, l):
+        features = Features()
+        for src, code in l.codes:
+            features.add('codes', code_feature(src, code))
+        for name in [l.name, l.native_name]:
+            if name:
+                features.add('names', name_feature(name))
+        for name in l.alt_names:
+            features.add('names', db_text(name))
+        for name in l.countries:
+            features.add('countries', name)
+        features.add('locations', location_feature(l.longitude, l.latitude))
+        for src, lon, lat in l.locations:
+            features.add('locations', location_feature(lon, lat))
+        return features
+
+    def distinct(self, languages):
+        pks = sorted(set(l.pk for l in languages))
+        return [self.by_pk[pk] for pk in pks]
+
+    def write_snapshot(self, fn, parser_stats):
+        """Writes the languages, with their fields differing from the
+        defaults, and the match statistics of the parsers to @fn (json)"""
+        languages = []
+        for l in self.languages:
+            d = dict((k, v) for k, v in l.__dict__.iteritems()
+                     if k in self.defaults and
+                     k not in SNAPSHOT_SKIPPED_FIELDS and
+                     v != self.defaults[k])
+            if l.champion_id is not None:
+                d['champion'] = self.by_pk[l.champion_id].sil
+            if l.macrolang_id is not None:
+                d['macrolang'] = self.by_pk[l.macrolang_id].sil
+            for k in ['codes', 'alt_names', 'countries', 'speakers',
+                      'endangered_levels', 'locations', 'parsers']:
+                if len(getattr(l, k)) > 0:
+                    d[k] = getattr(l, k)
+            languages.append(d)
+        logging.info("Writing snapshot of {0} languages to {1}".format(
+            len(languages), fn))
+        with open(fn, 'w') as f:
+            json.dump({'languages': languages, 'parsers': parser_stats}, f,
+                      sort_keys=True, separators=(',', ':'))
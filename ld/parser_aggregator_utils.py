@@ -1,68 +1,82 @@
-def get_data(list_):
-    keys, other_codes = get_header(list_)
-    value_list = get_lines(list_, keys, other_codes)
-    return keys + other_codes, value_list
+import gzip
+import os
 
-def write_out_new_langs(list_, fn):
+# columns of the logs of the ParserAggregator
+NEW_LANGS_HEADER = ['name', 'sil', 'other_codes']
+FOUND_LANGS_HEADER = NEW_LANGS_HEADER + ['lang_merged_name', 'merged_by']
+ALTNAMES_HEADER = ['altname', 'altname_of', 'merged_to']
 
-    header_list, value_lists = get_data(list_)
-    fh = open(fn, 'w')
-    fh.write('{}\n'.format('\t'.join(header_list)))
-    fh.write('\n')
-    
-    for value_list in value_lists:
-        fh.write(u'{}\n'.format('\t'.join(value_list)).encode('utf-8'))
 
-def write_out_found_langs(lists, fn):
-    
-    list_ = [l[0] for l in lists]
-    merged_to_list = [l[1] for l in lists]
-    header_list, value_lists = get_data(list_)
-    fh = open(fn, 'w')
-    keys, other_codes = get_header(list_)
-    merged_to_header = ['lang_merged_name', 'merged_by']
-    fh.write('{}\n'.format('\t'.join(keys + other_codes +
-                                    merged_to_header)))
-    fh.write('\n')
-    
-    for i, value_list in enumerate(
-        get_lines(list_, keys, other_codes)):
-        merged_to = merged_to_list[i]
-        fh.write(u'{}\n'.format('\t'.join(value_list + merged_to))
-                 .encode('utf-8'))
+def format_value(v):
+    if v is None or v == set([]):
+        return u''
+    if type(v) in [list, set]:
+        return u';'.join(format_value(e) for e in v)
+    if type(v) == str:
+        return v.decode('utf-8')
+    return unicode(v)
 
-def get_lines(list_, keys, other_codes):
-    all_ = []
-    for d in list_:
-        if 'sil' in d and d['sil'] == set([]):
-            d['sil'] = ''
-        for code in d.get('other_codes', {}):
-            v = d['other_codes'][code]
-            if type(v) == list:
-                d['other_codes'][code] = ';'.join(v)
-        all_.append([d.get(k, '') for k in keys]\
-                + [d.get('other_codes', {}).get(k, '') for k in other_codes])
-    return all_
 
-def get_header(list_):    
-    d = list_[0]
-    keys = set([])
-    other_codes = set([])
-    for d in list_:
-        if 'other_codes' in d:
-            for k in d['other_codes']:
-                other_codes.add(k)
-        if 'name' in d:
-            keys.add('name')
-        if 'sil' in d:
-            keys.add('sil')
-    return list(keys), list(other_codes)        
+def get_lang_values(d):
+    """Values of the columns of NEW_LANGS_HEADER for the lang @d"""
+    other_codes = d.get('other_codes', {})
+    codes = u','.join(u'{0}:{1}'.format(k, format_value(other_codes[k]))
+                      for k in sorted(other_codes))
+    return [format_value(d.get('name')), format_value(d.get('sil')), codes]
 
-def write_out_new_altnames(new_altnames, fn):
-    fh = open(fn, 'w')
-    # header
-    fh.write(u'{}\t{}\t{}\n'.format('altname', 'altname_of', 'merged_to')\
-             .encode('utf-8'))
-    fh.write('\n')
-    for t in new_altnames:
-        fh.write(u'{}\t{}\t{}\n'.format(t[0], t[1], t[2]).encode('utf-8'))
+
+class MergeLog(object):
+    """Tab separated log of a parser, written line by line as the records
+    of the parser are merged. The file is only created if there is a line
+    to write; with @compress, it is gzipped (.gz is added to @fn)."""
+
+    def __init__(self, fn, header, compress=False):
+        self.fn = fn + '.gz' if compress else fn
+        self.header = header
+        self.compress = compress
+        self.f = None
+        self.count = 0
+
+    def open(self, mode):
+        if self.compress:
+            self.f = gzip.open(self.fn, mode)
+        else:
+            self.f = open(self.fn, mode)
+
+    def write(self, values):
+        if self.f is None:
+            self.open('wb')
+            self.write_line(self.header)
+            self.f.write('\n')
+        self.write_line([format_value(v) for v in values])
+        self.count += 1
+
+    def write_line(self, values):
+        self.f.write(u'{}\n'.format(u'\t'.join(values)).encode('utf-8'))
+
+    def tell(self):
+        """Size the log can be truncated to when resuming a run from this
+        point, None if nothing was written. A gzipped log is continued in
+        a new gzip member, so it stays valid when truncated."""
+        if self.f is None:
+            return None
+        if self.compress:
+            self.f.close()
+            self.open('ab')
+        else:
+            self.f.flush()
+        return os.path.getsize(self.fn)
+
+    def restore(self, size, count):
+        """Continues the log written until @size (see tell())"""
+        self.count = count
+        if size is None:
+            return
+        with open(self.fn, 'r+b') as f:
+            f.truncate(size)
+        self.open('ab')
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
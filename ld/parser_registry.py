@@ -0,0 +1,146 @@
+import logging
+import os
+import re
+from importlib import import_module
+
+from ld.langdeath_exceptions import ParserException
+
+# all parsers in their default order: classname, module in ld.parsers and
+# the arguments of the constructor, where
+#   'extended': the extended flag of the aggregator
+#   'res': the resource directory, 'res/<fn>': a file in it
+#   'dump': the data dump of the parser (see res/dump_filenames)
+PARSERS = [
+    ('ParseISO639_3', 'iso_639_3_parser', ('extended',)),
+    ('MacroWPParser', 'macro_wp_parser', ()),
+    ('UrielParser', 'tsv_parser', ('dump',)),
+    ('DbpediaParserAggregator', 'dbpedia_parser_aggregator', ('dump',)),
+    ('EthnologueDumpParser', 'tsv_parser', ('dump',)),
+    ('EthnologueMacroParser', 'tsv_parser', ('res/ethnologue_macro',)),
+    ('GlottologParser', 'glottolog_parser', ()),
+    ('L2Parser', 'tsv_parser', ('res/ethnologue_l2',)),
+    ('CrubadanParser', 'crubadan_parser', ('dump',)),
+    ('LanguageArchivesOfflineParser', 'language_archives_parser',
+     ('dump',)),
+    ('WalsInfoParser', 'wals_info_parser', ('res',)),
+    ('IndigenousParser', 'indigenous_parser', ('res',)),
+    ('BiblesParser', 'bible_org_parser', ()),
+    ('EndangeredResourcesParser', 'endangered_resources_parser', ()),
+    ('LeibzigCorporaParser', 'list_parser', ('res/leipzig_corpora',)),
+    ('SirenLanguagesParser', 'list_parser', ('res/siren_list',)),
+    ('TreeTaggerParser', 'treetagger_parser', ()),
+    ('FindBibleOfflineParser', 'find_bible_parser', ('dump',)),
+    ('WikipediaListOfLanguagesParser', 'list_of_wikipedia_parser',
+     ('res',)),
+    ('WikipediaIncubatorsParser', 'wikipedia_incubators_parser', ('res',)),
+    ('WikipediaAdjustedSizeCounter_WPExtractor', 'wpsize_counter',
+     ('dump',)),
+    ('EndangeredParser', 'endangered_parser',
+     ('res/endangered_ids', 'dump')),
+    ('OmniglotParser', 'omniglot_parser', ('res/mappings/omniglot',)),
+    ('FirefoxParser', 'firefox_parser', ('res/mappings/firefox',)),
+    ('SoftwareSupportParser', 'software_support_parser', ('res',)),
+    ('WPIncubatorAdjustedSizeCounter', 'wpsize_counter', ('dump',)),
+]
+
+# parsers replacing a dump based parser without a dump
+FALLBACKS = {
+    'LanguageArchivesOfflineParser': ('LanguageArchivesOnlineParser',
+                                      'language_archives_parser', ()),
+}
+
+# argument of pickled parsers, their dump is not read
+DUMMY_FN = 'dummy_fn'
+
+
+class ParserRegistry(object):
+    """Knows every parser by its classname, and imports and constructs
+    only the ones selected for a run"""
+
+    def __init__(self, data_dump_dir, pickle_dir, res_dir, extended):
+        self.data_dump_dir = data_dump_dir
+        self.pickle_dir = pickle_dir
+        self.res_dir = res_dir
+        self.extended = extended
+        self.modules = dict((name, module) for name, module, args in PARSERS)
+        self.arguments = dict((name, args) for name, module, args in PARSERS)
+        for name, (fallback, module, args) in FALLBACKS.iteritems():
+            self.modules[fallback] = module
+        mappings_file = "/".join([res_dir, "dump_filenames"])
+        self.dump_fns = dict([l.strip().split('\t')
+                              for l in open(mappings_file)])
+        self.pickles = None
+
+    @property
+    def names(self):
+        return [name for name, module, args in PARSERS]
+
+    def canonical_name(self, name):
+        """Registry name of @name, which may be a fallback parser"""
+        for parser_name, (fallback, module, args) in FALLBACKS.iteritems():
+            if name == fallback:
+                return parser_name
+        if name not in self.modules:
+            raise ParserException("Unknown parser: {0}".format(name))
+        return name
+
+    def select(self, only=None, skip=None):
+        """Names of the parsers to run in their default order: all of them,
+        or the ones in @only, without the ones in @skip"""
+        selected = set(self.names)
+        if only:
+            selected = set(self.canonical_name(n) for n in only)
+        if skip:
+            selected -= set(self.canonical_name(n) for n in skip)
+        return [name for name in self.names if name in selected]
+
+    def get_class(self, name):
+        module = import_module('ld.parsers.{0}'.format(self.modules[name]))
+        return getattr(module, name)
+
+    def create(self, name):
+        """Constructs parser @name, returns None if it has no input"""
+        args = self.arguments[name]
+        if 'dump' in args:
+            pickles, dump_paths = self.check_dirs()
+            if name in pickles:
+                return self.get_class(name)(DUMMY_FN)
+            if name not in dump_paths:
+                if name not in FALLBACKS:
+                    return None
+                name, module, args = FALLBACKS[name]
+        return self.get_class(name)(*[self.argument(a, name)
+                                      for a in args])
+
+    def argument(self, arg, name):
+        if arg == 'dump':
+            return self.dump_paths[name]
+        if arg == 'extended':
+            return self.extended
+        if arg == 'res':
+            return self.res_dir
+        if arg.startswith('res/'):
+            return '{0}/{1}'.format(self.res_dir, arg[4:])
+        return arg
+
+    def check_dirs(self):
+        if self.pickles is not None:
+            return self.pickles, self.dump_paths
+        self.dump_paths = {}
+        pickled_pattern = re.compile('(.*?).pickle$')
+        self.pickles = []
+        for f in os.listdir(self.pickle_dir):
+            matched = pickled_pattern.match(f)
+            if matched != None:
+                base = matched.groups()[0]
+                logging.info('Parser {} will only load {}/{}'.format(
+                    base, self.pickle_dir, f))
+                self.pickles.append(base)
+        files = os.listdir(self.data_dump_dir)
+        for k, v in self.dump_fns.iteritems():
+            if v in files:
+                self.dump_paths[k] = '{}/{}'.format(self.data_dump_dir, v)
+            elif k not in self.pickles:
+                logging.info("Parser {} has no input, so it'll get "
+                             "skipped".format(k))
+        return self.pickles, self.dump_paths
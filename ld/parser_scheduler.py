@@ -0,0 +1,301 @@
+import cPickle
+import heapq
+import multiprocessing
+import tempfile
+import threading
+import traceback
+from Queue import Queue, Empty
+
+from ld.langdeath_exceptions import ParserException, ParserWorkerException, \
+    DependencyException
+from ld.parsers.base_parsers import OnlineParser
+from ld.run_report import Usage
+
+# number of records a worker sends to the writer in one message
+CHUNK_SIZE = 100
+
+# seconds the writer side waits for a message of a worker before checking
+# that the worker is still alive
+POLL = 1
+
+
+def parser_name(parser):
+    return type(parser).__name__
+
+
+def produce(parse_call, queue):
+    """Runs in a worker process: iterates over the parser's output and
+    sends it to the writer in chunks, followed by the resources used"""
+    usage = Usage()
+    chunk = []
+    try:
+        for lang in parse_call():
+            chunk.append(lang)
+            if len(chunk) >= CHUNK_SIZE:
+                queue.put(('records', chunk))
+                chunk = []
+        queue.put(('records', chunk))
+        message = ('done', None)
+    except ParserException as e:
+        queue.put(('records', chunk))
+        message = ('parser_error', str(e))
+    except:
+        queue.put(('records', chunk))
+        message = ('error', traceback.format_exc())
+    queue.put(('usage', usage.get()))
+    queue.put(message)
+
+
+class ParserJob(object):
+    """One parser scheduled for concurrent parsing"""
+
+    def __init__(self, parser, dependencies):
+        self.parser = parser
+        self.dependencies = dependencies
+        self.parse_call = None
+        # messages of the worker; the records are in the spool file, the
+        # messages only say that a chunk of them arrived
+        self.buffer = Queue()
+        self.spool = None
+        self.spool_reader = None
+        self.started = False
+        self.skipped = False
+        self.slots = None
+        self.usage = None
+
+    @property
+    def ready(self):
+        return self.parse_call is not None or self.skipped
+
+    def open_spool(self):
+        self.spool = tempfile.NamedTemporaryFile(prefix='langdeath_')
+        self.spool_reader = open(self.spool.name, 'rb')
+
+    def close_spool(self):
+        if self.spool is not None:
+            self.spool_reader.close()
+            self.spool.close()
+
+
+class ParserScheduler(object):
+    """Orders the parsers according to the dependencies they declare
+    (see BaseParser.depends_on and BaseParser.runs_after), and runs them
+    in at most @jobs worker processes, while the records are handed to
+    the (single) writer in this order.
+
+    Independent parsers keep their order in @parsers, so the merge
+    order, hence the content of the database is deterministic.
+    Every parser is started as soon as its inputs are ready: at once,
+    or if the parser needs the sils of the database (needs_sil) or it
+    was deferred (see defer()), when all of its dependencies are merged.
+    If @parse_call_factory returns None for a parser, it is skipped.
+    Unknown or missing dependencies and cycles are rejected when the
+    scheduler is created, before any parser is run. Parsers named in
+    @already_merged are not run, but dependencies on them are satisfied
+    (their data is in the database from an earlier run).
+
+    Online parsers mostly wait for the network, with @online_jobs > 0 they
+    get that many slots of their own, so they run besides the @jobs (CPU
+    bound) offline parsers.
+    """
+
+    def __init__(self, parsers, parse_call_factory, jobs=1,
+                 already_merged=(), online_jobs=0):
+        self.parse_call_factory = parse_call_factory
+        self.jobs = jobs
+        self.slots = threading.Semaphore(jobs)
+        self.online_slots = self.slots
+        if online_jobs > 0:
+            self.online_slots = threading.Semaphore(online_jobs)
+        self.merged_parsers = set(already_merged)
+        self.deferred = set()
+        self.running = False
+        self.check_dependencies(parsers)
+        self.dependencies = {}
+        self.order = self.sort(parsers)
+        self.job_of_parser = {}
+        for parser in self.order:
+            name = parser_name(parser)
+            self.job_of_parser[name] = ParserJob(
+                parser, self.dependencies[name])
+
+    def check_dependencies(self, parsers):
+        names = [parser_name(p) for p in parsers]
+        if len(set(names)) != len(names):
+            raise DependencyException(
+                "Parsers scheduled more than once: {0}".format(
+                    sorted(set(n for n in names if names.count(n) > 1))))
+        missing = []
+        for parser in parsers:
+            for dep in parser.depends_on:
+                if dep not in names and dep not in self.merged_parsers:
+                    missing.append((parser_name(parser), dep))
+        if len(missing) > 0:
+            raise DependencyException(
+                "Missing dependencies (parser, dependency): {0}".format(
+                    missing))
+
+    def sort(self, parsers):
+        """Topological order of @parsers; ties are broken by the
+        original position of the parsers"""
+        position = dict((parser_name(p), i) for i, p in enumerate(parsers))
+        preceding = {}
+        following = dict((name, []) for name in position)
+        for parser in parsers:
+            name = parser_name(parser)
+            deps = set(parser.depends_on)
+            # soft dependencies only count if the parser is scheduled
+            deps |= set(d for d in parser.runs_after if d in position)
+            self.dependencies[name] = deps
+            deps = set(d for d in deps if d in position)
+            preceding[name] = len(deps)
+            for dep in deps:
+                following[dep].append(name)
+        heap = [(position[n], n) for n in position if preceding[n] == 0]
+        heapq.heapify(heap)
+        order = []
+        while heap:
+            i, name = heapq.heappop(heap)
+            order.append(parsers[i])
+            for f in following[name]:
+                preceding[f] -= 1
+                if preceding[f] == 0:
+                    heapq.heappush(heap, (position[f], f))
+        if len(order) < len(parsers):
+            in_cycle = sorted(n for n in preceding if preceding[n] > 0)
+            raise DependencyException(
+                "Cyclic dependencies among parsers {0}".format(in_cycle))
+        return order
+
+    def defer(self, parser):
+        """@parser is only started when its dependencies are merged"""
+        self.deferred.add(parser_name(parser))
+
+    def start_all(self):
+        self.running = True
+        self.release_ready()
+
+    def jobs_in_order(self):
+        return [self.job_of_parser[parser_name(p)] for p in self.order]
+
+    def merged(self, parser):
+        """Called by the writer when it finished merging @parser;
+        starts the parsers that were waiting for it"""
+        self.merged_parsers.add(parser_name(parser))
+        if self.running:
+            self.release_ready()
+
+    def release_ready(self):
+        for job in self.jobs_in_order():
+            if job.ready:
+                continue
+            waits = job.parser.needs_sil or \
+                parser_name(job.parser) in self.deferred
+            if waits and not job.dependencies <= self.merged_parsers:
+                continue
+            job.parse_call = self.parse_call_factory(job.parser)
+            if job.parse_call is None:
+                job.skipped = True
+                job.started = True
+                job.buffer.put(('done', None))
+        self.launch()
+
+    def launch(self):
+        """Starts ready jobs in order, as long as there are free slots.
+        A slot is given back as soon as the worker finished parsing (not
+        when the writer consumed its records), so the job the writer is
+        waiting for always gets a slot eventually.
+        """
+        full = set()
+        for job in self.jobs_in_order():
+            if job.started or not job.ready:
+                continue
+            slots = self.slots
+            if isinstance(job.parser, OnlineParser):
+                slots = self.online_slots
+            if slots in full:
+                continue
+            if not slots.acquire(False):
+                full.add(slots)
+                continue
+            job.slots = slots
+            self.start(job)
+
+    def start(self, job):
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=produce, args=(job.parse_call, queue))
+        process.daemon = True
+        job.open_spool()
+        process.start()
+        job.started = True
+        bridge = threading.Thread(target=self.drain,
+                                  args=(process, queue, job))
+        bridge.daemon = True
+        bridge.start()
+
+    def drain(self, process, queue, job):
+        """Moves the records of a worker into the spool file of its job and
+        the other messages into the buffer of the job, so that the worker
+        can exit and give back its slot even if the writer has not reached
+        its parser yet, without keeping the records in memory. A worker
+        exiting without saying it finished is reported as failed."""
+        try:
+            while True:
+                try:
+                    kind, data = queue.get(timeout=POLL)
+                except Empty:
+                    if process.is_alive():
+                        continue
+                    try:
+                        # sent before it exited
+                        kind, data = queue.get(timeout=POLL)
+                    except Empty:
+                        kind, data = 'error', "the worker exited with " \
+                            "code {0} before finishing".format(
+                                process.exitcode)
+                if kind == 'records':
+                    cPickle.dump(data, job.spool, cPickle.HIGHEST_PROTOCOL)
+                    job.spool.flush()
+                    data = None
+                job.buffer.put((kind, data))
+                if kind not in ['records', 'usage']:
+                    break
+        except:
+            job.buffer.put(('error', traceback.format_exc()))
+        finally:
+            process.join()
+            job.slots.release()
+
+    def records(self, parser):
+        """Yields the records of @parser in the order the parser produced
+        them. Exceptions raised in the worker are re-raised here, a worker
+        that died raises ParserWorkerException."""
+        job = self.job_of_parser[parser_name(parser)]
+        try:
+            while True:
+                self.launch()
+                try:
+                    kind, data = job.buffer.get(timeout=POLL)
+                except Empty:
+                    continue
+                if kind == 'records':
+                    for lang in cPickle.load(job.spool_reader):
+                        yield lang
+                elif kind == 'usage':
+                    job.usage = data
+                elif kind == 'done':
+                    return
+                elif kind == 'parser_error':
+                    raise ParserException(data)
+                else:
+                    raise ParserWorkerException(
+                        "Worker of parser {0} failed:\n{1}".format(
+                            type(parser), data))
+        finally:
+            job.close_spool()
+
+    def worker_usage(self, parser):
+        """Resources used by the worker of @parser, None if it did not
+        run in a worker"""
+        return self.job_of_parser[parser_name(parser)].usage
@@ -3,13 +3,51 @@ from os import path
 
 from ld.langdeath_exceptions import ParserException
 
+# parsers adding the names and alternative names that the parsers matching
+# languages by name rely on
+NAME_SOURCES = ('DbpediaParserAggregator', 'EthnologueDumpParser',
+                'GlottologParser', 'CrubadanParser',
+                'LanguageArchivesOfflineParser',
+                'LanguageArchivesOnlineParser')
+
 
 class BaseParser(object):
 
+    # classnames of the parsers whose output has to be merged before the
+    # output of this parser; every parser merges its data into the
+    # languages coming from iso-639-3
+    depends_on = ('ParseISO639_3',)
+
+    # classnames of the parsers to be merged before this one, if they run
+    runs_after = ()
+
+    # parse() takes the list of the sils already in the database
+    needs_sil = False
+
+    # attributes holding the paths of the local files and directories
+    # the parser reads (see get_input_paths)
+    input_attrs = ()
+
+    # ld.work_queue.WorkQueue running parse_all sharded, if the parser
+    # can be split into work units (see get_work_units)
+    work_queue = None
+
+    # ld.progress.Progress the parser reports its work to, if it knows its
+    # total work up front (see set_progress_total)
+    progress = None
+
     @property
     def pickle_fn(self):
         return type(self).__name__ + '.pickle'
 
+    def get_input_paths(self):
+        """Existing local files and directories the output of the parser
+        depends on, including its pickle if there is one"""
+        paths = [getattr(self, attr, None) for attr in self.input_attrs]
+        if hasattr(self, 'pickle_dir') and len(paths) > 0:
+            paths.append('{}/{}'.format(self.pickle_dir, self.pickle_fn))
+        return [p for p in paths if p and path.exists(p)]
+
     def load_from_file(self, ifn=None):
         fn = ifn if ifn else self.pickle_fn
         with open(fn) as f:
@@ -31,8 +69,12 @@ class BaseParser(object):
                     yield res
         else:
             d = []
+            if self.work_queue is not None:
+                records = self.work_queue.parse(self, **kwargs)
+            else:
+                records = self.parse_all(**kwargs)
             try:
-                for data in self.parse_all(**kwargs):
+                for data in records:
                     yield data
                     d.append(data)
                 with open(fn, 'wb') as f:
@@ -46,6 +88,27 @@ class BaseParser(object):
     def parse_all(self, **kwargs):
         raise NotImplementedError()
 
+    def set_progress_total(self, total, unit='items'):
+        """Total work of the parser, in items or bytes, for the progress
+        reports and ETAs of the aggregator"""
+        if self.progress is not None:
+            self.progress.set_total(total, unit)
+
+    def advance_progress(self, amount=1):
+        if self.progress is not None:
+            self.progress.advance(amount)
+
+    def get_work_units(self, **kwargs):
+        """Picklable parts of the work of parse_all(**kwargs), which can
+        be parsed independently by parse_unit; None if the parser can not
+        be split"""
+        return None
+
+    def parse_unit(self, unit):
+        """Records of @unit; the records of all the units in their order
+        are the records of parse_all"""
+        raise NotImplementedError()
+
 
 class OnlineParser(BaseParser):
     """Inherit this class if the parser will do everything on its own,
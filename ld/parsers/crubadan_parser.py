@@ -5,7 +5,7 @@ from zipfile import ZipFile
 import urllib2
 import logging
 
-from utils import get_html
+from utils import get_html, get_htmls
 
 from base_parsers import OnlineParser
 from ld.langdeath_exceptions import ParserException
@@ -48,8 +48,8 @@ class CrubadanParser(OnlineParser):
                 yield json.loads(line[json_i])
 
     def generate_script_dicts(self):
-        for s in self.scripts:
-            html = get_html('{0}{1}'.format(self.script_url, s))
+        urls = ['{0}{1}'.format(self.script_url, s) for s in self.scripts]
+        for html in get_htmls(urls):
             for d in self.get_relevant_dict(html):
                 yield d
 
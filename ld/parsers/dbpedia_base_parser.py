@@ -4,6 +4,9 @@ from base_parsers import OfflineParser
 
 
 class DbpediaNTBaseParser(OfflineParser):
+
+    input_attrs = ('basedir',)
+
     def __init__(self, basedir):
         self.basedir = basedir
 
@@ -14,6 +14,15 @@ class DbpediaParserAggregator(OfflineParser):
         self.properties_parser = DbpediaMapPropertiesParser(basedir)
         self.shortabstract_parser = DbpediaShortAbstractsParser(basedir)
 
+    def get_input_paths(self):
+        paths = []
+        for parser in [self.raw_infobox_parser, self.properties_parser,
+                       self.shortabstract_parser]:
+            if hasattr(self, 'pickle_dir'):
+                parser.pickle_dir = self.pickle_dir
+            paths += parser.get_input_paths()
+        return paths
+
     def parse(self):
         
         self.raw_infobox_parser.pickle_dir = self.pickle_dir
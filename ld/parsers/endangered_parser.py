@@ -16,6 +16,8 @@ logging.getLogger().setLevel(logging.INFO)
 
 class EndangeredParser(OfflineParser):
 
+    input_attrs = ('id_fn', 'offline_dir')
+
     def __init__(self, id_fn=None, offline_dir=''):
         self.base_url = 'http://www.endangeredlanguages.com/lang/'
         self.ids = list()
@@ -58,7 +60,9 @@ class EndangeredParser(OfflineParser):
         
         with open(self.id_fn) as f:
                 self.ids = [l.strip() for l in f]
+        self.set_progress_total(len(self.ids))
         for id_ in self.ids:
+            self.advance_progress()
             logging.debug('Parsing: {0}'.format(id_))
             csv_data = self.download_and_parse_csv(id_)
             html_data = self.download_and_parse_html(id_)
@@ -1,12 +1,15 @@
 import re
 from HTMLParser import HTMLParser
+from itertools import izip
 
-from base_parsers import OnlineParser
-from utils import get_html
+from base_parsers import OnlineParser, NAME_SOURCES
+from utils import get_html, get_htmls
 
 
 class EndangeredResourcesParser(OnlineParser):
 
+    runs_after = NAME_SOURCES
+
     def __init__(self):
 
         self.langspec_url = 'https://github.com/RichardLitt/endangered' +\
@@ -32,24 +35,19 @@ class EndangeredResourcesParser(OnlineParser):
             yield d
 
     def parse_sources(self):
-        langspec_html = get_html(self.langspec_url)
-        for d in self.generate_langspec_dicts(langspec_html):
-            yield d
-        austronesian_html = get_html(self.austronesian_url)
-        for d in self.generate_austronesian_dicts(austronesian_html):
-            yield d
-        bantu_html = get_html(self.bantu_url)
-        for d in self.generate_bantu_dicts(bantu_html):
-            yield d
-        indo_european_html = get_html(self.indo_european_url)
-        for d in self.generate_indo_european_dicts(indo_european_html):
-            yield d
-        sealand_html =  get_html(self.sealang_url)
-        for d in self.generate_sealang_dicts(sealand_html):
-            yield d
-        stedt_html = get_html('{}1'.format(self.stedt_base_url))
-        for d in self.generate_stedt_dicts(stedt_html):
-            yield d
+        sources = [(self.langspec_url, self.generate_langspec_dicts),
+                   (self.austronesian_url, self.generate_austronesian_dicts),
+                   (self.bantu_url, self.generate_bantu_dicts),
+                   (self.indo_european_url,
+                    self.generate_indo_european_dicts),
+                   (self.sealang_url, self.generate_sealang_dicts),
+                   ('{}1'.format(self.stedt_base_url),
+                    self.generate_stedt_dicts)]
+        # the pages are downloaded concurrently, and parsed in this order
+        htmls = get_htmls([url for url, generate in sources])
+        for html, (url, generate) in izip(htmls, sources):
+            for d in generate(html):
+                yield d
             
     def generate_langspec_dicts(self, html):
         blocks = self.h1_pattern.split(html)[1:]
@@ -1,7 +1,7 @@
 import sys
 import os
 import re
-from utils import get_html
+from utils import get_html, split_units
 
 from base_parsers import OnlineParser, OfflineParser, BaseParser
 from ld.langdeath_exceptions import ParserException
@@ -9,6 +9,8 @@ from ld.langdeath_exceptions import ParserException
 
 class EthnologueBaseParser(BaseParser):
 
+    needs_sil = True
+
     def __init__(self):
 
         self.compile_patterns()
@@ -233,10 +235,18 @@ class EthnologueBaseParser(BaseParser):
     def parse(self, sil_codes):
         return self.parse_or_load(sil_codes=sil_codes)
 
+    def get_work_units(self, **kwargs):
+        return split_units(kwargs["sil_codes"])
+
+    def parse_unit(self, unit):
+        return self.parse_all(sil_codes=unit)
+
     def parse_all(self, **kwargs):
-        sil_codes = kwargs["sil_codes"]
+        sil_codes = list(kwargs["sil_codes"])
+        self.set_progress_total(len(sil_codes))
         errors = set()
         for sil_code in sil_codes:
+            self.advance_progress()
             try:
                 self.sil = sil_code
                 html = self.get_html(self.sil)
@@ -289,6 +299,8 @@ class EthnologueOnlineParser(OnlineParser, EthnologueBaseParser):
 
 class EthnologueOfflineParser(OfflineParser, EthnologueBaseParser):
 
+    input_attrs = ('basedir',)
+
     def __init__(self, basedir):
         super(EthnologueOfflineParser, self).__init__()
         self.basedir = basedir
@@ -10,7 +10,9 @@ class FindBibleParser(BaseParser):
         self.resdir = resdir
 
     def parse(self):
+        self.set_progress_total(len(self.sils))
         for lang_code in self.get_lang_code():
+            self.advance_progress()
             d = defaultdict(int)
             d['sil'] = lang_code
             for bible_page in self.get_bible_page(lang_code):
@@ -81,6 +83,8 @@ class FindBibleOnlineParser(OnlineParser, FindBibleParser):
 
 class FindBibleOfflineParser(OfflineParser, FindBibleParser):
 
+    input_attrs = ('resdir',)
+
     def __init__(self, resdir):
         self.sils = os.listdir(resdir)
         super(FindBibleOfflineParser, self).__init__(resdir)
@@ -2,7 +2,7 @@ from HTMLParser import HTMLParser
 import urllib
 import re
 
-from base_parsers import OnlineParser
+from base_parsers import OnlineParser, NAME_SOURCES
 
 
 class FirefoxHTMLParser(HTMLParser):
@@ -72,7 +72,9 @@ class FirefoxHTMLParser(HTMLParser):
 
 
 class FirefoxParser(OnlineParser):
-    
+
+    runs_after = NAME_SOURCES
+
     def __init__(self, mapping_fn):
         self.mapping_fn = mapping_fn
 
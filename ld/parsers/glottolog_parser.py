@@ -1,5 +1,5 @@
 import csv
-from utils import get_html
+from utils import get_html, get_htmls
 from base_parsers import OnlineParser
 
 class GlottologParser(OnlineParser):
@@ -34,9 +34,9 @@ class GlottologParser(OnlineParser):
         grouped by macro area for the same reason.
         '''
         tlfs = set([])
-        for i in range(6):
-            url = '{0}{1}'.format(self.macro_area_based_family_search_url, i)
-            html = get_html(url)
+        urls = ['{0}{1}'.format(self.macro_area_based_family_search_url, i)
+                for i in range(6)]
+        for html in get_htmls(urls):
             csv_reader = csv.reader(html.encode('utf-8').split('\n'))
             l = csv_reader.next()
             index = l.index('name')
@@ -51,11 +51,11 @@ class GlottologParser(OnlineParser):
         we cannot download all data in one csv (maximum 2000 rows or so)
         so we download the the languages grouped by its top level family.
         '''
-        for f in self.get_top_level_families():
-            if f in ['Unattested', 'Bookkeeping']:
-                continue
-            html = get_html('{0}{1}'.format(self.family_based_search_url,
-                                            '_'.join(f.split(' '))))
+        families = [f for f in self.get_top_level_families()
+                    if f not in ['Unattested', 'Bookkeeping']]
+        urls = ['{0}{1}'.format(self.family_based_search_url,
+                                '_'.join(f.split(' '))) for f in families]
+        for html in get_htmls(urls):
             csv_reader = csv.reader(html.encode('utf-8').split('\n'))
             l = csv_reader.next()
             self.needed_indeces = {}
@@ -1,5 +1,5 @@
-from utils import get_html
-from base_parsers import OnlineParser
+from utils import get_htmls
+from base_parsers import OnlineParser, NAME_SOURCES
 
 
 tweets_url = "http://indigenoustweets.com/"
@@ -7,6 +7,9 @@ blogs_url = "http://indigenoustweets.com/blogs/"
 
 
 class IndigenousParser(OnlineParser):
+
+    runs_after = NAME_SOURCES
+
     def __init__(self, resdir):
         self.needed_keys = {
             "Language": "name",
@@ -64,8 +67,7 @@ class IndigenousParser(OnlineParser):
                 data1[l2].update(data2[l2])
 
     def parse(self):
-        tweets_html = get_html(tweets_url)
-        blogs_html = get_html(blogs_url)
+        tweets_html, blogs_html = get_htmls([tweets_url, blogs_url])
         tweets_data = self.html_to_dict(tweets_html)
         blogs_data = self.html_to_dict(blogs_html)
         self.merge_data(tweets_data, blogs_data)
@@ -10,6 +10,9 @@ class ParseISO639_3(OnlineParser):
     """
     self.lang_dict = { iso_code : dict}
     """
+
+    depends_on = ()
+
     def __init__(self, extended=False):
         self.lang_dict = defaultdict(dict)
         self.url = 'http://www-01.sil.org/iso639-3/iso-639-3_Code_Tables_20150505.zip'  # nopep8
@@ -1,10 +1,11 @@
 import sys
 import os
 import re
+from itertools import izip
 
 from base_parsers import OnlineParser, OfflineParser, BaseParser
 from ld.langdeath_exceptions import ParserException
-from utils import get_html
+from utils import get_html, call_concurrently, split_units
 
 
 class LanguageArchivesBaseParser(BaseParser):
@@ -56,6 +57,14 @@ class LanguageArchivesBaseParser(BaseParser):
     def get_html(self, sil):
         raise NotImplementedError()
 
+    def get_pages(self, sil_codes):
+        """Yields (sil, page, ParserException raised while getting it)"""
+        for sil in sil_codes:
+            try:
+                yield sil, self.get_html(sil), None
+            except ParserException as e:
+                yield sil, None, e
+
     def get_name(self, string):
 
         try:
@@ -95,12 +104,23 @@ class LanguageArchivesBaseParser(BaseParser):
         return altnames
 
 
-    def parse_all(self):
-        sil_codes = self.get_sil_codes()
+    def get_work_units(self, **kwargs):
+        return split_units(self.get_sil_codes())
+
+    def parse_unit(self, unit):
+        return self.parse_all(sil_codes=unit)
+
+    def parse_all(self, sil_codes=None):
+        if sil_codes is None:
+            sil_codes = self.get_sil_codes()
+        sil_codes = list(sil_codes)
+        self.set_progress_total(len(sil_codes))
         errors = []
-        for sil in sil_codes:
+        for sil, html, error in self.get_pages(sil_codes):
+            self.advance_progress()
             try:
-                html = self.get_html(sil)
+                if error is not None:
+                    raise error
                 dictionary = {}
                 dictionary['sil'] = sil
                 name = self.get_name(html)
@@ -130,6 +150,8 @@ class LanguageArchivesBaseParser(BaseParser):
 
 class LanguageArchivesOnlineParser(OnlineParser, LanguageArchivesBaseParser):
 
+    needs_sil = True
+
     def __init__(self):
 
         super(LanguageArchivesOnlineParser, self).__init__()
@@ -146,9 +168,20 @@ class LanguageArchivesOnlineParser(OnlineParser, LanguageArchivesBaseParser):
         url = '{0}/{1}'.format(self.base_url, sil)
         return get_html(url)
 
+    def get_pages(self, sil_codes):
+        # the pages are downloaded concurrently
+        sil_codes = list(sil_codes)
+        results = call_concurrently(self.get_html, sil_codes)
+        for sil, (html, e) in izip(sil_codes, results):
+            if e is not None and not isinstance(e, ParserException):
+                raise e
+            yield sil, html, e
+
 
 class LanguageArchivesOfflineParser(OfflineParser, LanguageArchivesBaseParser):
 
+    input_attrs = ('basedir',)
+
     def __init__(self, basedir):
         super(LanguageArchivesOfflineParser, self).__init__()
         self.basedir = basedir
@@ -1,12 +1,14 @@
 import re
 
-from base_parsers import OnlineParser
+from base_parsers import OnlineParser, NAME_SOURCES
 from ld.langdeath_exceptions import ParserException
 from utils import get_html, replace_html_formatting
 
 
 class WikipediaListOfLanguagesParser(OnlineParser):
 
+    runs_after = NAME_SOURCES
+
     def __init__(self, resdir):
 
         self.url = 'http://meta.wikimedia.org/wiki/List_of_Wikipedias'
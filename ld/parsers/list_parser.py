@@ -1,8 +1,13 @@
-from base_parsers import OfflineParser
+from base_parsers import OfflineParser, NAME_SOURCES
 
 class ListParser(OfflineParser):
-    
+
+    runs_after = NAME_SOURCES
+
+    input_attrs = ('fn',)
+
     def __init__(self, fn, key, attrib):
+        self.fn = fn
         self.fh = open(fn)
         self.key = key
         self.attrib = attrib
@@ -1,7 +1,7 @@
 import urllib
 from HTMLParser import HTMLParser
 
-from base_parsers import OnlineParser
+from base_parsers import OnlineParser, NAME_SOURCES
 
 
 class OmniglotHTMLParser(HTMLParser):
@@ -53,6 +53,8 @@ class OmniglotHTMLParser(HTMLParser):
 
 class OmniglotParser(OnlineParser):
 
+    runs_after = NAME_SOURCES
+
     def __init__(self, fn):
         self.url = 'http://www.omniglot.com/writing/languages.htm'
         self.fn = fn
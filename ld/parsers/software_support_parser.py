@@ -2,9 +2,13 @@ from collections import defaultdict
 import sys
 
 from tsv_parser import TSV_parser
+from base_parsers import NAME_SOURCES
 
 
 class SoftwareSupportParser(TSV_parser):
+
+    runs_after = NAME_SOURCES
+
     def __init__(self, resdir):
         self.resdir = resdir
         self.get_mapping_dict('{0}/mappings/software'.format(resdir))
@@ -15,13 +19,8 @@ class SoftwareSupportParser(TSV_parser):
             k, v = l.strip().decode('utf-8').split('\t')
             self.mapping_dict[k] = v
 
-    def parse(self):
-        parser = TSV_parser()
-        langs = defaultdict(lambda: {'mac_input': False,
-                                     'mac_input_partial': False,
-                                     'microsoft_pack': False})
-
-        parameters = [
+    def get_parameters(self):
+        return [
             ('{0}/mac_input'.format(self.resdir),
              {"true_key": ['mac_input', 'mac_input_partial']}),
             ('{0}/mac_input_partial_support'.format(self.resdir),
@@ -48,7 +47,18 @@ class SoftwareSupportParser(TSV_parser):
              {"true_key": ['ubuntu_input']}),
 
         ]
-        for args in parameters:
+
+    def get_input_paths(self):
+        return ['{0}/mappings/software'.format(self.resdir)] + \
+            [fn for fn, kwargs in self.get_parameters()]
+
+    def parse(self):
+        parser = TSV_parser()
+        langs = defaultdict(lambda: {'mac_input': False,
+                                     'mac_input_partial': False,
+                                     'microsoft_pack': False})
+
+        for args in self.get_parameters():
             for lang in parser.parse(args[0], **args[1]):
                 # hunspell contained xxw prefix, we don't need it anymore
                 if 'sil' in lang and lang['sil'].startswith("xxw"):
@@ -1,9 +1,11 @@
-from base_parsers import OnlineParser
+from base_parsers import OnlineParser, NAME_SOURCES
 from utils import get_html
 import re
 
 class TreeTaggerParser(OnlineParser):
 
+    runs_after = NAME_SOURCES
+
     def __init__(self):
         self.url = "http://www.cis.uni-muenchen.de/~schmid/tools/TreeTagger/"
         self.lang_pattern = re.compile('.*?[(\s|>)]([a-zA-Z]+) parameter file*',
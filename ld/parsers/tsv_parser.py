@@ -30,6 +30,9 @@ class TSV_parser(OfflineParser):
 
 
 class L2Parser(TSV_parser):
+
+    input_attrs = ('fn',)
+
     def __init__(self, fn):
         super(TSV_parser, self).__init__()
         self.fn = fn
@@ -43,6 +46,8 @@ class L2Parser(TSV_parser):
 
 class EthnologueDumpParser(TSV_parser):
 
+    input_attrs = ('fn',)
+
     def __init__(self, fn):
         super(TSV_parser, self).__init__()
         self.fn = fn
@@ -77,6 +82,8 @@ class EthnologueDumpParser(TSV_parser):
 
 class EthnologueMacroParser(TSV_parser):
 
+    input_attrs = ('fn',)
+
     def __init__(self, fn):
         super(TSV_parser, self).__init__()
         self.fn = fn
@@ -95,6 +102,7 @@ class EthnologueMacroParser(TSV_parser):
 
 class UrielParser(OfflineParser):
 
+    input_attrs = ('fn',)
 
     def __init__(self, fn):
         self.fn = fn
@@ -1,7 +1,15 @@
 import re
 import urllib2
+from collections import deque
+from multiprocessing.pool import ThreadPool
 from ld.langdeath_exceptions import ParserException
 
+# pages downloaded at the same time by get_htmls
+FETCH_THREADS = 8
+
+# sils in a work unit of a parser (see split_units)
+UNIT_SIZE = 200
+
 def get_html(url, encoding='utf-8'):
 
     try:
@@ -11,6 +19,40 @@ def get_html(url, encoding='utf-8'):
     except:
         raise ParserException('Problem with downloading {}\n'.format(url))
 
+def call_concurrently(function, args, threads=FETCH_THREADS):
+    """Calls @function on each of @args in @threads threads (for waiting
+    on the network, not for computing), yields (result, exception) pairs
+    in the order of @args. At most 2 * @threads results are kept ahead."""
+    def call(arg):
+        try:
+            return function(arg), None
+        except Exception as e:
+            return None, e
+    pool = ThreadPool(threads)
+    pending = deque()
+    try:
+        for arg in args:
+            pending.append(pool.apply_async(call, (arg,)))
+            if len(pending) >= 2 * threads:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+
+def get_htmls(urls, encoding='utf-8'):
+    """Like get_html for each of @urls, downloaded concurrently"""
+    for html, e in call_concurrently(lambda url: get_html(url, encoding),
+                                     urls):
+        if e is not None:
+            raise e
+        yield html
+
+def split_units(items, size=UNIT_SIZE):
+    """@items in lists of @size, the work units of a sharded parser"""
+    items = list(items)
+    return [items[i:i + size] for i in xrange(0, len(items), size)]
+
 def replace_html_formatting(string, additional_patterns = []):
     
     string = re.sub('<[/]{0,1}a.*?>', '', string)
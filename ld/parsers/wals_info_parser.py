@@ -1,12 +1,14 @@
 import logging
 import json
 
-from base_parsers import OnlineParser
+from base_parsers import OnlineParser, NAME_SOURCES
 from utils import get_html
 
 
 class WalsInfoParser(OnlineParser):
 
+    runs_after = NAME_SOURCES
+
     def __init__(self, resdir):
         self.url = "http://wals.info/languoid.geojson?sEcho=1&iSortingCols=1&iSortCol_0=0&sSortDir_0=asc"  # nopep8
         self.needed_keys = {
@@ -1,12 +1,14 @@
 import re
 
-from base_parsers import OnlineParser
+from base_parsers import OnlineParser, NAME_SOURCES
 from ld.langdeath_exceptions import ParserException
 from utils import get_html, replace_html_formatting
 
 
 class WikipediaIncubatorsParser(OnlineParser):
 
+    runs_after = NAME_SOURCES
+
     def __init__(self, resdir):
 
         self.url = 'http://incubator.wikimedia.org/wiki/Incubator:Wikis'
@@ -1,7 +1,7 @@
 # input: path containing files of parsed Wikipedias
 import sys
 from os import listdir
-from os.path import isfile, join
+from os.path import isfile, join, getsize
 from math import log
 from collections import defaultdict
 import re
@@ -14,6 +14,8 @@ from base_parsers import BaseParser
 
 class WikipediaAdjustedSizeCounter(BaseParser):
 
+    input_attrs = ('path',)
+
     def __init__(self, path='', basic_limit=2000, entropy_sample_lines=50000):
 
         self.numerals = set(string.digits)
@@ -116,15 +118,27 @@ class WikipediaAdjustedSizeCounter(BaseParser):
     def parse_all(self, **kwargs):
         # counts wp sizes for all dump file in self.path
 
-        files = [f for f in listdir(self.path)
-                 if isfile(join(self.path, f))]
-        for fn in files:
-            f = '{0}/{1}'.format(self.path, fn)
-            c = self.name_regex.match(fn).groups()[0]
-            c = c.replace("_", "-")
-            d = self.count(f)
-            d['other_codes'] = {"wiki": c}
-            yield d
+        fns = self.get_work_units()
+        # the dumps are compressed, their size is a good measure of the work
+        self.set_progress_total(sum(getsize(join(self.path, fn))
+                                    for fn in fns), 'bytes')
+        for fn in fns:
+            for d in self.parse_unit(fn):
+                yield d
+            self.advance_progress(getsize(join(self.path, fn)))
+
+    def get_work_units(self, **kwargs):
+        # one dump file per unit
+        return [f for f in listdir(self.path)
+                if isfile(join(self.path, f))]
+
+    def parse_unit(self, fn):
+        f = '{0}/{1}'.format(self.path, fn)
+        c = self.name_regex.match(fn).groups()[0]
+        c = c.replace("_", "-")
+        d = self.count(f)
+        d['other_codes'] = {"wiki": c}
+        yield d
 
 
 class WikipediaAdjustedSizeCounter_AutoParser(WikipediaAdjustedSizeCounter):
@@ -149,6 +163,9 @@ class WikipediaAdjustedSizeCounter_AutoParser(WikipediaAdjustedSizeCounter):
 
 
 class WikipediaAdjustedSizeCounter_WPExtractor(WikipediaAdjustedSizeCounter):
+
+    # languages are identified by their wiki code only
+    depends_on = ('ParseISO639_3', 'WikipediaListOfLanguagesParser')
        
     def file_opener(self, f):
         return BZ2File(f)
@@ -174,6 +191,11 @@ class WikipediaAdjustedSizeCounter_WPExtractor(WikipediaAdjustedSizeCounter):
 
 class WPIncubatorAdjustedSizeCounter(WikipediaAdjustedSizeCounter_WPExtractor):
 
+    # languages are identified by their wiki_inc code only
+    depends_on = ('ParseISO639_3', 'WikipediaIncubatorsParser')
+
+    input_attrs = ('fn',)
+
     def __init__(self, fn, **kwargs):
         super(WPIncubatorAdjustedSizeCounter, self).__init__(**kwargs)
         self.fn = fn
@@ -202,6 +224,10 @@ class WPIncubatorAdjustedSizeCounter(WikipediaAdjustedSizeCounter_WPExtractor):
                 d[lang].append(l.encode('utf-8'))
         return d    
 
+    def get_work_units(self, **kwargs):
+        # a single dump file
+        return None
+
     def parse_all(self, **kwargs):
 
         lines_dict = self.get_dict_of_data()
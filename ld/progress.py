@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from multiprocessing import RawArray, RawValue
+
+# seconds between two progress reports of the aggregator
+PROGRESS_INTERVAL = 60
+
+# units of work a parser can report its progress in
+UNITS = ['items', 'bytes', 'units']
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return '{0}h{1:02d}m'.format(seconds / 3600, seconds % 3600 / 60)
+    return '{0}m{1:02d}s'.format(seconds / 60, seconds % 60)
+
+
+class Progress(object):
+    """Work done by a parser out of its total, in items or bytes (see
+    BaseParser.set_progress_total and BaseParser.advance_progress). It is
+    in shared memory: created before the worker process of the parser is
+    forked, it is updated there and read by the aggregator."""
+
+    def __init__(self, name):
+        self.name = name
+        # total, done, time of starting, time of the last advance
+        self.values = RawArray('d', 4)
+        self.unit = RawValue('i', 0)
+        self.merged = False
+
+    def set_total(self, total, unit='items'):
+        self.values[0] = total
+        self.values[1] = 0
+        self.values[2] = self.values[3] = time.time()
+        self.unit.value = UNITS.index(unit)
+
+    def advance(self, amount=1):
+        self.values[1] += amount
+        self.values[3] = time.time()
+
+    @property
+    def started(self):
+        return self.values[2] > 0
+
+    @property
+    def fraction(self):
+        """Part of the work done, None if the total is not known"""
+        if self.merged:
+            return 1.0
+        if not self.started or self.values[0] <= 0:
+            return None
+        return min(self.values[1] / self.values[0], 1.0)
+
+    def describe(self, now, interval=PROGRESS_INTERVAL):
+        """The progress at @now; no progress in the last @interval
+        seconds is reported too"""
+        total, done, started, updated = self.values
+        unit = UNITS[self.unit.value]
+        elapsed = now - started
+        msg = "{0}: {1:.0f}/{2:.0f} {3} ({4:.1f}%)".format(
+            self.name, done, total, unit, 100 * self.fraction)
+        if elapsed > 0:
+            rate = done / elapsed
+            msg += ", {0:.1f} {1}/s".format(rate, unit)
+            if rate > 0 and done < total:
+                msg += ", ETA {0}".format(
+                    format_duration((total - done) / rate))
+        if now - updated > interval:
+            msg += ", no progress for {0}".format(
+                format_duration(now - updated))
+        return msg
+
+
+class ProgressMonitor(object):
+    """Logs the progress of the parsers that started reporting it, with
+    their throughput and ETA, and an estimate for the whole run (each
+    parser counting equally), every @interval seconds"""
+
+    def __init__(self, progresses, interval=PROGRESS_INTERVAL):
+        self.progresses = progresses
+        self.interval = interval
+        self.started = time.time()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.report()
+
+    def report(self):
+        now = time.time()
+        merged = 0
+        done = 0.0
+        for progress in self.progresses:
+            if progress.merged:
+                merged += 1
+            elif progress.started and progress.fraction is not None:
+                logging.info("Progress of {0}".format(
+                    progress.describe(now, self.interval)))
+            done += progress.fraction or 0.0
+        elapsed = now - self.started
+        msg = "Progress of the run: {0}/{1} parsers merged, {2} " \
+            "elapsed".format(merged, len(self.progresses),
+                             format_duration(elapsed))
+        if done > 0 and len(self.progresses) > 0:
+            rest = elapsed * (len(self.progresses) - done) / done
+            msg += ", ETA {0}".format(format_duration(rest))
+        logging.info(msg)
+
+    def merged(self, name):
+        for progress in self.progresses:
+            if progress.name == name:
+                progress.merged = True
+
+    def start(self):
+        self.started = time.time()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,67 @@
+import base64
+import cPickle
+import logging
+
+from dld.models import Checkpoint
+
+# records merged between two checkpoints inside a parser
+CHECKPOINT_RECORDS = 1000
+
+
+class RunCheckpoint(object):
+    """Progress of a ParserAggregator run: the parsers merged completely,
+    the parser being merged with the number of its records merged so far,
+    and the state of the aggregator needed to continue (temporary code
+    counter, log lists).
+
+    The checkpoint is a row of the database, saved in the same transaction
+    as the data, so after a crash it matches the content of the database
+    and the run can be resumed without duplicating data.
+    """
+
+    def __init__(self):
+        self.completed = []
+        self.parser = None
+        self.records = 0
+        self.state = {}
+
+    def load(self):
+        try:
+            row = Checkpoint.objects.get(pk=1)
+        except Checkpoint.DoesNotExist:
+            logging.warning("No checkpoint in the database, starting over")
+            return
+        data = cPickle.loads(base64.b64decode(row.state))
+        self.completed = data['completed']
+        self.parser = data['parser']
+        self.records = data['records']
+        self.state = data['state']
+        logging.info("Resuming after parsers {0}".format(self.completed))
+
+    def save(self):
+        """Saves the checkpoint; the caller commits"""
+        data = {'completed': self.completed, 'parser': self.parser,
+                'records': self.records, 'state': self.state}
+        Checkpoint.objects.update_or_create(
+            pk=1, defaults={'state': base64.b64encode(
+                cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL))})
+
+    def update(self, parser_name, records, state):
+        self.parser = parser_name
+        self.records = records
+        self.state = state
+        self.save()
+
+    def finished(self, parser_name):
+        """@parser_name will not be run again when resuming"""
+        self.completed.append(parser_name)
+        self.parser = None
+        self.records = 0
+        self.state = {}
+
+    def resumed_state(self, parser_name):
+        """Number of records of @parser_name merged before the crash and
+        the saved state of the aggregator"""
+        if self.parser != parser_name:
+            return 0, {}
+        return self.records, self.state
@@ -0,0 +1,161 @@
+import hashlib
+import inspect
+import json
+import logging
+import os
+import sys
+
+# size of the blocks input files are hashed by
+BLOCK_SIZE = 1 << 20
+
+
+def source_fn(module):
+    fn = getattr(module, '__file__', None)
+    if fn is None:
+        return None
+    if fn.endswith('.pyc') or fn.endswith('.pyo'):
+        fn = fn[:-1]
+    return fn
+
+
+def parser_modules(parser):
+    """Modules of the ld package the code of @parser depends on: the
+    modules of its classes and, transitively, the ones of the classes
+    and functions these modules use"""
+    todo = [sys.modules[cls.__module__] for cls in type(parser).__mro__
+            if cls.__module__.startswith('ld.')]
+    modules = {}
+    while todo:
+        module = todo.pop()
+        if module.__name__ in modules:
+            continue
+        modules[module.__name__] = module
+        for obj in vars(module).values():
+            if inspect.ismodule(obj):
+                name = obj.__name__
+            else:
+                name = getattr(obj, '__module__', None)
+            if name is None or not name.startswith('ld.'):
+                continue
+            if name in sys.modules and name not in modules:
+                todo.append(sys.modules[name])
+    return [modules[name] for name in sorted(modules)]
+
+
+def record_digest(obj):
+    """Digest of a parsed record that does not depend on the iteration
+    order of its dicts and sets; keys starting with '_' are added by the
+    aggregator, not the parser, and left out"""
+    if isinstance(obj, dict):
+        items = sorted('{0}:{1}'.format(record_digest(k), record_digest(v))
+                       for k, v in obj.iteritems()
+                       if not str(k).startswith('_'))
+        return '{{{0}}}'.format(','.join(items))
+    if isinstance(obj, (set, frozenset)):
+        return 'set([{0}])'.format(','.join(sorted(
+            record_digest(v) for v in obj)))
+    if isinstance(obj, (list, tuple)):
+        return '[{0}]'.format(','.join(record_digest(v) for v in obj))
+    return repr(obj)
+
+
+class RunManifest(object):
+    """Fingerprints of the parsers merged into the database, used by
+    incremental runs of the ParserAggregator.
+
+    The fingerprint of an offline parser is computed from the content of
+    its input files (BaseParser.get_input_paths) and its code; parsers
+    without local input (online parsers) are fingerprinted by their
+    output. File hashes are cached by size and modification time, so
+    unchanged dumps are not read again.
+    """
+
+    def __init__(self, fn, config=None):
+        self.fn = fn
+        self.config = config if config else {}
+        self.fingerprints = {}
+        self.file_hashes = {}
+        if os.path.exists(fn):
+            with open(fn) as f:
+                data = json.load(f)
+            self.fingerprints = data['fingerprints']
+            self.file_hashes = data['file_hashes']
+
+    def save(self):
+        tmp_fn = '{0}.tmp'.format(self.fn)
+        with open(tmp_fn, 'w') as f:
+            json.dump({'fingerprints': self.fingerprints,
+                       'file_hashes': self.file_hashes}, f, indent=1,
+                      sort_keys=True)
+        os.rename(tmp_fn, self.fn)
+
+    def is_current(self, name, fingerprint):
+        return fingerprint is not None and \
+            self.fingerprints.get(name) == fingerprint
+
+    def update(self, name, fingerprint):
+        self.fingerprints[name] = fingerprint
+        self.save()
+
+    def input_fingerprint(self, parser):
+        """Fingerprint of the local input of @parser, None if the parser
+        has no local input"""
+        paths = parser.get_input_paths()
+        if len(paths) == 0:
+            return None
+        h = self.new_hash(parser)
+        for p in sorted(set(paths)):
+            h.update(p)
+            h.update(self.path_hash(p))
+        return h.hexdigest()
+
+    def output_fingerprint(self, parser, records):
+        h = self.new_hash(parser)
+        for lang in records:
+            h.update(record_digest(lang))
+        return h.hexdigest()
+
+    def new_hash(self, parser):
+        h = hashlib.sha1()
+        h.update(type(parser).__name__)
+        h.update(json.dumps(self.config, sort_keys=True))
+        h.update(self.code_hash(parser))
+        return h
+
+    def code_hash(self, parser):
+        h = hashlib.sha1()
+        for module in parser_modules(parser):
+            fn = source_fn(module)
+            if fn is not None and os.path.exists(fn):
+                h.update(module.__name__)
+                h.update(self.file_hash(fn))
+        return h.hexdigest()
+
+    def path_hash(self, path):
+        if os.path.isfile(path):
+            return self.file_hash(path)
+        h = hashlib.sha1()
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for fn in sorted(files):
+                full = os.path.join(root, fn)
+                h.update(os.path.relpath(full, path))
+                h.update(self.file_hash(full))
+        return h.hexdigest()
+
+    def file_hash(self, fn):
+        st = os.stat(fn)
+        key = os.path.abspath(fn)
+        cached = self.file_hashes.get(key)
+        if cached is not None and cached[0] == st.st_size and \
+           cached[1] == st.st_mtime:
+            return cached[2]
+        logging.debug('Hashing {0}'.format(fn))
+        h = hashlib.sha1()
+        with open(fn, 'rb') as f:
+            block = f.read(BLOCK_SIZE)
+            while block:
+                h.update(block)
+                block = f.read(BLOCK_SIZE)
+        self.file_hashes[key] = [st.st_size, st.st_mtime, h.hexdigest()]
+        return h.hexdigest()
@@ -0,0 +1,209 @@
+import json
+import logging
+import resource
+import time
+
+from django.db import connection
+
+# keys of the match statistics of a parser that are not clues
+NON_CLUE_STATS = set(['records', 'langs', 'ambiguous', 'chosen', 'unchosen',
+                      'new', 'not_added'])
+
+
+def cpu_time():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def status_kb(field):
+    """Value of @field (as VmHWM) of /proc/self/status in kilobytes, None
+    where there is no /proc"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except IOError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """Starts the measurement of the peak resident set size anew, where
+    the kernel allows it (linux 4.0 and later); True if it did"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except IOError:
+        return False
+    return status_kb('VmHWM') is not None
+
+
+def peak_rss():
+    """Peak resident set size of this process since reset_peak_rss, or
+    over its lifetime if it could not be reset, in kilobytes"""
+    return status_kb('VmHWM') or \
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class Usage(object):
+    """Resources used by this process since the Usage was created. The
+    peak resident set size is the one since then, 'peak_rss_kb', or the
+    peak of the whole process, 'run_peak_rss_kb', where it can not be
+    measured from a point on."""
+
+    def __init__(self):
+        self.wall_start = time.time()
+        self.cpu_start = cpu_time()
+        self.rss_reset = reset_peak_rss()
+
+    def get(self):
+        rss_key = 'peak_rss_kb' if self.rss_reset else 'run_peak_rss_kb'
+        return {'wall_time': round(time.time() - self.wall_start, 3),
+                'cpu_time': round(cpu_time() - self.cpu_start, 3),
+                rss_key: peak_rss()}
+
+
+class CountingCursor(object):
+    """Cursor of the Django connection counting the queries executed"""
+
+    def __init__(self, cursor, counter):
+        self.cursor = cursor
+        self.counter = counter
+
+    def execute(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self.counter.count += 1
+        return self.cursor.executemany(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        return getattr(self.cursor, attr)
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+
+class QueryCounter(object):
+    """Counts the queries issued through the default Django connection,
+    with an execute wrapper, or on Django versions without them, by
+    wrapping the cursors of the connection"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+    def install(self):
+        """Counts the queries of the connection; a counter installed
+        already is not installed again"""
+        if getattr(connection, 'query_counter', None) is self:
+            return
+        connection.query_counter = self
+        if hasattr(connection, 'execute_wrapper'):
+            connection.execute_wrappers.append(self)
+            return
+        for attr in ['make_cursor', 'make_debug_cursor']:
+            make = getattr(connection, attr)
+            setattr(connection, attr, self.wrap_maker(make))
+
+    def wrap_maker(self, make):
+        return lambda cursor: CountingCursor(make(cursor), self)
+
+
+def query_counter():
+    """The QueryCounter of the default connection, installed on first use:
+    the reports measure the queries by the differences of its count, so
+    every report of the process shares it"""
+    counter = getattr(connection, 'query_counter', None)
+    if counter is None:
+        counter = QueryCounter()
+        counter.install()
+    return counter
+
+
+class RunReport(object):
+    """Resources used by every parser of a run of the ParserAggregator,
+    with its match statistics, written to @fn (json)"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.usage = Usage()
+        # highest peak of the parsers and steps, as their measurements
+        # reset the peak of the process
+        self.peak_rss = 0
+        self.queries = query_counter()
+        self.parsers = []
+        self.steps = []
+
+    def start(self):
+        """Starting point of the measurement of a parser or step"""
+        return Usage(), self.queries.count
+
+    def measure(self, start):
+        usage, queries = start
+        entry = usage.get()
+        entry['queries'] = self.queries.count - queries
+        self.peak_rss = max(self.peak_rss, entry.get('peak_rss_kb', 0))
+        return entry
+
+    def add_parser(self, name, start, stats, worker_usage=None):
+        """Adds parser @name, run since @start, with its match
+        statistics @stats and the usage of its worker process"""
+        entry = self.measure(start)
+        entry['parser'] = name
+        self.set_stats(entry, stats)
+        entry['records_per_second'] = None
+        if entry['wall_time'] > 0:
+            entry['records_per_second'] = round(
+                entry['records'] / entry['wall_time'], 1)
+        if worker_usage is not None:
+            entry['worker'] = worker_usage
+        self.parsers.append(entry)
+
+    def set_stats(self, entry, stats):
+        entry['records'] = stats.get('records', 0)
+        entry['merged'] = stats.get('langs', 0)
+        entry['matched'] = dict((k, v) for k, v in stats.iteritems()
+                                if k not in NON_CLUE_STATS)
+        entry['unmatched'] = stats.get('new', 0) + stats.get('not_added', 0)
+        entry['ambiguous'] = stats.get('ambiguous', 0)
+        entry['chosen'] = stats.get('chosen', 0)
+        entry['unchosen'] = stats.get('unchosen', 0)
+
+    def update_stats(self, name, stats):
+        """Match statistics of parser @name, merged after it was added
+        (clustered runs)"""
+        for entry in self.parsers:
+            if entry['parser'] == name:
+                self.set_stats(entry, stats)
+
+    def add_skipped(self, name):
+        self.parsers.append({'parser': name, 'skipped': True})
+
+    def add_step(self, name, start):
+        entry = self.measure(start)
+        entry['step'] = name
+        self.steps.append(entry)
+
+    def write(self):
+        total = self.usage.get()
+        total['queries'] = self.queries.count
+        # of the whole run
+        total.pop('peak_rss_kb', None)
+        total['run_peak_rss_kb'] = max(self.peak_rss, peak_rss(),
+                                       total.get('run_peak_rss_kb', 0))
+        logging.info("Writing the report of the run to {0}".format(self.fn))
+        with open(self.fn, 'w') as f:
+            json.dump({'parsers': self.parsers, 'steps': self.steps,
+                       'total': total}, f, sort_keys=True, indent=1)
@@ -0,0 +1,180 @@
+import cPickle
+import logging
+import os
+import sqlite3
+
+from dld.models import normalize_alt_name, \
+                       Code, \
+                       Language
+
+from ld.langdeath_exceptions import ParserException
+from ld.language_index import db_text
+
+# records inserted in one transaction of a staging database
+STAGING_BATCH = 1000
+
+STAGING_SCHEMA = """
+CREATE TABLE records (id INTEGER PRIMARY KEY, has_sil INTEGER,
+                      sil TEXT, name TEXT, alt_name TEXT, record BLOB);
+CREATE TABLE codes (record_id INTEGER, position INTEGER, code_name TEXT,
+                    code TEXT);
+CREATE TABLE matches (record_id INTEGER, language_id INTEGER, clue TEXT);
+CREATE TABLE status (error TEXT);
+CREATE INDEX records_sil ON records (sil);
+CREATE INDEX records_name ON records (name);
+CREATE INDEX records_alt_name ON records (alt_name);
+CREATE INDEX codes_code ON codes (code_name, code);
+CREATE INDEX matches_record ON matches (record_id);
+"""
+
+
+def staging_fn(staging_dir, parser):
+    return '{0}/{1}.sqlite'.format(staging_dir, type(parser).__name__)
+
+
+def stage_records(records, fn):
+    """Writes @records to the staging database @fn, replacing its earlier
+    content. A ParserException of the parser is recorded in the database
+    (the records before it are kept) and raised again."""
+    if os.path.exists(fn):
+        os.remove(fn)
+    conn = sqlite3.connect(fn)
+    conn.text_factory = str
+    conn.executescript(STAGING_SCHEMA)
+    c = 0
+    try:
+        for lang in records:
+            c += 1
+            stage_record(conn, c, lang)
+            if c % STAGING_BATCH == 0:
+                conn.commit()
+    except ParserException as e:
+        conn.execute("INSERT INTO status VALUES (?)", (str(e),))
+        raise
+    finally:
+        conn.commit()
+        conn.close()
+    logging.info("Staged {0} langs in {1}".format(c, fn))
+    return []
+
+
+def stage_record(conn, record_id, lang):
+    """The columns of a record are the ones LanguageDB.get_closest looks
+    at, the record itself is pickled"""
+    sil = lang.get('sil')
+    if not isinstance(sil, basestring):
+        sil = None
+    name = lang.get('name')
+    alt_name = None
+    if isinstance(name, basestring) and name:
+        alt_name = normalize_alt_name(name)
+    else:
+        name = None
+    conn.execute("INSERT INTO records VALUES (?, ?, ?, ?, ?, ?)", (
+        record_id, 'sil' in lang, sil, name, alt_name,
+        sqlite3.Binary(cPickle.dumps(lang, cPickle.HIGHEST_PROTOCOL))))
+    codes = lang.get('other_codes', {})
+    for position, (src, code) in enumerate(codes.iteritems()):
+        if type(code) == list:
+            continue
+        conn.execute("INSERT INTO codes VALUES (?, ?, ?, ?)",
+                     (record_id, position, src, db_text(code)))
+
+
+class StagingMerger(object):
+    """Resolves the records of a staging database against the languages
+    of the main database with set-based SQL, in the same order of clues
+    as LanguageDB.get_closest: sil, other codes (the first one with a
+    match), name, native name and alternative name. The matches are
+    stored in the staging database too."""
+
+    def __init__(self, fn, db_fn):
+        self.fn = fn
+        self.db_fn = db_fn
+        self.tables = {
+            'language': Language._meta.db_table,
+            'code': Code._meta.db_table,
+            'language_code': Language.code.through._meta.db_table,
+            'language_alt_name': Language.alt_name.through._meta.db_table,
+            'alt_name_id': Language.alt_name.through._meta.get_field(
+                'alternativename').column,
+        }
+
+    def connect(self):
+        conn = sqlite3.connect(self.fn)
+        conn.text_factory = str
+        return conn
+
+    def resolve(self):
+        conn = self.connect()
+        conn.execute("ATTACH DATABASE ? AS db", (self.db_fn,))
+        conn.execute("DELETE FROM matches")
+        for query in self.resolution_sql():
+            conn.execute(query)
+        conn.commit()
+        conn.execute("DETACH DATABASE db")
+        matched = conn.execute(
+            "SELECT COUNT(DISTINCT record_id) FROM matches").fetchone()[0]
+        total = conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+        conn.close()
+        logging.info("{0} of {1} langs in {2} resolved".format(
+            matched, total, self.fn))
+
+    def resolution_queries(self):
+        unmatched = "r.id NOT IN (SELECT record_id FROM matches)"
+        code_match = """FROM codes {c}
+            JOIN db.{code} {k} ON {k}.code_name = {c}.code_name
+                AND {k}.code = {c}.code
+            JOIN db.{language_code} {lc} ON {lc}.code_id = {k}.id"""
+        return [
+            """INSERT INTO matches SELECT r.id, l.id, 'sil'
+            FROM records r JOIN db.{language} l ON l.sil = r.sil
+            WHERE r.has_sil""",
+            # the first code (in the order of the record) with a match
+            """INSERT INTO matches
+            SELECT DISTINCT c.record_id, lc.language_id, 'other_codes'
+            """ + code_match.format(c='c', k='k', lc='lc', **self.tables) +
+            """ JOIN records r ON r.id = c.record_id
+            WHERE NOT r.has_sil AND c.position = (
+                SELECT MIN(c2.position) """ +
+            code_match.format(c='c2', k='k2', lc='lc2', **self.tables) +
+            """ WHERE c2.record_id = c.record_id)""",
+            """INSERT INTO matches SELECT r.id, l.id, 'name'
+            FROM records r JOIN db.{language} l ON l.name = r.name
+            WHERE NOT r.has_sil AND """ + unmatched,
+            """INSERT INTO matches SELECT r.id, l.id, 'native_name'
+            FROM records r JOIN db.{language} l ON l.native_name = r.name
+            WHERE NOT r.has_sil AND """ + unmatched,
+            """INSERT INTO matches SELECT r.id, la.language_id, 'altname'
+            FROM records r JOIN db.{language_alt_name} la
+                ON la.{alt_name_id} = r.alt_name
+            WHERE NOT r.has_sil AND """ + unmatched,
+        ]
+
+    def resolution_sql(self):
+        return [q.format(**self.tables) for q in self.resolution_queries()]
+
+    def records(self):
+        """Yields the staged records in their original order; resolved
+        ones get the ids of the matching languages and the clue in
+        '_match'. A ParserException of the parser is raised at the end."""
+        conn = self.connect()
+        matches = conn.execute("""SELECT record_id, language_id, clue
+            FROM matches ORDER BY record_id, language_id""")
+        match = matches.fetchone()
+        for record_id, record in conn.execute(
+                "SELECT id, record FROM records ORDER BY id"):
+            lang = cPickle.loads(str(record))
+            ids = []
+            clue = None
+            while match is not None and match[0] == record_id:
+                ids.append(match[1])
+                clue = match[2]
+                match = matches.fetchone()
+            if len(ids) > 0:
+                lang['_match'] = (ids, clue)
+            yield lang
+        errors = [e for e, in conn.execute("SELECT error FROM status")]
+        conn.close()
+        if len(errors) > 0:
+            raise ParserException(errors[0])
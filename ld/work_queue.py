@@ -0,0 +1,276 @@
+"""File based work queue running parsers sharded on several hosts.
+
+The coordinator (the process of the ParserAggregator running the parser)
+writes a job for each sharded parser to the shared directory:
+
+    <shard_dir>/<parser>/parser.pickle   the parser
+    <shard_dir>/<parser>/todo/<n>        the work units
+    <shard_dir>/<parser>/claimed/<n>     units being parsed
+    <shard_dir>/<parser>/done/<n>        partial results
+
+Workers (python -m ld.work_queue <shard_dir>, on any host seeing the
+directory and the input files of the parsers at the same paths) claim a
+unit by moving it from todo/ to claimed/, which is atomic, and write its
+records to done/. The coordinator parses units as well while it waits, so
+a run without workers works too, and yields the records of the units in
+their order. Claims not refreshed for STALE_CLAIM seconds (the worker
+died) are put back to todo/.
+"""
+
+import copy
+import cPickle
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+from argparse import ArgumentParser
+
+from ld.langdeath_exceptions import ParserException, WorkQueueException
+
+# seconds between looking for units or results
+POLL = 1
+
+# seconds between refreshing the claim of the unit being parsed
+HEARTBEAT = 30
+
+# seconds after which a claim is considered abandoned
+STALE_CLAIM = 300
+
+
+def write_atomically(fn, data):
+    tmp_fn = '{0}.{1}.{2}.tmp'.format(fn, socket.gethostname(), os.getpid())
+    with open(tmp_fn, 'wb') as f:
+        cPickle.dump(data, f, cPickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_fn, fn)
+
+
+def read_pickle(fn):
+    with open(fn, 'rb') as f:
+        return cPickle.load(f)
+
+
+class Heartbeat(object):
+    """Refreshes the modification time of a claim until stopped"""
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT):
+            try:
+                os.utime(self.fn, None)
+            except OSError:
+                # requeued and claimed by someone else
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stopped.set()
+
+
+class WorkQueue(object):
+
+    def __init__(self, shard_dir):
+        self.shard_dir = shard_dir
+        self.parsers = {}
+
+    def job_dir(self, parser_name):
+        return '{0}/{1}'.format(self.shard_dir, parser_name)
+
+    def parse(self, parser, **kwargs):
+        """Records of parser.parse_all(**kwargs), parsed sharded if the
+        parser has work units. The ParserExceptions of the units are
+        raised together at the end, after all the records."""
+        units = parser.get_work_units(**kwargs)
+        if units is None:
+            for lang in parser.parse_all(**kwargs):
+                yield lang
+            return
+
+        job_dir = self.submit(parser, units)
+        parser.set_progress_total(len(units), 'units')
+        errors = []
+        try:
+            for i in xrange(len(units)):
+                records, error = self.wait(job_dir, self.unit_name(i))
+                parser.advance_progress()
+                for lang in records:
+                    yield lang
+                if error is not None:
+                    errors.append(error)
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+        if len(errors) > 0:
+            raise ParserException('; '.join(errors))
+
+    def unit_name(self, i):
+        return '{0:06d}'.format(i)
+
+    def submit(self, parser, units):
+        """Writes the job of @parser; the job appears to the workers with
+        all of its units at once"""
+        name = type(parser).__name__
+        job_dir = self.job_dir(name)
+        tmp_dir = '{0}.tmp'.format(job_dir)
+        for d in [job_dir, tmp_dir]:
+            if os.path.exists(d):
+                shutil.rmtree(d)
+        for sub in ['todo', 'claimed', 'done']:
+            os.makedirs('{0}/{1}'.format(tmp_dir, sub))
+        # the queue and the progress stay with the coordinator
+        job = copy.copy(parser)
+        job.work_queue = None
+        job.progress = None
+        write_atomically('{0}/parser.pickle'.format(tmp_dir), job)
+        for i, unit in enumerate(units):
+            write_atomically('{0}/todo/{1}'.format(tmp_dir, self.unit_name(i)),
+                             unit)
+        os.rename(tmp_dir, job_dir)
+        logging.info("Parser {0} split into {1} units in {2}".format(
+            name, len(units), job_dir))
+        return job_dir
+
+    def wait(self, job_dir, unit_name):
+        """Result of unit @unit_name: its records and the message of its
+        ParserException. Parses the other units of the job while it is
+        not done."""
+        done_fn = '{0}/done/{1}'.format(job_dir, unit_name)
+        while not os.path.exists(done_fn):
+            if not self.work_on(job_dir):
+                self.requeue_stale(job_dir)
+                time.sleep(POLL)
+        result = read_pickle(done_fn)
+        if 'failure' in result:
+            raise WorkQueueException("unit {0} of {1} failed: {2}".format(
+                unit_name, job_dir, result['failure']))
+        return result['records'], result['error']
+
+    def requeue_stale(self, job_dir):
+        now = time.time()
+        claimed_dir = '{0}/claimed'.format(job_dir)
+        for fn in os.listdir(claimed_dir):
+            claim_fn = '{0}/{1}'.format(claimed_dir, fn)
+            unit_name = fn.split('.')[0]
+            try:
+                if now - os.path.getmtime(claim_fn) < STALE_CLAIM:
+                    continue
+                os.rename(claim_fn, '{0}/todo/{1}'.format(job_dir, unit_name))
+                logging.warning("Unit {0} of {1} requeued".format(
+                    unit_name, job_dir))
+            except OSError:
+                # finished or requeued meanwhile
+                continue
+
+    def claim(self, job_dir):
+        """Name and claim file of a unit of @job_dir claimed by this
+        process, (None, None) if there is nothing to claim"""
+        try:
+            unit_names = sorted(os.listdir('{0}/todo'.format(job_dir)))
+        except OSError:
+            # the job has been finished
+            return None, None
+        for unit_name in unit_names:
+            claim_fn = '{0}/claimed/{1}.{2}.{3}'.format(
+                job_dir, unit_name, socket.gethostname(), os.getpid())
+            try:
+                os.rename('{0}/todo/{1}'.format(job_dir, unit_name), claim_fn)
+            except OSError:
+                # claimed by another worker
+                continue
+            try:
+                # the claim keeps the modification time of the unit, which
+                # may be older than STALE_CLAIM
+                os.utime(claim_fn, None)
+            except OSError:
+                # requeued before it was touched
+                continue
+            return unit_name, claim_fn
+        return None, None
+
+    def work_on(self, job_dir):
+        """Parses a unit of @job_dir, returns False if there was none"""
+        unit_name, claim_fn = self.claim(job_dir)
+        if unit_name is None:
+            return False
+        try:
+            unit = read_pickle(claim_fn)
+        except IOError:
+            # requeued meanwhile
+            return True
+        result = {'records': [], 'error': None}
+        with Heartbeat(claim_fn):
+            try:
+                parser = self.get_parser(job_dir)
+                for lang in parser.parse_unit(unit):
+                    result['records'].append(lang)
+            except ParserException as e:
+                result['error'] = str(e)
+            except Exception as e:
+                logging.exception("Unit {0} of {1} failed".format(
+                    unit_name, job_dir))
+                result = {'failure': repr(e)}
+        try:
+            write_atomically('{0}/done/{1}'.format(job_dir, unit_name),
+                             result)
+            os.remove(claim_fn)
+        except (OSError, IOError):
+            # the job has been finished meanwhile
+            pass
+        return True
+
+    def get_parser(self, job_dir):
+        fn = '{0}/parser.pickle'.format(job_dir)
+        # a later job of the same parser has a newer pickle
+        key = job_dir, os.path.getmtime(fn)
+        if key not in self.parsers:
+            self.parsers[key] = read_pickle(fn)
+        return self.parsers[key]
+
+    def work(self, wait=False):
+        """Parses the units of all the jobs in the shard directory until
+        there are none left, or, with @wait, until interrupted"""
+        count = 0
+        while True:
+            worked = False
+            for name in sorted(os.listdir(self.shard_dir)):
+                job_dir = self.job_dir(name)
+                if name.endswith('.tmp') or not os.path.isdir(job_dir):
+                    continue
+                while self.work_on(job_dir):
+                    worked = True
+                    count += 1
+            if not worked:
+                if not wait:
+                    break
+                time.sleep(POLL)
+        logging.info("{0} units parsed".format(count))
+
+
+def get_args():
+    parser = ArgumentParser(description='Worker parsing the units of ' +\
+                            'the sharded parsers')
+    parser.add_argument('shard_dir', help='directory of the work queue, ' +\
+                        'the --shard_dir of parser_aggregator.py')
+    parser.add_argument('-w', '--wait', action='store_true', default=False,
+                        help='wait for new units instead of exiting when ' +\
+                        'there are none')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s : " +
+                        "%(module)s (%(lineno)s) - %(levelname)s - %(message)s")
+    args = get_args()
+    WorkQueue(args.shard_dir).work(args.wait)
+
+
+if __name__ == '__main__':
+    main()
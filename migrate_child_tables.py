@@ -0,0 +1,157 @@
+import os
+if __name__ == "__main__":
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "langdeath.settings")
+    import django
+    django.setup()
+
+import logging
+from argparse import ArgumentParser
+
+from django.db import connection, transaction
+
+from dld.models import Coordinates, EndangeredLevel, Speaker
+
+# (model, link table, column of the model in the link table, kind of the
+# contributions creating the rows) of the rows that belong to one language
+CHILD_TABLES = [(Speaker, 'dld_language_speakers', 'speaker_id', 'speaker'),
+                (EndangeredLevel, 'dld_language_endangered_levels',
+                 'endangeredlevel_id', 'endangered_level'),
+                (Coordinates, 'dld_language_locations', 'coordinates_id',
+                 'location')]
+
+# one-off migration of databases created before speakers, endangered
+# levels and locations referred to their language: a row gets the language
+# of its first link, rows linked to more languages are copied for the
+# others (numbered after the largest id the table ever had), rows linked
+# to none are deleted, then the link table is dropped
+MIGRATION_SQL = [
+    "ALTER TABLE {table} ADD COLUMN language_id integer NULL "
+    "REFERENCES dld_language (id)",
+    """UPDATE {table} SET language_id = (
+        SELECT l.language_id FROM {links} l WHERE l.{column} = {table}.id
+        ORDER BY l.id LIMIT 1)""",
+    """CREATE TEMP TABLE copies (
+        n integer PRIMARY KEY, old_id integer, language_id integer)""",
+    """INSERT INTO copies (old_id, language_id)
+    SELECT l.{column}, l.language_id FROM {links} l
+    JOIN {table} t ON t.id = l.{column}
+    WHERE l.id NOT IN (SELECT MIN(id) FROM {links} GROUP BY {column})
+    ORDER BY l.id""",
+    """CREATE TEMP TABLE id_offset AS SELECT MAX(
+        COALESCE((SELECT seq FROM sqlite_sequence WHERE name = '{table}'), 0),
+        COALESCE((SELECT MAX(id) FROM {table}), 0)) AS value""",
+    """INSERT INTO {table} (id, {columns}, language_id)
+    SELECT c.n + o.value, {t_columns}, c.language_id FROM copies c
+    JOIN {table} t ON t.id = c.old_id JOIN id_offset o""",
+    "DELETE FROM {table} WHERE language_id IS NULL",
+    "DROP TABLE {links}",
+]
+
+# the contributions of the parsers refer to the copies: the contributions
+# of a copied row for the language of the copy are moved to the copy, and
+# copies with none of those get the contributions of the copied row, so
+# that retracting a parser deletes them
+CONTRIBUTION_SQL = [
+    """UPDATE dld_contribution SET object_id = (
+        SELECT c.n + o.value FROM copies c JOIN id_offset o
+        WHERE c.old_id = CAST(dld_contribution.object_id AS integer)
+        AND c.language_id = dld_contribution.language_id)
+    WHERE kind = '{kind}' AND EXISTS (
+        SELECT 1 FROM copies c
+        WHERE c.old_id = CAST(dld_contribution.object_id AS integer)
+        AND c.language_id = dld_contribution.language_id)""",
+    """INSERT INTO dld_contribution (parser_id, language_id, kind, field,
+        object_id, old_value, new_value)
+    SELECT k.parser_id, c.language_id, k.kind, k.field, c.n + o.value,
+        k.old_value, k.new_value
+    FROM copies c JOIN id_offset o JOIN dld_contribution k
+    ON k.kind = '{kind}' AND CAST(k.object_id AS integer) = c.old_id
+    WHERE NOT EXISTS (
+        SELECT 1 FROM dld_contribution k2 WHERE k2.kind = '{kind}'
+        AND CAST(k2.object_id AS integer) = c.n + o.value)
+    ORDER BY k.id""",
+]
+
+# sqlite can not make the new column NOT NULL: the table is created again
+# as the model defines it, keeping the ids and their sequence
+REBUILD_SQL = [
+    """INSERT INTO {table} ({all_columns})
+    SELECT {all_columns} FROM {table}__old""",
+    """UPDATE sqlite_sequence SET seq = (
+        SELECT MAX(seq) FROM sqlite_sequence
+        WHERE name IN ('{table}', '{table}__old'))
+    WHERE name = '{table}'""",
+    "DROP TABLE {table}__old",
+]
+
+
+def get_columns(cursor, table):
+    cursor.execute("PRAGMA table_info({0})".format(table))
+    return [row[1] for row in cursor.fetchall()]
+
+
+def count_rows(cursor, table):
+    cursor.execute("SELECT COUNT(*) FROM {0}".format(table))
+    return cursor.fetchone()[0]
+
+
+def migrate_table(cursor, model, links, column, kind):
+    table = model._meta.db_table
+    columns = get_columns(cursor, table)
+    if 'language_id' in columns:
+        logging.info("{0} is migrated already".format(table))
+        return
+    before = count_rows(cursor, table)
+    data_columns = [c for c in columns if c != 'id']
+    queries = list(MIGRATION_SQL)
+    if 'dld_contribution' in connection.introspection.table_names(cursor):
+        queries[-2:-2] = CONTRIBUTION_SQL
+    for query in queries + ["DROP TABLE copies", "DROP TABLE id_offset"]:
+        cursor.execute(query.format(
+            table=table, links=links, column=column, kind=kind,
+            columns=', '.join(data_columns),
+            t_columns=', '.join('t.' + c for c in data_columns)))
+    rebuild_table(cursor, model)
+    logging.info("{0}: {1} -> {2} rows".format(
+        table, before, count_rows(cursor, table)))
+
+
+def rebuild_table(cursor, model):
+    table = model._meta.db_table
+    cursor.execute("ALTER TABLE {0} RENAME TO {0}__old".format(table))
+    with connection.schema_editor() as editor:
+        editor.create_model(model)
+    all_columns = ', '.join(f.column for f in model._meta.local_fields)
+    for query in REBUILD_SQL:
+        cursor.execute(query.format(table=table, all_columns=all_columns))
+
+
+def migrate_child_tables(vacuum):
+    with transaction.atomic():
+        cursor = connection.cursor()
+        for model, links, column, kind in CHILD_TABLES:
+            migrate_table(cursor, model, links, column, kind)
+    if vacuum:
+        logging.info("Vacuuming the database")
+        connection.cursor().execute("VACUUM")
+
+
+def get_args():
+    parser = ArgumentParser(description='Moves the language of the ' +\
+                            'speakers, endangered levels and locations ' +\
+                            'of a database created by an earlier version ' +\
+                            'of parser_aggregator.py from their link ' +\
+                            'tables to the rows themselves (run it once)')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='shrink the database file afterwards')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    args = get_args()
+    migrate_child_tables(args.vacuum)
+
+
+if __name__ == "__main__":
+    main()
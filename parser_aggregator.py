@@ -4,47 +4,50 @@ if __name__ == "__main__":
 
 import sys
 import logging
+import cPickle
+import tempfile
 from argparse import ArgumentParser
-import re
+from collections import defaultdict
 
-from django.db import transaction
-
-from dld.models import Language
+from django.db import connection, transaction, DatabaseError
 
 from ld.lang_db import LanguageDB
+from ld.memory_lang_db import MemoryLanguageDB
+from ld.parser_registry import ParserRegistry
+from ld.parsers.base_parsers import OnlineParser
+from ld.parser_scheduler import ParserScheduler
+from ld.run_manifest import RunManifest
+from ld.staging import StagingMerger, stage_records, staging_fn
+from ld.run_checkpoint import RunCheckpoint, CHECKPOINT_RECORDS
+from ld.work_queue import WorkQueue
+from ld.run_report import RunReport
+from ld.progress import Progress, ProgressMonitor, PROGRESS_INTERVAL
+from ld.fuzzy_index import FUZZY_THRESHOLD
+from ld.candidate_scorer import CandidateScorer, CHOOSE_BEST, \
+    CHOOSE_MARGIN, AMBIGUOUS
+from ld.identity_graph import IdentityGraph
 from ld.langdeath_exceptions import UnknownLanguageException, \
     ParserException
 
-# parsers
-from ld.parsers.iso_639_3_parser import ParseISO639_3
-from ld.parsers.omniglot_parser import OmniglotParser
-from ld.parsers.ethnologue_parser import EthnologueOfflineParser, \
-    EthnologueOnlineParser
-from ld.parsers.crubadan_parser import CrubadanParser
-from ld.parsers.language_archives_parser import \
-    LanguageArchivesOfflineParser, LanguageArchivesOnlineParser
-from ld.parsers.macro_wp_parser import MacroWPParser
-from ld.parsers.software_support_parser import SoftwareSupportParser
-from ld.parsers.wals_info_parser import WalsInfoParser
-from ld.parsers.indigenous_parser import IndigenousParser
-from ld.parsers.dbpedia_parser_aggregator import DbpediaParserAggregator
-from ld.parsers.firefox_parser import FirefoxParser
-from ld.parsers.list_of_wikipedia_parser import WikipediaListOfLanguagesParser
-from ld.parsers.wikipedia_incubators_parser import WikipediaIncubatorsParser
-from ld.parsers.wpsize_counter import WikipediaAdjustedSizeCounter_WPExtractor, \
-    WPIncubatorAdjustedSizeCounter
-from ld.parsers.google_translate_parser import GoogleTranslateParser
-from ld.parser_aggregator_utils import write_out_new_langs,\
-        write_out_found_langs, write_out_new_altnames
-from ld.parsers.endangered_parser import EndangeredParser
-from ld.parsers.tsv_parser import L2Parser, EthnologueDumpParser, UrielParser,\
-        EthnologueMacroParser
-from ld.parsers.bible_org_parser import BiblesParser
-from ld.parsers.list_parser import LeibzigCorporaParser, SirenLanguagesParser
-from ld.parsers.treetagger_parser import TreeTaggerParser
-from ld.parsers.find_bible_parser import FindBibleOfflineParser
-from ld.parsers.glottolog_parser import GlottologParser
-from ld.parsers.endangered_resources_parser import EndangeredResourcesParser
+from ld.parser_aggregator_utils import MergeLog, get_lang_values, \
+    NEW_LANGS_HEADER, FOUND_LANGS_HEADER, ALTNAMES_HEADER
+
+
+def spool_records(records, f):
+    """Yields @records while pickling them to @f"""
+    for lang in records:
+        cPickle.dump(lang, f, cPickle.HIGHEST_PROTOCOL)
+        yield lang
+
+
+def unspool_records(f):
+    f.seek(0)
+    while True:
+        try:
+            yield cPickle.load(f)
+        except EOFError:
+            f.close()
+            return
 
 
 class ParserAggregator(object):
@@ -53,130 +56,400 @@ class ParserAggregator(object):
     two langauges (or any other data) that are possibly the same
     """
     
-    def __init__(self, data_dump_dir, log_dir, pickle_dir, res_dir, extended):
-        mappings_file = "/".join([res_dir, "dump_filenames"])
-        mappings      = dict([l.strip().split('\t')
-                                 for l in open(mappings_file)])
-
-        pickles, dump_dir = self.check_dirs(
-            data_dump_dir, mappings, pickle_dir)
-
-        # initializing parsers which need data dumps
-        parser_names = [
-            'EthnologueDumpParser','LanguageArchivesOfflineParser',
-            'UrielParser', 'DbpediaParserAggregator',
-            'WikipediaAdjustedSizeCounter_WPExtractor',
-            'WPIncubatorAdjustedSizeCounter',
-            'EndangeredParser', 'FindBibleOfflineParser', 'CrubadanParser']
-        eth_parser, la_parser, uriel_parser, dbpedia_parser,\
-                wp_adjusted_parser, wpinc_adj_parser, endangered_parser,\
-        find_bible_parser, crubadan_parser = \
-                self.init_dump_based_parsers(pickles, dump_dir, parser_names,
-                                             res_dir)
-        #initializing all parsers
-        self.parsers = [ParseISO639_3(extended), MacroWPParser(), uriel_parser, dbpedia_parser,
-                        eth_parser, EthnologueMacroParser(res_dir + "/" + "ethnologue_macro"), 
-                        GlottologParser(),
-                        L2Parser(res_dir + "/" + "ethnologue_l2"),
-                        crubadan_parser, la_parser,
-                        WalsInfoParser(res_dir), IndigenousParser(res_dir),
-                        BiblesParser(), EndangeredResourcesParser(),
-                        LeibzigCorporaParser(res_dir + "/" + "leipzig_corpora"),
-                        SirenLanguagesParser(res_dir + "/" + "siren_list"),
-                        TreeTaggerParser(),
-                        find_bible_parser,
-                        WikipediaListOfLanguagesParser(res_dir),
-                        WikipediaIncubatorsParser(res_dir),
-                        wp_adjusted_parser,
-                        endangered_parser, OmniglotParser(
-                            '{0}/mappings/omniglot'.format(res_dir)),
-                        FirefoxParser('{0}/mappings/firefox'.format(res_dir)),
-                        SoftwareSupportParser(res_dir), wpinc_adj_parser]
+    def __init__(self, data_dump_dir, log_dir, pickle_dir, res_dir, extended,
+                 jobs=1, manifest_fn=None, retract=None, resume=False,
+                 checkpoint_every=CHECKPOINT_RECORDS, only=None, skip=None,
+                 snapshot_fn=None, compress_logs=False, staging_dir=None,
+                 online_jobs=0, shard_dir=None, report_fn=None,
+                 progress_every=PROGRESS_INTERVAL, fuzzy_threshold=None,
+                 choose_best=CHOOSE_BEST, choose_margin=CHOOSE_MARGIN,
+                 ambiguous=AMBIGUOUS, cluster=False):
+        # dry run: languages are merged in memory and written to a
+        # snapshot, the database is only read (countries)
+        self.snapshot_fn = snapshot_fn
+        self.dry_run = snapshot_fn is not None
+        if self.dry_run and (retract is not None or resume or
+                             manifest_fn is not None):
+            raise ParserException("A dry run can not be incremental, "
+                                  "resumed or retract a parser")
+        # clustered run: the records of all parsers are collected and
+        # clustered into language identities before any of them is merged
+        # (see run_clustered)
+        self.graph = IdentityGraph() if cluster else None
+        if cluster and (retract is not None or resume or staging_dir
+                        is not None or manifest_fn is not None):
+            raise ParserException("A clustered run can not be incremental, "
+                                  "resumed, staged or retract a parser")
+        # staging: parsers write their output to their own sqlite database,
+        # resolved against the languages with set-based sql when merged
+        self.staging_dir = staging_dir
+        if self.dry_run and staging_dir is not None:
+            raise ParserException("A dry run can not use staging")
+        # parsers are imported and constructed only if they are run
+        registry = ParserRegistry(data_dump_dir, pickle_dir, res_dir,
+                                  extended)
+        selected = registry.select(only, skip)
+        # retracting a parser: only that parser is run again, the data of
+        # the others is already in the database
+        self.retracted = None
+        if retract is not None:
+            selected = [registry.canonical_name(retract)]
+            self.retracted = retract
+        # resuming a crashed run: the parsers merged completely are not
+        # run again
+        self.checkpoint = RunCheckpoint()
+        self.checkpoint_every = checkpoint_every
+        if resume:
+            self.checkpoint.load()
+            selected = [n for n in selected
+                        if n not in self.checkpoint.completed]
+        # dependencies on parsers not run are taken as satisfied by the
+        # data of earlier runs
+        already_merged = [n for n in registry.names if n not in selected]
+        self.parsers = [registry.create(name) for name in selected]
         self.parsers = filter(lambda x:x != None, self.parsers)
-        self.lang_db = LanguageDB()
-        self.trusted_parsers = set([ParseISO639_3, GlottologParser, CrubadanParser,
-                                    EndangeredParser])
-        self.parsers_needs_sil = set([EthnologueOfflineParser,
-                                      EthnologueOnlineParser,
-                                      LanguageArchivesOnlineParser])
+        # sharding: parsers split into work units are parsed by the
+        # workers of a file based work queue (see ld/work_queue.py)
+        if shard_dir is not None:
+            for parser in self.parsers:
+                parser.work_queue = WorkQueue(shard_dir)
+        if self.retracted is not None and \
+           self.retracted not in [p.__class__.__name__ for p in self.parsers]:
+            raise ParserException(
+                "Parser to retract is not run: {0}".format(retract))
+        # parsers knowing their total work report their progress; it is
+        # shared with the worker processes forked later
+        for parser in self.parsers:
+            parser.progress = Progress(parser.__class__.__name__)
+        self.monitor = ProgressMonitor([p.progress for p in self.parsers],
+                                       progress_every)
+        self.lang_db = MemoryLanguageDB() if self.dry_run else LanguageDB()
+        # candidates of ambiguous langs updated (see ld/candidate_scorer.py)
+        self.lang_db.scorer = CandidateScorer(choose_best, choose_margin,
+                                              ambiguous)
+        # match statistics by parser: langs, langs found by each clue,
+        # ambiguous langs (with one candidate chosen or none), new and not
+        # added langs
+        self.match_stats = {}
+        self.trusted_parsers = set(['ParseISO639_3', 'GlottologParser',
+                                    'CrubadanParser', 'EndangeredParser'])
+        # names of untrusted parsers found by no other clue are matched to
+        # similar names (clue 'fuzzy'), None turns this off
+        self.fuzzy_threshold = fuzzy_threshold
         self.debug_dir = log_dir
+        self.compress_logs = compress_logs
+        self.logs = {}
         self.pickle_dir = pickle_dir
         self.extended = extended
+        self.jobs = jobs
+        # parsers run in worker processes
+        self.concurrent = jobs > 1 or online_jobs > 0
+        # the order of self.parsers only matters for independent parsers,
+        # dependencies are declared by the parsers themselves
+        self.scheduler = ParserScheduler(self.parsers, self.make_parse_call,
+                                         jobs, already_merged, online_jobs)
+        # incremental runs: parsers whose input did not change are skipped
+        self.manifest = None
+        if manifest_fn is not None:
+            self.manifest = RunManifest(manifest_fn, {'extended': extended})
+        self.changed = set(self.checkpoint.state.get('changed', []))
+        # resources used by every parser (see ld/run_report.py)
+        if report_fn is None:
+            report_fn = os.path.join(log_dir, 'run_report.json')
+        self.report = RunReport(report_fn)
 
-    def check_dirs(self, data_dump_dir, classname_to_fn, pickle_dir):
-        
-        dump_dir = {}
-        pickle_fns = os.listdir(pickle_dir)
-        pickled_pattern = re.compile('(.*?).pickle$')
-        pickled = []
-        for f in pickle_fns:
-            matched = pickled_pattern.match(f)
-            if matched != None:
-                base = matched.groups()[0]
-                logging.info('Parser {} will only load {}/{}'.format(
-                    base, pickle_dir, f))
-                pickled.append(base)
-        files = os.listdir(data_dump_dir)
-        for k, v in classname_to_fn.iteritems():
-            if v in files:
-                dump_dir[k] = '{}/{}'.format(data_dump_dir, v)
-            elif v not in pickled:
-                logging.info("Parser {} has no input, so it'll get skipped".format(
-                base))
-        return pickled, dump_dir
-    
-    def init_dump_based_parsers(self, pickles, dump_dir, parser_names, res_dir):
-        dummy_fn = 'dummy_fn'
-        initialized_parsers = []
-        for classname in parser_names:
-            if classname in pickles:
-                initialized_parsers.append(eval(classname)(dummy_fn))
-            elif classname in dump_dir:
-                if classname == 'EndangeredParser':
-                    endangered_dump_dir =\
-                            dump_dir['EndangeredParser']
-                    initialized_parsers.append(
-                        EndangeredParser('{}/endangered_ids'.format(res_dir),
-                                         endangered_dump_dir))   
-                else:
-                    initialized_parsers.append(eval(classname)(
-                        dump_dir[classname]))
-            else:
-                if classname == 'LanguageArchivesOfflineParser':
-                    initialized_parsers.append(
-                        LanguageArchivesOnlineParser())
-                else:    
-                    initialized_parsers.append(None)
-        return initialized_parsers
-
-        
     def run(self):
         
-        for parser in self.parsers:
+        for parser in self.scheduler.order:
             parser.pickle_dir = self.pickle_dir
+            if parser.__class__.__name__ == self.retracted:
+                self.retract(parser)
+        if self.graph is not None:
+            self.run_clustered()
+            return
+        self.monitor.start()
+        if self.concurrent:
+            # parsers run in worker processes, while their output is merged
+            # here, in the same order as in a sequential run
+            for parser in self.scheduler.order:
+                if self.is_up_to_date(parser):
+                    # decided only when its dependencies are merged
+                    self.scheduler.defer(parser)
+            self.scheduler.start_all()
+        for parser in self.scheduler.order:
+            if self.is_up_to_date(parser):
+                logging.info("Input of parser {0} did not change, "
+                             "skipping it".format(type(parser)))
+                self.checkpoint.finished(parser.__class__.__name__)
+                self.report.add_skipped(parser.__class__.__name__)
+                self.monitor.merged(parser.__class__.__name__)
+                self.scheduler.merged(parser)
+                continue
+            records = None
+            if self.concurrent:
+                records = self.scheduler.records(parser)
+            start = self.report.start()
             try:
-                self.call_parser(parser)
+                self.run_parser(parser, records)
+            except DatabaseError:
+                # the data merged since the last checkpoint may be written
+                # partly: it is rolled back, and the run can be resumed
+                # from the checkpoint
+                logging.exception("Writing the data of parser {0} failed, "
+                                  "stopping".format(type(parser)))
+                if not self.dry_run:
+                    transaction.rollback()
+                    transaction.set_autocommit(True)
+                raise
             except:
                 logging.exception("Parser {0} failed; continuing anyway".format(
                     type(parser)))
-                
+                # its partial data is committed with the next checkpoint
+                self.checkpoint.finished(parser.__class__.__name__)
+            self.report.add_parser(
+                parser.__class__.__name__, start,
+                self.match_stats.get(parser.__class__.__name__, {}),
+                self.scheduler.worker_usage(parser))
+            self.monitor.merged(parser.__class__.__name__)
+            self.scheduler.merged(parser)
+        self.monitor.stop()
+
+    def is_up_to_date(self, parser):
+        """True in incremental runs, if neither the input of @parser nor
+        the data of the parsers it depends on changed since the last run"""
+        name = parser.__class__.__name__
+        if self.manifest is None or name == self.retracted:
+            return False
+        if len(self.scheduler.dependencies[name] & self.changed) > 0:
+            return False
+        return self.manifest.is_current(
+            name, self.manifest.input_fingerprint(parser))
+
+    def make_parse_call(self, parser):
+        if self.is_up_to_date(parser):
+            return None
+        parse_call = self.choose_parse_call(parser)
+        if self.staging_dir is not None:
+            fn = staging_fn(self.staging_dir, parser)
+            return lambda: stage_records(parse_call(), fn)
+        return parse_call
+
+    def staged_records(self, parser, records=None):
+        """Stages the output of @parser (unless a worker did it, sending
+        no @records), resolves it and returns the resolved records"""
+        fn = staging_fn(self.staging_dir, parser)
+        try:
+            if records is None:
+                stage_records(self.choose_parse_call(parser)(), fn)
+            else:
+                for lang in records:
+                    pass
+        except ParserException:
+            # kept in the staging database, raised again after its records
+            pass
+        # the database the ORM uses, the test database in tests
+        merger = StagingMerger(fn, connection.settings_dict['NAME'])
+        merger.resolve()
+        return merger.records()
+
+    def run_parser(self, parser, records=None):
+        if self.staging_dir is not None:
+            records = self.staged_records(parser, records)
+        if self.manifest is None:
+            self.call_parser(parser, records)
+            return
+        name = parser.__class__.__name__
+        completed = True
+        fingerprint = self.manifest.input_fingerprint(parser)
+        if fingerprint is None:
+            # no local input, the parser is fingerprinted by its output
+            if records is None:
+                records = self.choose_parse_call(parser)()
+            # the output is kept in a temporary file, not in memory, until
+            # it turns out whether it has to be merged
+            spool = tempfile.TemporaryFile()
+            try:
+                fingerprint = self.manifest.output_fingerprint(
+                    parser, spool_records(records, spool))
+            except ParserException as e:
+                logging.exception(e)
+                completed = False
+                fingerprint = None
+            records = unspool_records(spool)
+            deps_changed = self.scheduler.dependencies[name] & self.changed
+            if completed and len(deps_changed) == 0 and \
+               self.manifest.is_current(name, fingerprint):
+                logging.info("Output of parser {0} did not change, "
+                             "skipping it".format(type(parser)))
+                self.checkpoint.finished(name)
+                return
+        if name in self.manifest.fingerprints:
+            # the earlier data of the parser is replaced, not added to
+            self.retract(parser)
+        self.changed.add(name)
+        completed = self.call_parser(parser, records) and completed
+        if completed:
+            # pickles written by the parser are part of its input from now
+            fingerprint = self.manifest.input_fingerprint(parser) or \
+                fingerprint
+            self.manifest.update(name, fingerprint)
+
+    def retract(self, parser):
+        """Removes the data @parser contributed to the database"""
+        with transaction.atomic():
+            self.lang_db.retract_parser(str(type(parser)))
 
     def choose_parse_call(self, parser):
         parse_call = None
-        if type(parser) in self.parsers_needs_sil:
+        if parser.needs_sil:
+            sils = self.lang_db.get_sils()
+            if self.graph is not None:
+                # the sils of the records collected, not merged yet
+                sils = sorted(set(sils) | self.graph.sils)
             # keep only real sils, not the artificial ones coming from cru
-            sils = filter(lambda x: len(x) == 3,
-                          Language.objects.values_list("sil", flat=True))
+            sils = filter(lambda x: len(x) == 3, sils)
             parse_call = lambda: parser.parse(sils)
         else:
             parse_call = lambda: parser.parse()
         return parse_call
 
+    def run_clustered(self):
+        """Collects the records of all parsers, clusters them into
+        language identities (see ld/identity_graph.py), then merges them
+        one cluster at a time: the records of a cluster update the
+        languages its first record (one with a sil, if any) was merged
+        into, whatever the order of the parsers"""
+        spool = tempfile.TemporaryFile()
+        # offset of every record in the spool, and the index of its parser
+        offsets, owners = [], []
+        states = {}
+        self.parser = None
+        self.monitor.start()
+        if self.concurrent:
+            self.scheduler.start_all()
+        for index, parser in enumerate(self.scheduler.order):
+            self.parser = parser
+            self.parser_name = parser.__class__.__name__
+            self.stats = self.match_stats.setdefault(self.parser_name,
+                                                     defaultdict(int))
+            self.new_lang_count = 0
+            self.temp_code_index = 0
+            self.open_logs()
+            start = self.report.start()
+            try:
+                if self.concurrent:
+                    records = self.scheduler.records(parser)
+                else:
+                    records = self.choose_parse_call(parser)()
+                for lang in records:
+                    lang['parser'] = str(type(parser))
+                    self.stats['records'] += 1
+                    offsets.append(spool.tell())
+                    owners.append(index)
+                    cPickle.dump(lang, spool, cPickle.HIGHEST_PROTOCOL)
+                    self.graph.add(lang)
+            except:
+                logging.exception("Parser {0} failed; continuing anyway".format(
+                    type(parser)))
+            states[self.parser_name] = self.get_merge_state()
+            self.report.add_parser(self.parser_name, start, self.stats,
+                                   self.scheduler.worker_usage(parser))
+            self.monitor.merged(self.parser_name)
+            self.scheduler.merged(parser)
+        self.monitor.stop()
+        start = self.report.start()
+        clusters = self.graph.clusters()
+        self.report.add_step('cluster', start)
+
+        start = self.report.start()
+        if not self.dry_run:
+            transaction.set_autocommit(False)
+        merged = 0
+        self.switch_parser(None, states)
+        for cluster in clusters:
+            records = []
+            for i in cluster:
+                spool.seek(offsets[i])
+                records.append((owners[i], cPickle.load(spool)))
+            # records with a sil decide the languages of the cluster
+            records.sort(key=lambda r: 'sil' not in r[1])
+            ids = None
+            for index, lang in records:
+                self.switch_parser(self.scheduler.order[index], states)
+                if ids:
+                    lang['_match'] = (ids, 'cluster')
+                tgts = self.add_lang(lang)
+                if not ids:
+                    ids = [l.pk for l in tgts]
+                merged += 1
+                if merged % self.checkpoint_every == 0 and not self.dry_run:
+                    self.lang_db.flush()
+                    transaction.commit()
+        spool.close()
+        self.switch_parser(None, states)
+        self.lang_db.set_contributor(None)
+        if not self.dry_run:
+            transaction.commit()
+            transaction.set_autocommit(True)
+        for name, state in states.iteritems():
+            for log in state['logs'].itervalues():
+                log.close()
+            if state['new_lang_count'] > 0 and name in self.trusted_parsers:
+                logging.info("New languages added from {0}: {1}".format(
+                    name, state['new_lang_count']))
+            elif state['new_lang_count'] > 0:
+                logging.warning("New languages found but not added from" + \
+                                " {0} (not a trusted parser): {1}".format(
+                                  name, state['new_lang_count']))
+            self.report.update_stats(name, self.match_stats[name])
+        self.report.add_step('merge_clusters', start)
+
+    def get_merge_state(self):
+        return {'logs': self.logs, 'new_lang_count': self.new_lang_count,
+                'temp_code_index': self.temp_code_index}
+
+    def switch_parser(self, parser, states):
+        """Merges the records of @parser from now on, with its logs and
+        counters kept in @states (clustered runs)"""
+        if parser is self.parser:
+            return
+        if self.parser is not None:
+            states[self.parser_name] = self.get_merge_state()
+        self.parser = parser
+        if parser is None:
+            return
+        self.parser_name = parser.__class__.__name__
+        self.stats = self.match_stats[self.parser_name]
+        state = states[self.parser_name]
+        self.logs = state['logs']
+        self.new_lang_count = state['new_lang_count']
+        self.temp_code_index = state['temp_code_index']
+        self.lang_db.switch_contributor(str(type(parser)))
+
     def add_lang(self, lang):
+        """Merges @lang; returns the languages it updated or added"""
+        tgts = []
         try:
-            candidates, clue = self.lang_db.get_closest(lang)
+            if '_match' in lang and not self.lang_db.is_stale(lang):
+                # resolved in advance, in a batch or the staging database
+                ids, clue = lang['_match']
+                candidates = self.lang_db.get_languages(ids)
+            else:
+                candidates, clue = self.lang_db.get_closest(lang)
+            if len(candidates) == 0 and self.fuzzy_threshold is not None \
+               and not self.is_trusted():
+                candidates, clue = self.lang_db.get_fuzzy(
+                    lang, self.fuzzy_threshold)
+            self.stats['langs'] += 1
+            if len(candidates) > 0:
+                self.stats[clue] += 1
             if len(candidates) > 1:
+                self.stats['ambiguous'] += 1
                 tgts = self.lang_db.choose_candidates(lang, candidates)
+                if len(tgts) == 1:
+                    self.stats['chosen'] += 1
+                elif len(tgts) == 0:
+                    self.stats['unchosen'] += 1
                 for tgt in tgts:
                     self.lang_db.update_lang_data(tgt, lang)
                     self.add_data_to_loglists(lang, tgt.name, clue)
@@ -184,18 +457,23 @@ class ParserAggregator(object):
                 best = candidates[0]
                 self.lang_db.update_lang_data(best, lang)
                 self.add_data_to_loglists(lang, best.name, clue)
+                tgts = [best]
             elif len(candidates) == 0:
-                self.new_langs.append(lang) 
-                if type(self.parser) == ParseISO639_3 or\
-                (self.extended and type(self.parser) in self.trusted_parsers): 
-                    if type(self.parser) != ParseISO639_3:
-                        # assigning temporary code 
-                        temporary_code = '{}.{}'.format(
-                            self.parser.__class__.__name__, self.temp_code_index)
-                        self.temp_code_index += 1
-                        lang['sil'] = temporary_code    
-                    self.lang_db.add_new_language(lang)
+                self.new_lang_count += 1
+                added = self.parser_name == 'ParseISO639_3' or\
+                    (self.extended and self.is_trusted())
+                if added and self.parser_name != 'ParseISO639_3':
+                    # assigning temporary code 
+                    temporary_code = '{}.{}'.format(
+                        self.parser.__class__.__name__, self.temp_code_index)
+                    self.temp_code_index += 1
+                    lang['sil'] = temporary_code    
+                self.write_log('new', get_lang_values(lang))
+                if added:
+                    tgts = [self.lang_db.add_new_language(lang)]
+                    self.stats['new'] += 1
                 else:
+                    self.stats['not_added'] += 1
                     msg = "{0} parser produced a language with data" \
                         + " {1} that seems to be a new language, but" \
                         + " this parser is not a trusted parser"
@@ -203,31 +481,80 @@ class ParserAggregator(object):
                         type(self.parser), lang))
         except ParserException as e:
             logging.exception(e)
-            return
         except UnknownLanguageException as e:
-            return
+            pass
+        return tgts
                     
     def add_data_to_loglists(self, lang, name, clue):
-        self.found_langs.append((lang, [name, clue]))
+        self.write_log('found', get_lang_values(lang) + [name, clue])
         if 'alt_names' in lang:
             a_l = lang['alt_names']
             if type(a_l) in [str, unicode]:
                 a_l = [a_l]
             for a_n in a_l:
-                self.new_altnames.append((a_n, lang.get('name', ''), name))
+                self.write_log('altnames', [a_n, lang.get('name', ''), name])
+
+    def open_logs(self):
+        """The logs of the current parser, written as its records are
+        merged"""
+        self.logs = {}
+        if self.debug_dir is None:
+            return
+        self.logs = {
+            'new': MergeLog(self.get_out_fn(new=True), NEW_LANGS_HEADER,
+                            self.compress_logs),
+            'found': MergeLog(self.get_out_fn(), FOUND_LANGS_HEADER,
+                              self.compress_logs),
+            'altnames': MergeLog(self.get_out_fn(altnames=True),
+                                 ALTNAMES_HEADER, self.compress_logs)}
+
+    def write_log(self, kind, values):
+        if kind in self.logs:
+            self.logs[kind].write(values)
     
-    def call_parser(self, parser):
-        transaction.set_autocommit(False)
+    def call_parser(self, parser, records=None):
+        """Merges the output of @parser into the database; returns False
+        if the parser stopped with an error"""
+        if not self.dry_run:
+            transaction.set_autocommit(False)
+        completed = True
         c = 0
         self.parser = parser
-        self.new_langs = []
-        self.new_altnames = []
-        self.found_langs = []
+        self.parser_name = parser.__class__.__name__
+        self.stats = self.match_stats.setdefault(self.parser_name,
+                                                 defaultdict(int))
+        self.new_lang_count = 0
+        self.open_logs()
         if self.extended:
             self.temp_code_index = 0
+        name = parser.__class__.__name__
+        merged, state = self.checkpoint.resumed_state(name)
+        if merged > 0:
+            # the parser is assumed to yield the same records in the same
+            # order as before the crash, which online parsers may not
+            logging.info("Skipping the first {0} langs of parser {1}, "
+                         "merged before the checkpoint".format(
+                             merged, type(parser)))
+            if isinstance(parser, OnlineParser):
+                logging.warning("Parser {0} is online, its output may "
+                                "differ from the one merged before the "
+                                "checkpoint".format(type(parser)))
+            self.set_parser_state(state)
+        self.lang_db.set_contributor(str(type(parser)))
         try:
-            for lang in self.choose_parse_call(parser)():
+            if records is None:
+                records = self.choose_parse_call(parser)()
+            if self.staging_dir is None:
+                records = self.lang_db.resolve_batches(records)
+            else:
+                self.lang_db.track_changes()
+            for lang in records:
                 c += 1
+                self.stats['records'] += 1
+                if c <= merged:
+                    continue
+                if c % self.checkpoint_every == 0:
+                    self.save_checkpoint(name, c - 1)
                 if c % 100 == 0:
                     logging.info("Added {0} langs from parser {1}".format(
                         c, type(parser)))
@@ -237,32 +564,62 @@ class ParserAggregator(object):
 
         except ParserException as e:
             logging.exception(e)
+            completed = False
 
-        if len(self.new_langs) > 0:
-            if type(self.parser) in self.trusted_parsers:
+        if self.new_lang_count > 0:
+            if self.is_trusted():
                 logging.info("New languages added from {0}: {1}".format(
-                               type(self.parser), len(self.new_langs)))
+                               type(self.parser), self.new_lang_count))
             else:
                 logging.warning("New languages found but not added from" + \
                                 " {0} (not a trusted parser): {1}".format(
-                                  type(self.parser), len(self.new_langs)))
-
-        if self.debug_dir != None:
-            if len(self.new_langs) > 0:
-                write_out_new_langs(
-                    self.new_langs, self.get_out_fn(new=True))
-            if len(self.found_langs) > 0:    
-                write_out_found_langs(self.found_langs, self.get_out_fn())
-            if len(self.new_altnames) > 0:
-                write_out_new_altnames(
-                self.new_altnames, self.get_out_fn(altnames=True))
-        transaction.commit()
-        transaction.set_autocommit(True)
+                                  type(self.parser), self.new_lang_count))
+
+        for log in self.logs.itervalues():
+            log.close()
+        self.lang_db.set_contributor(None)
+        self.checkpoint.finished(name)
+        self.save_checkpoint(None, 0)
+        if not self.dry_run:
+            transaction.set_autocommit(True)
+        return completed
     
+    def is_trusted(self):
+        return self.parser_name in self.trusted_parsers
+
+    def get_parser_state(self):
+        state = {'new_lang_count': self.new_lang_count,
+                 'logs': dict((kind, (log.tell(), log.count))
+                              for kind, log in self.logs.iteritems()),
+                 'changed': sorted(self.changed)}
+        if self.extended:
+            state['temp_code_index'] = self.temp_code_index
+        return state
+
+    def set_parser_state(self, state):
+        self.new_lang_count = state['new_lang_count']
+        for kind, (size, count) in state['logs'].iteritems():
+            if kind in self.logs:
+                self.logs[kind].restore(size, count)
+        if self.extended:
+            self.temp_code_index = state['temp_code_index']
+
+    def save_checkpoint(self, parser_name, merged):
+        """Commits the data merged so far together with the checkpoint:
+        @merged records of @parser_name (None between parsers)"""
+        if self.dry_run:
+            return
+        self.lang_db.flush()
+        state = {'changed': sorted(self.changed)}
+        if parser_name is not None:
+            state = self.get_parser_state()
+        self.checkpoint.update(parser_name, merged, state)
+        transaction.commit()
+
     def get_out_fn(self, new=False, altnames=False):
         classname = self.parser.__class__.__name__
         if new:
-            if type(self.parser) in self.trusted_parsers:
+            if self.is_trusted():
                 new_lang_label = 'new_langs'
             else:
                 new_lang_label = 'notfound_langs'
@@ -299,6 +656,124 @@ def get_args():
                         ' a retired sil code, possibly extended by languages' +\
                         ' found by trusted parsers')
 
+    parser.add_argument('-z', '--gzip_logs',
+                        action='store_true',
+                        help='gzip the log files')
+
+    parser.add_argument('-s', '--staging_dir',
+                        help='directory of the staging databases: the output' +\
+                        ' of every parser is written to its own sqlite' +\
+                        ' file, and resolved with sql when merged')
+
+    parser.add_argument('-j', '--jobs',
+                        type=int, default=1,
+                        help='number of parsers running concurrently in' +\
+                        ' worker processes (defaults to 1, no concurrency)')
+
+    parser.add_argument('-o', '--online_jobs',
+                        type=int, default=0,
+                        help='number of online parsers (waiting for the' +\
+                        ' network) running concurrently, besides the' +\
+                        ' --jobs offline parsers (defaults to 0: online' +\
+                        ' parsers share the --jobs slots)')
+
+    parser.add_argument('--shard_dir',
+                        help='directory of the work queue of the parsers' +\
+                        ' split into work units (dump files, sil ranges),' +\
+                        ' shared with the workers started by' +\
+                        ' `python -m ld.work_queue SHARD_DIR`')
+
+    parser.add_argument('--report',
+                        help='json report of the resources used by every' +\
+                        ' parser (time, memory, queries) and its match' +\
+                        " statistics (defaults to 'run_report.json' in" +\
+                        ' the log directory)')
+
+    parser.add_argument('--progress_every',
+                        metavar='SECONDS', type=int,
+                        default=PROGRESS_INTERVAL,
+                        help='seconds between two reports of the progress' +\
+                        ' (throughput and ETA) of the parsers knowing' +\
+                        ' their total work, and of the run (defaults to' +\
+                        ' {0})'.format(PROGRESS_INTERVAL))
+
+    parser.add_argument('--fuzzy',
+                        metavar='THRESHOLD', type=float,
+                        help='match the langs of untrusted parsers found by' +\
+                        ' no other clue to the languages having the most' +\
+                        ' similar name or alternative name, if it is at' +\
+                        ' least THRESHOLD similar (trigram similarity,' +\
+                        ' from 0 to 1, e.g. {0})'.format(FUZZY_THRESHOLD))
+
+    parser.add_argument('--choose_best',
+                        metavar='SCORE', type=float, default=CHOOSE_BEST,
+                        help='update only the best candidate of an' +\
+                        ' ambiguous lang if its score (shared codes: 3,' +\
+                        ' countries, names: 1, a location nearby: 1) is' +\
+                        ' at least SCORE (defaults to {0})'.format(
+                            CHOOSE_BEST))
+
+    parser.add_argument('--choose_margin',
+                        metavar='SCORE', type=float, default=CHOOSE_MARGIN,
+                        help='and it leads the second best candidate by' +\
+                        ' at least SCORE (defaults to {0})'.format(
+                            CHOOSE_MARGIN))
+
+    parser.add_argument('--ambiguous',
+                        choices=['all', 'none'], default=AMBIGUOUS,
+                        help='candidates updated when the best one is not' +\
+                        ' chosen (defaults to {0})'.format(AMBIGUOUS))
+
+    parser.add_argument('--cluster',
+                        action='store_true',
+                        help='collect the records of all parsers and' +\
+                        ' cluster them by their sils, codes and names' +\
+                        ' before merging them, one cluster at a time, so' +\
+                        ' that the result does not depend on the order' +\
+                        ' of the parsers')
+
+    parser.add_argument('-i', '--incremental',
+                        action='store_true',
+                        help='skip the parsers whose input did not change' +\
+                        ' since the last (incremental) run on the same' +\
+                        ' database, keeping their earlier data')
+
+    parser.add_argument('-m', '--manifest',
+                        help="fingerprints of the parser inputs for" +\
+                        " incremental runs (defaults to 'run_manifest.json')",
+                        default='run_manifest.json')
+
+    parser.add_argument('--only',
+                        metavar='CLASSNAME', nargs='+',
+                        help='run only these parsers; the data of the' +\
+                        ' parsers they depend on has to be in the database')
+
+    parser.add_argument('--skip',
+                        metavar='CLASSNAME', nargs='+',
+                        help='do not run these parsers')
+
+    parser.add_argument('-d', '--dry_run',
+                        metavar='SNAPSHOT',
+                        help='merge the languages in memory instead of the' +\
+                        ' database, and write them with the match' +\
+                        ' statistics of the parsers to SNAPSHOT (json)')
+
+    parser.add_argument('--retract',
+                        metavar='CLASSNAME',
+                        help='remove the data of parser CLASSNAME from the' +\
+                        ' database and run only this parser again')
+
+    parser.add_argument('--resume',
+                        action='store_true',
+                        help='continue a crashed run on the same database' +\
+                        ' from its last checkpoint')
+
+    parser.add_argument('--checkpoint_every',
+                        type=int, default=CHECKPOINT_RECORDS,
+                        help='number of langs merged between two' +\
+                        ' checkpoints inside a parser (defaults to' +\
+                        ' {0})'.format(CHECKPOINT_RECORDS))
+
     return parser.parse_args()
 
 
@@ -309,11 +784,37 @@ def main():
                           args.log_dir,
                           args.pickle_dir,
                           args.res_dir,
-                          args.extended)
+                          args.extended,
+                          args.jobs,
+                          args.manifest if args.incremental else None,
+                          args.retract,
+                          args.resume,
+                          args.checkpoint_every,
+                          args.only,
+                          args.skip,
+                          args.dry_run,
+                          args.gzip_logs,
+                          args.staging_dir,
+                          args.online_jobs,
+                          args.shard_dir,
+                          args.report,
+                          args.progress_every,
+                          args.fuzzy,
+                          args.choose_best,
+                          args.choose_margin,
+                          args.ambiguous,
+                          args.cluster)
     pa.run()
+    if pa.dry_run:
+        pa.lang_db.write_snapshot(args.dry_run, pa.match_stats)
+        pa.report.write()
+        return
     # after collecting all information on different codes, integrate
     logging.info('Integrating codes')
+    start = pa.report.start()
     pa.lang_db.integrate_codes()
+    pa.report.add_step('integrate_codes', start)
+    pa.report.write()
 
 if __name__ == "__main__":
     main()